@@ -0,0 +1,64 @@
+import argparse
+from array import array
+
+from benchmarks.generator import generate_program
+from benchmarks.parse import best_of
+from rv32ias.disassembler import decode_word
+from rv32ias.disassembler import iter_disassembly
+from rv32ias.disassembler import load_image
+from rv32ias.disassembler import round_trip
+from rv32ias.formats import OUTPUT_FORMATS
+from rv32ias.isa import InstType
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.preprocessor import AsmParser
+
+
+def decode_scan(word: int):
+    # What a decoder without the index does: try every instruction in turn
+    opcode, funct3, funct7 = word & 0x7F, (word >> 12) & 0x7, word >> 25
+    for inst_def in rv32i_inst_dict.values():
+        if inst_def.opcode != opcode or inst_def.funct3 not in (None, funct3):
+            continue
+        if (inst_def.funct7 is not None and inst_def.inst_type in (InstType.R_, InstType.I_)
+                and inst_def.funct7 != funct7):
+            continue
+        return inst_def
+    return None
+
+
+def build_image(words: int, seed: int) -> array:
+    # A generated program tiled up to size, branch offsets stay valid as they are relative
+    program = AsmParser(generate_program(50000, seed)).machine_codes
+    image = array('I', program * (words // len(program) + 1))
+    del image[words:]
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Disassembly throughput in words per second')
+    parser.add_argument('--words', '-n', type=int, default=2000000, help='Image size in words')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    image = build_image(args.words, args.seed)
+    raw = OUTPUT_FORMATS['raw'].encode(image)
+    sample = image[:100000]
+
+    scan = best_of(args.repeat, lambda: [decode_scan(word) for word in sample])
+    indexed = best_of(args.repeat, lambda: [decode_word(word) for word in sample])
+    load = best_of(args.repeat, lambda: load_image(raw))
+    listing = best_of(args.repeat, lambda: sum(1 for _ in iter_disassembly(image)))
+
+    print(f'words:        {len(image)}')
+    print(f'decode scan:  {len(sample) / scan:12,.0f} words/s')
+    print(f'decode index: {len(sample) / indexed:12,.0f} words/s')
+    print(f'load raw:     {len(image) / load:12,.0f} words/s')
+    print(f'disassemble:  {len(image) / listing:12,.0f} words/s (text included)')
+
+    mismatches = round_trip(generate_program(20000, args.seed))
+    print(f'round trip:   {"ok" if not mismatches else f"{len(mismatches)} mismatching words"}')
+
+
+if __name__ == '__main__':
+    main()
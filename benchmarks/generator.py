@@ -0,0 +1,176 @@
+import argparse
+import random
+import sys
+from collections import deque
+from typing import Iterator, List, TextIO
+
+from rv32ias.isa import InstType
+from rv32ias.isa import reg_abi_names
+from rv32ias.isa import rv32i_inst_dict
+
+BLOCK = '''
+# block {i}
+    addi s1, zero, 0     # sum = 0
+    addi s2, zero, 10    # n = 10
+    addi t0, zero, 0     # counter = 0
+
+loop{i}:
+    slt  t1, t0,   s2    # comp_result = n < counter
+    beq  t1, zero, exit{i}
+    add  s1, s1,   t0    # sum += counter
+    lw   a0, -4(sp)
+    sw   a0, 8(sp)
+    addi t0, t0,   1     # counter++
+    jal  t2, loop{i}     # continue
+
+exit{i}:
+    lui  a1, 0x12345
+'''
+
+# Forward labels are placed within this many instructions, well inside the +-4 KiB branch range
+FORWARD_WINDOW = 256
+# Backward targets are drawn from this many recent labels, if still in branch range
+RECENT_LABELS = 16
+BACKWARD_WINDOW = 900
+
+COMMENTS = ('loop body', 'update counter', 'spill', 'reload', 'check bound', 'next element', 'tail call')
+
+
+def build_source(blocks: int) -> str:
+    # Fixed block repeated, for benchmarks that want the same shape at every size
+    return ''.join(BLOCK.format(i=i) for i in range(blocks))
+
+
+def __operand_layout(inst: str) -> List[str]:
+    # Operand order straight from the ISA argument pattern, so new instructions are covered as well
+    pattern = rv32i_inst_dict[inst].inst_arg_pattern
+    return sorted(pattern.groupindex, key=pattern.groupindex.get)
+
+
+def __immediate(rng: random.Random, inst: str) -> str:
+    inst_def = rv32i_inst_dict[inst]
+
+    if inst_def.inst_type == InstType.U_:
+        value = rng.randrange(0x100000)
+    elif inst_def.inst_type == InstType.I_ and inst_def.funct7 is not None:
+        value = rng.randrange(32)
+    else:
+        value = rng.randrange(-2048, 2048)
+
+    return hex(value) if value >= 0 and rng.random() < 0.25 else str(value)
+
+
+def iter_program(lines: int, seed: int = 0, label_density: float = 0.05, branch_density: float = 0.15,
+                 comment_density: float = 0.1) -> Iterator[str]:
+    # Yields one line at a time, so programs far larger than memory can be written out
+    rng = random.Random(seed)
+
+    insts = list(rv32i_inst_dict)
+    control = [inst for inst in insts if rv32i_inst_dict[inst].inst_type in (InstType.B_, InstType.J_)]
+    straight = [inst for inst in insts if inst not in control]
+    layouts = {inst: __operand_layout(inst) for inst in insts}
+
+    recent = deque(maxlen=RECENT_LABELS)
+    forward = deque()
+    next_label = 0
+    inst_count = 0
+    emitted = 0
+
+    def new_label() -> str:
+        nonlocal next_label
+        next_label += 1
+        return f'L{next_label}'
+
+    while emitted < lines:
+        # Forward references come due
+        if forward and forward[0][1] <= inst_count:
+            label, _ = forward.popleft()
+            recent.append((label, inst_count))
+            emitted += 1
+            yield f'{label}:'
+            continue
+
+        roll = rng.random()
+
+        if roll < label_density:
+            label = new_label()
+            recent.append((label, inst_count))
+            emitted += 1
+            yield f'{label}:'
+            continue
+
+        if roll < label_density + comment_density:
+            emitted += 1
+            yield f'# {rng.choice(COMMENTS)}' if rng.random() < 0.9 else ''
+            continue
+
+        inst = rng.choice(control) if rng.random() < branch_density else rng.choice(straight)
+
+        operands = {}
+        for field in layouts[inst]:
+            if field == 'imm':
+                operands[field] = __immediate(rng, inst)
+            elif field == 'label':
+                targets = [label for label, at in recent if inst_count - at < BACKWARD_WINDOW]
+                if targets and rng.random() < 0.5:
+                    operands[field] = rng.choice(targets)
+                else:
+                    label = new_label()
+                    forward.append((label, inst_count + rng.randint(1, FORWARD_WINDOW)))
+                    operands[field] = label
+            else:
+                operands[field] = rng.choice(reg_abi_names) if rng.random() < 0.7 else f'x{rng.randrange(32)}'
+
+        if r'\(' in rv32i_inst_dict[inst].inst_arg_re:
+            first = layouts[inst][0]
+            args = f'{operands[first]}, {operands["imm"]}({operands["rs1"]})'
+        else:
+            args = ', '.join(operands[field] for field in layouts[inst])
+
+        comment = f'  # {rng.choice(COMMENTS)}' if rng.random() < comment_density else ''
+
+        inst_count += 1
+        emitted += 1
+        yield f'    {inst:<5} {args}{comment}'
+
+    # Every referenced label gets defined
+    for label, _ in forward:
+        yield f'{label}:'
+
+
+def generate_program(lines: int, seed: int = 0, **density) -> str:
+    return '\n'.join(iter_program(lines, seed, **density)) + '\n'
+
+
+def write_program(out: TextIO, lines: int, seed: int = 0, **density) -> None:
+    chunk = []
+    for line in iter_program(lines, seed, **density):
+        chunk.append(line)
+        if len(chunk) >= 65536:
+            out.write('\n'.join(chunk) + '\n')
+            chunk.clear()
+
+    out.write('\n'.join(chunk) + '\n' if chunk else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a seeded random RV32I program')
+    parser.add_argument('--lines', '-n', type=int, default=100000, help='Number of source lines')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--labels', type=float, default=0.05, help='Share of lines that are labels')
+    parser.add_argument('--branches', type=float, default=0.15, help='Share of instructions that branch or jump')
+    parser.add_argument('--comments', type=float, default=0.1, help='Share of lines with a comment')
+    parser.add_argument('--output', '-o', type=str, help='Write to this file instead of stdout')
+    args = parser.parse_args()
+
+    density = dict(label_density=args.labels, branch_density=args.branches, comment_density=args.comments)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            write_program(f, args.lines, args.seed, **density)
+    else:
+        write_program(sys.stdout, args.lines, args.seed, **density)
+
+
+if __name__ == '__main__':
+    main()
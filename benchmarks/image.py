@@ -0,0 +1,59 @@
+import argparse
+import os
+import random
+import tempfile
+
+from benchmarks.parse import best_of
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+
+def build_image_source(blob: str, tables: int, words: int, seed: int) -> str:
+    # A little code walking the data, one large binary blob and many .word tables, some pointing at each other
+    rng = random.Random(seed)
+    lines = ['start:', '    la    a0, blob', '    la    a1, T0', '    lw    a2, 0(a1)', '    j     start', '.rodata',
+             'blob:', f'    .incbin "{blob}"', '.data']
+
+    for t in range(tables):
+        lines.append(f'T{t}:')
+        for _ in range(0, words, 8):
+            values = [str(rng.randint(-2 ** 31, 2 ** 32 - 1)) for _ in range(7)] + [f'T{rng.randrange(tables)}']
+            lines.append(f'    .word {", ".join(values)}')
+        lines.append('    .align 4')
+
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory image build throughput with large .incbin and .word data')
+    parser.add_argument('--blob-mb', '-m', type=int, default=16, help='Size of the included binary, in MiB')
+    parser.add_argument('--tables', '-t', type=int, default=200, help='Number of .word tables')
+    parser.add_argument('--words', '-w', type=int, default=512, help='Words per table')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blob = os.path.join(tmp, 'blob.bin')
+        with open(blob, 'wb') as f:
+            f.write(random.Random(args.seed).randbytes(args.blob_mb << 20))
+
+        source = build_image_source('blob.bin', args.tables, args.words, args.seed)
+
+        best = {}
+        for _ in range(args.repeat):
+            stats = AsmStats()
+            total = best_of(1, lambda: AsmParser(source, stats=stats, base_dir=tmp).machine_codes)
+            for name, seconds in [('total', total), *stats.timings.items()]:
+                best[name] = min(best.get(name, float('inf')), seconds)
+
+        image = AsmParser(source, base_dir=tmp).image
+        mb = len(image.data) / (1 << 20)
+
+        print(f'image:     {mb:10.2f} MiB')
+        for name in ('layout', 'encode', 'image', 'total'):
+            print(f'{name:<9}  {best[name] * 1000:10.3f} ms  {mb / best[name]:10,.0f} MiB/s')
+
+
+if __name__ == '__main__':
+    main()
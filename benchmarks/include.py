@@ -0,0 +1,69 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from rv32ias.expand import include_cache
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+
+def build_header(macros: int, rng: random.Random) -> str:
+    # Macros of a few lines each, some with defaults and local labels
+    lines = []
+    for m in range(macros):
+        lines += [f'.macro m{m} a, b=t1', f'    addi  \\a, \\a, {rng.randint(-2048, 2047)}', 'L\\@:',
+                  '    add   \\a, \\a, \\b', '    bne   \\a, zero, L\\@', '.endm']
+    return '\n'.join(lines) + '\n'
+
+
+def build_source(macros: int, uses: int, rng: random.Random) -> str:
+    lines = ['.include "defs.s"', 'start:']
+    for _ in range(uses):
+        if rng.random() < 0.5:
+            lines.append(f'    m{rng.randrange(macros)} t0')
+        else:
+            lines.append(f'    m{rng.randrange(macros)} t2, t3')
+        lines.append(f'    xori  t4, t4, {rng.randint(-2048, 2047)}')
+    lines.append('    jal   zero, start')
+    return '\n'.join(lines) + '\n'
+
+
+def preprocess_all(sources, base_dir):
+    stats = AsmStats()
+    start = time.perf_counter()
+    lines = 0
+    for source in sources:
+        lines += len(AsmParser(source, stats=stats, base_dir=base_dir).program.line_types)
+    return time.perf_counter() - start, stats.timings.get('preprocess', 0.0), lines, stats.counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Include and macro preprocessing of many sources sharing a header')
+    parser.add_argument('--sources', '-n', type=int, default=200, help='Number of sources')
+    parser.add_argument('--macros', '-m', type=int, default=2000, help='Macros in the shared header')
+    parser.add_argument('--uses', '-u', type=int, default=500, help='Macro uses per source')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'defs.s'), 'w') as f:
+            f.write(build_header(args.macros, rng))
+
+        sources = [build_source(args.macros, args.uses, rng) for _ in range(args.sources)]
+
+        print(f"{'run':<10} {'total s':>9} {'preprocess s':>13} {'lines/s':>12} {'hits':>6} {'misses':>7}")
+        # The first source reads the header, the rest find it in the cache; the second run only hits
+        for name in ('cold', 'cached'):
+            if name == 'cold':
+                include_cache.clear()
+            total, preprocess, lines, counters = preprocess_all(sources, tmp)
+            hits, misses = counters.get('include.hits', 0), counters.get('include.misses', 0)
+            print(f'{name:<10} {total:9.3f} {preprocess:13.3f} {lines / preprocess:12,.0f} {hits:>6} {misses:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from rv32ias.linker import build_units
+from rv32ias.linker import link
+
+
+def build_unit_source(u: int, units: int, functions: int, rng: random.Random) -> str:
+    # Exported functions with local loops, calling functions of other units and loading their data
+    lines = [f'.globl {", ".join(f"f{u}_{k}" for k in range(functions))}, d{u}']
+
+    for k in range(functions):
+        lines.append(f'f{u}_{k}:')
+        for b in range(rng.randint(4, 12)):
+            lines.append(f'L{k}_{b}:')
+            lines.extend(f'    addi  t0, t0, {rng.randint(-2048, 2047)}' for _ in range(rng.randint(2, 8)))
+            roll = rng.random()
+            if roll < 0.3:
+                lines.append(f'    call  f{rng.randrange(units)}_{rng.randrange(functions)}')
+            elif roll < 0.4:
+                lines.append(f'    la    a0, d{rng.randrange(units)}')
+            elif b:
+                lines.append(f'    bne   t0, t1, L{k}_{rng.randrange(b)}')
+        lines.append('    ret')
+
+    lines += ['.data', f'd{u}:', '    .word ' + ', '.join(f'f{u}_{k}' for k in range(functions))]
+    return '\n'.join(lines) + '\n'
+
+
+def timed_build(asm_files, obj_dir, jobs):
+    start = time.perf_counter()
+    results = build_units(asm_files, obj_dir, jobs)
+    built = time.perf_counter() - start
+
+    if any(result.error for result in results):
+        raise RuntimeError(next(result.error for result in results if result.error))
+
+    start = time.perf_counter()
+    linked = link([result.unit for result in results])
+    return built, time.perf_counter() - start, sum(result.rebuilt for result in results), len(linked.words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Separate assembly, incremental rebuilds and link time')
+    parser.add_argument('--units', '-n', type=int, default=64, help='Number of units')
+    parser.add_argument('--functions', type=int, default=40, help='Exported functions per unit')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Units assembled in parallel')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asm_files = []
+        for u in range(args.units):
+            path = os.path.join(tmp, f'unit{u}.s')
+            with open(path, 'w') as f:
+                f.write(build_unit_source(u, args.units, args.functions, rng))
+            asm_files.append(path)
+
+        obj_dir = os.path.join(tmp, 'obj')
+
+        print(f"{'build':<22} {'assemble s':>10} {'link s':>8} {'rebuilt':>8} {'words':>9}")
+        runs = [('full, 1 job', None, 1), (f'full, {args.jobs} jobs', obj_dir, args.jobs), ('unchanged', obj_dir, 1)]
+        for name, objects, jobs in runs:
+            built, linked, rebuilt, words = timed_build(asm_files, objects, jobs)
+            print(f'{name:<22} {built:10.3f} {linked:8.3f} {rebuilt:>8} {words:>9}')
+
+        # One unit edited: only it is assembled again before relinking
+        with open(asm_files[0], 'a') as f:
+            f.write('.text\n    addi  t1, t1, 1\n')
+        built, linked, rebuilt, words = timed_build(asm_files, obj_dir, 1)
+        print(f"{'one unit changed':<22} {built:10.3f} {linked:8.3f} {rebuilt:>8} {words:>9}")
+
+
+if __name__ == '__main__':
+    main()
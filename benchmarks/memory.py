@@ -0,0 +1,39 @@
+import argparse
+import tracemalloc
+
+from benchmarks.generator import build_source
+from rv32ias.preprocessor import AsmParser
+
+
+def traced(fn):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory held per source line by the parsed program')
+    parser.add_argument('--blocks', '-n', type=int, default=20000, help='Number of code blocks to generate')
+    args = parser.parse_args()
+
+    source = build_source(args.blocks)
+    lines = source.count('\n') + 1
+
+    asm_parser, columnar = traced(lambda: AsmParser(source))
+
+    # The per-line object form: one AsmLine for every line and one Instruction for every instruction
+    _, objects = traced(lambda: (list(asm_parser.asm), list(asm_parser.instructions)))
+
+    print(f'lines:         {lines}')
+    print(f'source text:   {len(source) / lines:8.1f} B/line')
+    print(f'columnar:      {columnar / lines:8.1f} B/line (source included)')
+    print(f'line objects:  {objects / lines:8.1f} B/line (on top of the source)')
+    print(f'ratio:         {objects / columnar:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
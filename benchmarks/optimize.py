@@ -0,0 +1,71 @@
+import argparse
+import random
+
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+REGS = ('t0', 't1', 't2', 't3', 'a0', 'a1', 'a2', 'a3', 's1', 's2')
+
+
+def build_optimize_source(blocks: int, block_size: int, seed: int) -> str:
+    # Code as naive generators emit it: moves back and forth, no-op arithmetic, repeated instructions and
+    # blocks left behind unconditional jumps
+    rng = random.Random(seed)
+    lines = []
+
+    for b in range(blocks):
+        lines.append(f'B{b}:')
+        for _ in range(rng.randint(block_size // 2, block_size)):
+            rd, rs = rng.choice(REGS), rng.choice(REGS)
+            roll = rng.random()
+            if roll < 0.05:
+                lines.append(f'    mv    {rd}, {rs}')
+                lines.append(f'    mv    {rs}, {rd}')
+            elif roll < 0.1:
+                lines.append(f'    addi  {rd}, {rd}, 0')
+            elif roll < 0.15:
+                lines.append(f'    add   {rd}, {rd}, zero')
+            elif roll < 0.2:
+                lines.append(f'    slli  {rd}, {rs}, 2' if rd != rs else '    nop')
+                lines.append(f'    slli  {rd}, {rs}, 2' if rd != rs else '    nop')
+            elif roll < 0.3:
+                lines.append(f'    lw    {rd}, {4 * rng.randrange(64)}(sp)')
+            else:
+                lines.append(f'    addi  {rd}, {rs}, {rng.randint(-2048, 2047)}')
+        if rng.random() < 0.1:
+            # Nothing branches to the block after this one
+            lines.append(f'    j     B{b + 2}')
+        else:
+            lines.append(f'    bne   t0, t1, B{max(0, b - rng.randrange(8))}')
+
+    lines += [f'B{blocks}:', f'B{blocks + 1}:', '    ret']
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Optimize time and bytes saved against program size')
+    parser.add_argument('--blocks', '-n', type=int, nargs='+', default=[10000, 50000, 100000],
+                        help='Program sizes to try, in basic blocks')
+    parser.add_argument('--block-size', '-b', type=int, default=16, help='Most instructions per block')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    print(f"{'blocks':>8} {'insts':>9} {'removed':>8} {'dead':>7} {'saved KiB':>10} {'optimize s':>11} {'us/inst':>8}")
+    for blocks in args.blocks:
+        source = build_optimize_source(blocks, args.block_size, args.seed)
+
+        best = float('inf')
+        for _ in range(args.repeat):
+            stats = AsmStats()
+            asm_parser = AsmParser(source, stats=stats)
+            report = asm_parser.optimize()
+            best = min(best, stats.timings['optimize'])
+
+        insts = report.instructions
+        print(f'{blocks:>8} {insts:>9} {report.removed:>8} {report.dead:>7} {report.saved / 1024:10.1f}'
+              f' {best:11.3f} {best / insts * 1e6:8.2f}')
+
+
+if __name__ == '__main__':
+    main()
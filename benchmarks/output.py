@@ -0,0 +1,45 @@
+import argparse
+import os
+import tempfile
+
+from benchmarks.parse import best_of
+from benchmarks.generator import build_source
+from rv32ias.formats import OUTPUT_FORMATS
+from rv32ias.preprocessor import AsmParser
+
+
+def write_per_line(path: str, machine_codes) -> None:
+    # What the output used to do: one f-string and one write per word
+    with open(path, 'w') as f:
+        for machine_code in machine_codes:
+            f.write(f'{machine_code:08X}\n')
+
+
+def write_bulk(path: str, machine_codes, fmt: str) -> None:
+    with open(path, 'wb') as f:
+        f.write(OUTPUT_FORMATS[fmt].encode(machine_codes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Output write throughput per format')
+    parser.add_argument('--blocks', '-n', type=int, default=20000, help='Number of code blocks to generate')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    machine_codes = AsmParser(build_source(args.blocks)).machine_codes
+    words = len(machine_codes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'out')
+
+        per_line = best_of(args.repeat, lambda: write_per_line(path, machine_codes))
+        print(f'words:     {words}')
+        print(f'{"per line":<9}  {words / per_line:12,.0f} words/s  {os.path.getsize(path):10} bytes')
+
+        for fmt in OUTPUT_FORMATS:
+            elapsed = best_of(args.repeat, lambda: write_bulk(path, machine_codes, fmt))
+            print(f'{fmt:<9}  {words / elapsed:12,.0f} words/s  {os.path.getsize(path):10} bytes')
+
+
+if __name__ == '__main__':
+    main()
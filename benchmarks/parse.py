@@ -0,0 +1,36 @@
+import argparse
+import time
+
+from benchmarks.generator import build_source
+from rv32ias.lexer import tokenize
+from rv32ias.preprocessor import AsmParser
+
+
+def best_of(repeat: int, fn) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse throughput in source lines per second')
+    parser.add_argument('--blocks', '-n', type=int, default=20000, help='Number of code blocks to generate')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    source = build_source(args.blocks)
+    lines = source.count('\n') + 1
+
+    lex_time = best_of(args.repeat, lambda: sum(1 for _ in tokenize(source)))
+    parse_time = best_of(args.repeat, lambda: AsmParser(source))
+
+    print(f'lines:   {lines}')
+    print(f'lexer:   {lines / lex_time:12,.0f} lines/s')
+    print(f'parser:  {lines / parse_time:12,.0f} lines/s (lexing included)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import random
+
+from benchmarks.parse import best_of
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+# Far branches land this many labels away at most, past the +-4 KiB of a branch but inside the +-1 MiB of a jal
+FAR_LABELS = 4000
+
+
+def build_relax_source(labels: int, seed: int, far: float = 0.05) -> str:
+    # Short blocks behind every label, with near and far branches, calls across the whole program and pseudos
+    rng = random.Random(seed)
+    lines = []
+
+    for k in range(labels):
+        lines.append(f'L{k}:')
+        for _ in range(rng.randint(1, 6)):
+            roll = rng.random()
+            if roll < far:
+                target = min(labels - 1, max(0, k + rng.randint(-FAR_LABELS, FAR_LABELS)))
+                lines.append(f'    bne   a0, a1, L{target}')
+            elif roll < 0.25:
+                target = min(labels - 1, max(0, k + rng.randint(-8, 8)))
+                lines.append(f'    beq   t0, t1, L{target}')
+            elif roll < 0.28:
+                lines.append(f'    call  L{rng.randrange(labels)}')
+            elif roll < 0.32:
+                lines.append(f'    li    a2, {rng.randint(-2 ** 31, 2 ** 31 - 1)}')
+            elif roll < 0.34:
+                lines.append(f'    la    a3, L{rng.randrange(labels)}')
+            else:
+                lines.append(f'    addi  t0, t0, {rng.randint(-2048, 2047)}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Branch relaxation time against program size')
+    parser.add_argument('--labels', '-n', type=int, nargs='+', default=[50000, 100000, 200000, 400000],
+                        help='Program sizes to try, in labels')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    print(f"{'labels':>8} {'lines':>9} {'grown':>7} {'parse s':>8} {'relax s':>8} {'relax us/label':>15}")
+    for labels in args.labels:
+        source = build_relax_source(labels, args.seed)
+
+        best_parse, best_relax = float('inf'), float('inf')
+        for _ in range(args.repeat):
+            stats = AsmStats()
+            total = best_of(1, lambda: AsmParser(source, stats=stats))
+            best_parse, best_relax = min(best_parse, total), min(best_relax, stats.timings['relax'])
+
+        program = AsmParser(source).program
+        grown = sum(1 for size in program.im_sizes if size > 4)
+
+        print(f'{labels:>8} {len(program.line_starts):>9} {grown:>7} {best_parse:8.3f} {best_relax:8.3f}'
+              f' {best_relax / labels * 1e6:15.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from benchmarks.generator import generate_program
+from rv32ias.__main__ import standard_output
+from rv32ias.listing import write_listing
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+class TracedStats(AsmStats):
+    # Also records the traced memory peak of every stage
+    def __init__(self):
+        super().__init__()
+        self.peaks: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        tracemalloc.reset_peak()
+        with super().stage(name):
+            yield
+        self.peaks[name] = tracemalloc.get_traced_memory()[1]
+
+
+def run_pipeline(source: str, stats: AsmStats) -> None:
+    asm_parser = AsmParser(source, stats=stats)
+    standard_output(asm_parser.machine_codes, 'hex', os.devnull, stats)
+
+    with open(os.devnull, 'w') as devnull, stats.stage('listing'):
+        write_listing(asm_parser, devnull, 'full')
+
+
+def measure_time(source: str, repeat: int) -> Dict[str, float]:
+    best: Dict[str, float] = {}
+
+    for _ in range(repeat):
+        stats = AsmStats()
+        run_pipeline(source, stats)
+
+        for name, seconds in stats.timings.items():
+            best[name] = min(best.get(name, float('inf')), seconds)
+
+    return best
+
+
+def measure_memory(source: str) -> Dict[str, int]:
+    stats = TracedStats()
+
+    tracemalloc.start()
+    try:
+        run_pipeline(source, stats)
+    finally:
+        tracemalloc.stop()
+
+    return stats.peaks
+
+
+def run(lines: int, seed: int, repeat: int, memory: bool) -> dict:
+    source = generate_program(lines, seed)
+    lines = source.count('\n')
+
+    times = measure_time(source, repeat)
+    peaks = measure_memory(source) if memory else {}
+
+    stages = {}
+    for name, seconds in times.items():
+        stages[name] = {'seconds': seconds, 'lines_per_sec': lines / seconds}
+        if name in peaks:
+            stages[name]['peak_bytes'] = peaks[name]
+            stages[name]['peak_bytes_per_line'] = peaks[name] / lines
+
+    return {
+        'lines': lines,
+        'seed': seed,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'stages': stages,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float, memory_tolerance: float, out=sys.stdout) -> int:
+    regressions = 0
+
+    print(f"{'stage':<12} {'lines/s':>14} {'baseline':>14} {'change':>8}  {'B/line':>8} {'baseline':>8}", file=out)
+
+    for name, stage in result['stages'].items():
+        if (base := baseline['stages'].get(name)) is None:
+            print(f'{name:<12} {stage["lines_per_sec"]:14,.0f} {"-":>14}', file=out)
+            continue
+
+        change = stage['lines_per_sec'] / base['lines_per_sec'] - 1
+        flags = []
+
+        if change < -tolerance:
+            flags.append('SLOWER')
+
+        mem, base_mem = stage.get('peak_bytes_per_line'), base.get('peak_bytes_per_line')
+        if mem is not None and base_mem and mem > base_mem * (1 + memory_tolerance):
+            flags.append('MORE MEMORY')
+
+        regressions += bool(flags)
+        print(
+            f'{name:<12} {stage["lines_per_sec"]:14,.0f} {base["lines_per_sec"]:14,.0f} {change:+8.1%}'
+            f'  {mem or 0:8.1f} {base_mem or 0:8.1f}  {" ".join(flags)}', file=out
+        )
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Time every assembler stage on a generated program')
+    parser.add_argument('--lines', '-n', type=int, default=100000, help='Source lines to generate')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the (slow) traced memory run')
+    parser.add_argument('--json', type=str, help="Write the results as JSON to this file ('-' for stdout)")
+    parser.add_argument('--baseline', type=str, default=BASELINE, help='Baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed throughput loss (fraction)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.10, help='Allowed peak memory growth (fraction)')
+    args = parser.parse_args()
+
+    result = run(args.lines, args.seed, args.repeat, not args.no_memory)
+
+    # With JSON on stdout the human readable report moves to stderr
+    out = sys.stderr if args.json == '-' else sys.stdout
+
+    if args.json == '-':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+        print(f'Baseline saved to {args.baseline}', file=out)
+        return 0
+
+    baseline: Optional[dict] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if baseline is None:
+        for name, stage in result['stages'].items():
+            print(f'{name:<12} {stage["lines_per_sec"]:14,.0f} lines/s', file=out)
+        return 0
+
+    if baseline['lines'] != result['lines']:
+        print(f"Note: baseline ran on {baseline['lines']} lines, this run on {result['lines']}", file=out)
+
+    regressions = compare(result, baseline, args.tolerance, args.memory_tolerance, out)
+    if regressions:
+        print(f'{regressions} stage(s) regressed', file=out)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    exit(main())
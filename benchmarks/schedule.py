@@ -0,0 +1,58 @@
+import argparse
+import random
+
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+REGS = ('t0', 't1', 't2', 't3', 'a0', 'a1', 'a2', 'a3', 's1', 's2')
+
+
+def build_schedule_source(blocks: int, block_size: int, seed: int) -> str:
+    # Loop bodies that load values and use them right away, the shape compilers emit without a scheduler
+    rng = random.Random(seed)
+    lines = []
+
+    for b in range(blocks):
+        lines.append(f'B{b}:')
+        for _ in range(rng.randint(block_size // 2, block_size)):
+            rd, rs = rng.choice(REGS), rng.choice(REGS)
+            roll = rng.random()
+            if roll < 0.3:
+                lines.append(f'    lw    {rd}, {4 * rng.randrange(64)}(sp)')
+                lines.append(f'    add   {rng.choice(REGS)}, {rd}, {rs}')
+            elif roll < 0.4:
+                lines.append(f'    sw    {rs}, {4 * rng.randrange(64)}(sp)')
+            else:
+                lines.append(f'    addi  {rd}, {rs}, {rng.randint(-2048, 2047)}')
+        lines.append(f'    bne   t0, t1, B{max(0, b - rng.randrange(8))}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scheduling time and load-use stalls removed against program size')
+    parser.add_argument('--blocks', '-n', type=int, nargs='+', default=[10000, 50000, 100000],
+                        help='Program sizes to try, in basic blocks')
+    parser.add_argument('--block-size', '-b', type=int, default=16, help='Most instructions per block')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    print(f"{'blocks':>8} {'insts':>9} {'stalls':>8} {'after':>7} {'moved':>8} {'schedule s':>11} {'us/inst':>8}")
+    for blocks in args.blocks:
+        source = build_schedule_source(blocks, args.block_size, args.seed)
+
+        best = float('inf')
+        for _ in range(args.repeat):
+            stats = AsmStats()
+            asm_parser = AsmParser(source, stats=stats)
+            report = asm_parser.schedule()
+            best = min(best, stats.timings['schedule'])
+
+        insts = len(asm_parser.program.inst_lines)
+        print(f'{blocks:>8} {insts:>9} {report.stalls_before:>8} {report.stalls_after:>7} {report.moved:>8}'
+              f' {best:11.3f} {best / insts * 1e6:8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.generator import build_source
+from rv32ias.client import AsmClient
+
+
+def wait_for_socket(path: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Server did not come up on {path}')
+        time.sleep(0.01)
+
+
+def run_clients(socket_path: str, framing: str, clients: int, requests: int, source: str) -> float:
+    def worker():
+        with AsmClient(socket_path, framing) as client:
+            for _ in range(requests // clients):
+                if not client.assemble(source)['ok']:
+                    raise RuntimeError('Benchmark source failed to assemble')
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server mode throughput in requests per second')
+    parser.add_argument('--blocks', '-n', type=int, default=2, help='Code blocks per request')
+    parser.add_argument('--requests', '-r', type=int, default=4000, help='Requests sent per run')
+    parser.add_argument('--clients', '-c', type=int, default=4, help='Concurrent socket clients')
+    parser.add_argument('--spawns', type=int, default=20, help='One-shot CLI runs to compare against')
+    args = parser.parse_args()
+
+    source = build_source(args.blocks)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asm_file = os.path.join(tmp, 'request.asm')
+        with open(asm_file, 'w') as f:
+            f.write(source)
+
+        start = time.perf_counter()
+        for _ in range(args.spawns):
+            subprocess.run([sys.executable, '-m', 'rv32ias', asm_file], stdout=subprocess.DEVNULL, check=True)
+        print(f'{"one-shot cli":<28} {args.spawns / (time.perf_counter() - start):10,.0f} req/s')
+
+        with AsmClient() as client:
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.assemble(source)
+            print(f'{"stdin, 1 client":<28} {args.requests / (time.perf_counter() - start):10,.0f} req/s')
+
+        for framing in ('lines', 'length'):
+            socket_path = os.path.join(tmp, f'{framing}.sock')
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'rv32ias', '--serve', '--socket', socket_path, '--framing', framing],
+                stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_for_socket(socket_path)
+                elapsed = run_clients(socket_path, framing, args.clients, args.requests, source)
+                label = f'socket {framing}, {args.clients} clients'
+                print(f'{label:<28} {args.requests // args.clients * args.clients / elapsed:10,.0f} req/s')
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import time
+
+from benchmarks.disassemble import build_image
+from benchmarks.parse import best_of
+from rv32ias.pipeline import assemble
+from rv32ias.simulator import HaltReason
+from rv32ias.simulator import Simulator
+from rv32ias.simulator import predecode
+
+# Read, modify and write a 64 word buffer, over and over: loads, stores, ALU and taken branches
+KERNEL = '''
+    lui   s0, 0x1             # buffer at 0x1000
+    lui   s2, {outer_hi}
+    addi  s2, s2, {outer_lo}  # outer iterations
+    addi  s1, zero, 0
+outer:
+    addi  t0, zero, 0
+    addi  t1, zero, 64
+inner:
+    slli  t2, t0, 2
+    add   t3, s0, t2
+    lw    t4, 0(t3)
+    add   t4, t4, t0
+    xori  t5, t4, 0x55
+    sw    t5, 0(t3)
+    addi  t0, t0, 1
+    blt   t0, t1, inner
+    addi  s1, s1, 1
+    blt   s1, s2, outer
+exit:
+    jal   zero, exit
+'''
+
+STEPS_PER_OUTER = 64 * 8 + 4
+
+
+def build_kernel(steps: int) -> str:
+    outer = max(1, steps // STEPS_PER_OUTER)
+    hi, lo = outer >> 12, outer & 0xFFF
+    # addi sign extends its immediate
+    if lo >= 0x800:
+        hi, lo = hi + 1, lo - 0x1000
+    return KERNEL.format(outer_hi=hex(hi), outer_lo=lo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulator dispatch speed in million instructions per second')
+    parser.add_argument('--steps', '-n', type=int, default=2000000, help='Approximate instructions to run')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Best of this many runs')
+    args = parser.parse_args()
+
+    words = assemble(build_kernel(args.steps))
+
+    best, steps = float('inf'), 0
+    for _ in range(args.repeat):
+        simulator = Simulator(words)
+        start = time.perf_counter()
+        if simulator.run() != HaltReason.SELF_LOOP:
+            raise RuntimeError('Benchmark kernel did not reach its exit loop')
+        best, steps = min(best, time.perf_counter() - start), simulator.steps
+
+    simulator = Simulator(words)
+    stepped = min(steps, 200000)
+    start = time.perf_counter()
+    for _ in range(stepped):
+        simulator.step()
+    single = time.perf_counter() - start
+
+    image = build_image(1000000, 0)
+    decode = best_of(args.repeat, lambda: predecode(image))
+
+    print(f'steps:      {steps}')
+    print(f'run:        {steps / best / 1e6:8.2f} MIPS')
+    print(f'step:       {stepped / single / 1e6:8.2f} MIPS (one call per instruction)')
+    print(f'predecode:  {len(image) / decode:12,.0f} words/s')
+
+
+if __name__ == '__main__':
+    main()
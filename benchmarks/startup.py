@@ -0,0 +1,44 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SNIPPET = 'main:\n    addi t0, zero, 1\n    beq  t0, zero, main\n'
+
+
+def best_wall_time(cmd, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    # Only reports, tests/test_startup.py fails on a far more generous import budget and checks the modules a
+    # small run imports
+    parser = argparse.ArgumentParser(description='CLI startup time on a tiny snippet against a bare interpreter')
+    parser.add_argument('--repeat', '-r', type=int, default=20, help='Best of this many runs')
+    parser.add_argument('--budget', type=float, default=60.0, help='Expected ms on top of a bare interpreter start')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asm_file = os.path.join(tmp, 'snippet.asm')
+        with open(asm_file, 'w') as f:
+            f.write(SNIPPET)
+
+        bare = best_wall_time([sys.executable, '-c', 'pass'], args.repeat)
+        cli = best_wall_time([sys.executable, '-m', 'rv32ias', asm_file], args.repeat)
+
+    overhead = (cli - bare) * 1000
+
+    print(f'interpreter:  {bare * 1000:8.1f} ms')
+    print(f'rv32ias:      {cli * 1000:8.1f} ms')
+    print(f'overhead:     {overhead:8.1f} ms (budget {args.budget:.1f} ms{", over" if overhead > args.budget else ""})')
+
+
+if __name__ == '__main__':
+    main()
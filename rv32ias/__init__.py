@@ -1,3 +1,10 @@
-from rv32ias.pipeline import assemble
-
 __version__ = "0.4.0"
+
+
+def __getattr__(name: str):
+    # Loaded on first use, so `import rv32ias.x` and the CLI only pay for what they need
+    if name == 'assemble':
+        from rv32ias.pipeline import assemble
+        return assemble
+
+    raise AttributeError(f"module 'rv32ias' has no attribute {name!r}")
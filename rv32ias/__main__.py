@@ -1,22 +1,127 @@
 import argparse
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Iterable, List, Optional, TextIO
 
-from rv32ias.assembler import assemble_instructions
 from rv32ias.exceptions import AsmParseError
-from rv32ias.preprocessor import AsmParser
+from rv32ias.formats import OUTPUT_FORMATS
+from rv32ias.pipeline import assemble
+from rv32ias.pipeline import load_asm
+from rv32ias.stats import AsmStats
+from rv32ias.stats import timed
+
+# The parser, listing, stream and batch modules are imported by the modes that use them,
+# startup only pays for argument parsing and the module chain of the selected mode
+if TYPE_CHECKING:
+    from rv32ias.preprocessor import AsmParser
+
+# Listings can run to many megabytes, write them in large blocks
+LISTING_BUFFER = 1024 * 1024
 
 
 def main():
     parser = argparse.ArgumentParser(description='RISC-V RV32I Assembler')
-    parser.add_argument('asm_file', type=str, help='Assembly file to be assembled')
+    parser.add_argument('asm_file', type=str, nargs='*', help='Assembly file(s) or glob(s) to be assembled')
     parser.add_argument('--verbose', '-v', action='store_true', help='Print verbose output')
     parser.add_argument('--pretty', '-p', type=str, help='Pretty print verbose output')
     parser.add_argument('--binary', '-b', action='store_true', help='Output binary instead of hex')
     parser.add_argument('--output', '-o', type=str, help='Save output to a file')
+    parser.add_argument('--format', '-f', type=str, choices=list(OUTPUT_FORMATS), help='Output format (default hex)')
+    parser.add_argument('--stream', '-s', action='store_true', help='Assemble line by line without loading the file')
+    parser.add_argument('--cache-dir', type=str, help='Reuse assembled output cached in this directory')
+    parser.add_argument('--output-dir', '-d', type=str, help='Save the output of every input file to this directory')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Files assembled in parallel (0 for all cores)')
+    parser.add_argument('--all-errors', '-e', action='store_true', help='Report every error instead of the first one')
+    parser.add_argument('--max-errors', type=int, help='Stop reporting errors after this many (implies --all-errors)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep running and assemble requests from stdin or --socket')
+    parser.add_argument('--socket', type=str, help='Unix socket to serve on (with --serve)')
+    parser.add_argument('--framing', type=str, choices=['lines', 'length'], default='lines',
+                        help='Server message framing: JSON lines or length prefixed JSON (with --serve)')
+    parser.add_argument('--stats', type=str, nargs='?', const='human', choices=['human', 'json'],
+                        help='Print stage timings and counters to stderr (human or json)')
+    parser.add_argument('--disassemble', '-D', action='store_true',
+                        help='Disassemble an image (hex, binary, readmemh, readmemb, elf or raw) back to assembly')
+    parser.add_argument('--round-trip', action='store_true',
+                        help='Check that the source assembles to the same words after disassembling it')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Run the program until it loops on itself or reaches --max-steps, then print registers')
+    parser.add_argument('--max-steps', type=int, default=100000000, help='Instruction limit for --simulate')
+    parser.add_argument('--link', '-l', action='store_true',
+                        help='Assemble every file as a separate unit and link them into one image')
+    parser.add_argument('--obj-dir', type=str,
+                        help='Keep unit objects here and only assemble changed units again (with --link)')
+    parser.add_argument('--optimize', '-O', action='store_true',
+                        help='Drop instructions that do nothing or are never reached and report the bytes saved')
+    parser.add_argument('--schedule', action='store_true',
+                        help='Reorder instructions to fill load-use stall slots and report the stalls removed')
 
     args = parser.parse_args()
 
-    if args.verbose and (args.binary or args.output):
-        print("Error: --verbose cannot be used with --binary or --output")
+    if args.serve:
+        if (args.asm_file or args.verbose or args.stream or args.output or args.output_dir or args.format or args.binary
+                or args.stats):
+            print("Error: --serve takes no input files, output options or --stats")
+            return 1
+
+        if (args.optimize or args.schedule or args.link or args.obj_dir or args.disassemble or args.round_trip
+                or args.simulate or args.all_errors or args.max_errors is not None or args.jobs != 1):
+            print("Error: --serve cannot be used with --optimize, --schedule, --link, --disassemble, --round-trip,"
+                  " --simulate, error options or --jobs")
+            return 1
+
+        return serve_output(args.socket, args.framing, args.cache_dir)
+
+    if args.socket:
+        print("Error: --socket can only be used with --serve")
+        return 1
+
+    if not args.asm_file:
+        parser.error('the following arguments are required: asm_file')
+
+    if args.obj_dir and not args.link:
+        print("Error: --obj-dir can only be used with --link")
+        return 1
+
+    if args.link and (args.verbose or args.stream or args.output_dir or args.cache_dir or args.disassemble
+                      or args.round_trip or args.all_errors or args.max_errors):
+        print("Error: --link cannot be used with --verbose, --stream, --output-dir, --cache-dir, --disassemble,"
+              " --round-trip or error options")
+        return 1
+
+    if (args.disassemble or args.round_trip) and (args.verbose or args.binary or args.format or args.stream
+                                                  or args.cache_dir or args.all_errors or args.max_errors):
+        print("Error: --disassemble and --round-trip cannot be used with output, stream, cache or error options")
+        return 1
+
+    if (args.optimize or args.schedule) and (args.stream or args.cache_dir or args.link or args.disassemble
+                                             or args.round_trip):
+        print("Error: --optimize and --schedule cannot be used with --stream, --cache-dir, --link, --disassemble"
+              " or --round-trip")
+        return 1
+
+    if args.disassemble and args.round_trip:
+        print("Error: --disassemble cannot be used with --round-trip")
+        return 1
+
+    if args.simulate and (args.verbose or args.binary or args.format or args.stream or args.output
+                          or args.disassemble or args.round_trip):
+        print("Error: --simulate cannot be used with output, stream, --disassemble or --round-trip options")
+        return 1
+
+    if args.verbose and (args.binary or args.format):
+        print("Error: --verbose cannot be used with --binary or --format")
+        return 1
+
+    if args.binary and args.format:
+        print("Error: --binary cannot be used with --format")
+        return 1
+
+    fmt = args.format or ('binary' if args.binary else 'hex')
+
+    if args.stream and fmt not in ('hex', 'binary'):
+        print("Error: --stream only supports the hex and binary formats")
         return 1
 
     if not args.verbose and args.pretty:
@@ -27,77 +132,401 @@ def main():
         print("Error: --pretty can only be 'rainbow' or 'full'")
         return 1
 
+    if args.stream and args.verbose:
+        print("Error: --stream cannot be used with --verbose")
+        return 1
+
+    if args.cache_dir and (args.verbose or args.stream):
+        print("Error: --cache-dir cannot be used with --verbose or --stream")
+        return 1
+
+    if args.max_errors is not None and args.max_errors < 1:
+        print("Error: --max-errors must be at least 1")
+        return 1
+
+    if args.jobs < 0:
+        print("Error: --jobs must be at least 0")
+        return 1
+
+    if (args.all_errors or args.max_errors) and args.stream:
+        print("Error: --all-errors and --max-errors cannot be used with --stream")
+        return 1
+
+    # Only quoted globs need expanding, plain paths never load the batch module
+    asm_files = args.asm_file
+    if any(c in pattern for pattern in asm_files for c in '*?['):
+        from rv32ias.batch import expand_inputs
+        asm_files = expand_inputs(asm_files)
+
+    if args.link:
+        if OUTPUT_FORMATS[fmt].is_binary and not args.output and not args.simulate and sys.stdout.isatty():
+            print(f"Error: --format {fmt} writes raw bytes, use --output or redirect stdout")
+            return 1
+
+        stats = AsmStats() if args.stats else None
+        try:
+            return link_output(asm_files, args, fmt, stats)
+        finally:
+            if stats is not None:
+                print(stats.to_json() if args.stats == 'json' else stats.format(), file=sys.stderr)
+
+    if args.output_dir or len(asm_files) > 1:
+        if (args.verbose or args.stream or args.output or args.all_errors or args.max_errors or args.stats
+                or args.optimize or args.schedule):
+            print(
+                "Error: multiple files need --output-dir and cannot be used with --verbose, --stream, --output,"
+                " --all-errors, --max-errors, --stats, --optimize or --schedule"
+            )
+            return 1
+
+        return batch_output(asm_files, args.output_dir, fmt, args.cache_dir, args.jobs)
+
+    if OUTPUT_FORMATS[fmt].is_binary and not args.output and sys.stdout.isatty():
+        print(f"Error: --format {fmt} writes raw bytes, use --output or redirect stdout")
+        return 1
+
+    stats = AsmStats() if args.stats else None
+
     try:
-        raw_asm = load_asm(args.asm_file)
-        asm_parser = AsmParser(raw_asm)
-    except (FileNotFoundError, AsmParseError) as e:
+        return single_output(args, asm_files[0], fmt, stats)
+    finally:
+        if stats is not None:
+            print(stats.to_json() if args.stats == 'json' else stats.format(), file=sys.stderr)
+
+
+def single_output(args: argparse.Namespace, asm_file: str, fmt: str, stats: Optional[AsmStats]) -> int:
+    if args.disassemble:
+        return disassemble_output(asm_file, args.output, stats)
+
+    if args.stream:
+        try:
+            with timed(stats, 'stream'), open_asm(asm_file) as f:
+                stream_output(f, fmt == 'binary', args.output)
+        except (FileNotFoundError, AsmParseError) as e:
+            print(e)
+            return 1
+
+        return 0
+
+    # `.incbin` paths are relative to the source
+    base_dir = os.path.dirname(asm_file)
+
+    try:
+        raw_asm = load_asm(asm_file, stats)
+
+        if args.round_trip:
+            return round_trip_output(raw_asm, stats)
+
+        if args.optimize or args.schedule:
+            return rewrite_output(args, raw_asm, fmt, stats, base_dir)
+
+        if args.simulate:
+            return simulate_output(assemble(raw_asm, args.cache_dir, stats, base_dir), args.max_steps, stats)
+
+        if args.verbose:
+            from rv32ias.preprocessor import AsmParser
+            verbose_output(AsmParser(raw_asm, stats=stats, base_dir=base_dir), args.pretty, args.output, stats)
+        else:
+            standard_output(assemble(raw_asm, args.cache_dir, stats, base_dir), fmt, args.output, stats)
+    except FileNotFoundError as e:
         print(e)
         return 1
+    except AsmParseError as e:
+        if args.all_errors or args.max_errors:
+            from rv32ias.preprocessor import AsmParser
+            # Sources that assemble never pay for collecting, only failing ones are parsed again
+            asm_parser = AsmParser(raw_asm, collect_errors=True, max_errors=args.max_errors, base_dir=base_dir)
+            errors_output(asm_parser, args.max_errors)
+        else:
+            print(e)
+        return 1
+
+    return 0
+
+
+def rewrite_output(args: argparse.Namespace, raw_asm: str, fmt: str, stats: Optional[AsmStats],
+                   base_dir: Optional[str]) -> int:
+    from rv32ias.preprocessor import AsmParser
+
+    asm_parser = AsmParser(raw_asm, stats=stats, base_dir=base_dir)
+
+    # Reports go to stderr, the output stays the program alone. Dropping code first leaves the scheduler
+    # fewer instructions to place
+    if args.optimize:
+        report = asm_parser.optimize()
+        after = report.instructions - report.removed
+        share = report.removed / report.instructions if report.instructions else 0
+        rules = ''.join(f', {n} {name}' for name, n in sorted(report.rules.items()))
+        print(
+            f'Optimized {report.instructions} -> {after} instructions, {report.saved} bytes saved ({share:.1%}):'
+            f' {report.dead} unreachable{rules}', file=sys.stderr
+        )
+
+    if args.schedule:
+        report = asm_parser.schedule()
+        print(
+            f'Scheduled {report.scheduled}/{report.blocks} blocks, {report.moved} instructions moved, load-use'
+            f' stalls {report.stalls_before} -> {report.stalls_after} ({report.removed} cycles removed)',
+            file=sys.stderr
+        )
+
+    if args.simulate:
+        return simulate_output(asm_parser.machine_codes.tolist(), args.max_steps, stats)
 
     if args.verbose:
-        verbose_output(asm_parser, args.pretty)
+        verbose_output(asm_parser, args.pretty, args.output, stats)
     else:
-        standard_output(asm_parser, args.binary, args.output)
+        standard_output(asm_parser.machine_codes, fmt, args.output, stats)
 
     return 0
 
 
-def load_asm(asm_file: str) -> str:
+def open_asm(asm_file: str) -> TextIO:
     try:
-        with open(asm_file, 'r') as f:
-            return f.read()
+        return open(asm_file, 'r')
     except Exception as e:
         raise FileNotFoundError(f"Error occurred while reading file:\n -> {e}")
 
 
-def standard_output(asm_parser: AsmParser, binary: bool, output: str) -> None:
-    if output:
-        with open(output, 'w') as f:
-            for machine_code in assemble_instructions(asm_parser.instructions):
-                f.write(f'{machine_code:08X}\n' if not binary else f'{machine_code:032b}\n')
-    else:
-        for machine_code in assemble_instructions(asm_parser.instructions):
-            print(f'{machine_code:08X}' if not binary else f'{machine_code:032b}')
+def standard_output(machine_codes: Iterable[int], fmt: str, output: str, stats: Optional[AsmStats] = None) -> None:
+    with timed(stats, 'output'):
+        data = OUTPUT_FORMATS[fmt].encode(machine_codes)
 
+        if output:
+            with open(output, 'wb') as f:
+                f.write(data)
+        else:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
 
-def verbose_output(asm_parser: AsmParser, pretty: str) -> None:
-    asm = asm_parser.asm
+    if stats is not None:
+        stats.count('bytes_written', len(data))
 
-    # Build a mapping from instruction index to machine code
-    machine_codes = {inst.idx: mc for inst, mc in zip(
-        asm_parser.instructions, assemble_instructions(asm_parser.instructions)
-    )}
 
-    # Build a mapping from instruction memory address to jump label
-    jump_table = {}
-    for label, addr in asm_parser.jump_table.items():
-        jump_table[addr] = jump_table[addr] + f', {label}' if addr in jump_table else label
+def batch_output(asm_files: List[str], output_dir: str, fmt: str, cache_dir: str, jobs: int) -> int:
+    from rv32ias.batch import assemble_batch
 
-    # Calculate pretty print lengths
-    max_asm_length = max(len(asm[idx].raw) if pretty else len(asm[idx].body) for idx in machine_codes)
-    max_tgt_length = max([len(target) for target in jump_table.values()] + [5])
+    start = time.perf_counter()
+
+    try:
+        results = assemble_batch(asm_files, output_dir or '.', fmt, cache_dir, jobs or os.cpu_count())
+    except ValueError as e:
+        print(e)
+        return 1
 
-    # Print the header
-    print(f"{'Addr':^9} | {'Label':^{max_tgt_length}} | {'Hex':^8} | {'Bin':^32} | {'Assembly':^{max_asm_length}}")
-    print(f"{'-' * 9} | {'-' * max_tgt_length} | {'-' * 8} | {'-' * 32} | {'-' * max_asm_length}")
+    failed = [result for result in results if result.error]
+    for result in failed:
+        print(f'{result.asm_file}:\n{result.error}')
 
-    for line in asm:
-        if not pretty and line.idx not in machine_codes:
-            continue
+    instructions = sum(result.instructions for result in results)
+    print(
+        f'{len(results) - len(failed)}/{len(results)} files assembled, {instructions} instructions'
+        f' in {time.perf_counter() - start:.3f}s'
+    )
 
-        if line.idx not in machine_codes:
-            print(f'{"*":^9} | {"":^{max_tgt_length}} | {"*":^8} | {"*":^32} | ', end='')
+    return 1 if failed else 0
+
+
+def link_output(asm_files: List[str], args: argparse.Namespace, fmt: str, stats: Optional[AsmStats] = None) -> int:
+    from rv32ias.exceptions import AsmLinkError
+    from rv32ias.linker import build_units
+    from rv32ias.linker import link
+
+    with timed(stats, 'assemble'):
+        results = build_units(asm_files, args.obj_dir, args.jobs or os.cpu_count())
+
+    failed = [result for result in results if result.error]
+    for result in failed:
+        print(f'{result.asm_file}:\n{result.error}')
+    if failed:
+        return 1
+
+    if stats is not None:
+        stats.count('units', len(results))
+        stats.count('units.rebuilt', sum(result.rebuilt for result in results))
+
+    try:
+        with timed(stats, 'link'):
+            linked = link([result.unit for result in results])
+    except AsmLinkError as e:
+        print(e)
+        return 1
+
+    if args.simulate:
+        return simulate_output(linked.words.tolist(), args.max_steps, stats)
+
+    standard_output(linked.words, fmt, args.output, stats)
+    return 0
+
+
+def stream_output(asm_file: TextIO, binary: bool, output: str) -> None:
+    from rv32ias.pipeline import assemble_stream
+    from rv32ias.stream import iter_ordered
+
+    fmt = '{:032b}\n' if binary else '{:08X}\n'
+
+    if not output:
+        for machine_code in iter_ordered(assemble_stream(asm_file)):
+            print(fmt.format(machine_code), end='')
+        return
+
+    # Every record has the same width, so late fixups are patched in place
+    width = len(fmt.format(0))
+    hole = fmt.format(0).encode()
+
+    try:
+        with open(output, 'wb') as f:
+            end = 0
+            for addr, machine_code in assemble_stream(asm_file):
+                pos = addr // 4 * width
+                record = fmt.format(machine_code).encode()
+
+                if pos >= end:
+                    f.write(hole * ((pos - end) // width) + record)
+                    end = pos + width
+                else:
+                    f.seek(pos)
+                    f.write(record)
+                    f.seek(end)
+    except AsmParseError:
+        os.remove(output)
+        raise
+
+
+def disassemble_output(image_file: str, output: str, stats: Optional[AsmStats] = None) -> int:
+    from rv32ias.disassembler import iter_disassembly
+    from rv32ias.disassembler import load_image
+
+    try:
+        with timed(stats, 'load'), open(image_file, 'rb') as f:
+            words, base = load_image(f.read())
+    except (OSError, ValueError) as e:
+        print(f"Error occurred while reading image:\n -> {e}")
+        return 1
+
+    with timed(stats, 'disassemble'):
+        lines = iter_disassembly(words, base)
+
+        if output:
+            with open(output, 'w', buffering=LISTING_BUFFER) as f:
+                written = write_lines(lines, f)
         else:
-            print(
-                f'+{line.idx * 4:08} | {jump_table.get(line.im_ptr, ""):^{max_tgt_length}} |'
-                f' {machine_codes[line.idx]:08X} | {machine_codes[line.idx]:032b} | ', end=''
-            )
+            written = write_lines(lines, sys.stdout)
+            sys.stdout.flush()
 
-        print(
-            line.colorize(max_asm_length) if pretty == 'rainbow' else
-            line.raw if pretty == 'full' else
-            line.body
-        )
+    if stats is not None:
+        stats.count('instructions', len(words))
+        stats.count('bytes_written', written)
+
+    return 0
+
+
+def write_lines(lines: Iterable[str], out: TextIO) -> int:
+    written = 0
+    chunk = []
+
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= 8192:
+            written += out.write('\n'.join(chunk) + '\n')
+            chunk.clear()
+
+    if chunk:
+        written += out.write('\n'.join(chunk) + '\n')
+
+    return written
+
+
+def round_trip_output(raw_asm: str, stats: Optional[AsmStats] = None) -> int:
+    from rv32ias.disassembler import round_trip
+
+    with timed(stats, 'round_trip'):
+        mismatches = round_trip(raw_asm)
+
+    for addr, expected, found in mismatches:
+        expected, found = (f'{word:08X}' if word is not None else '--------' for word in (expected, found))
+        print(f'+{addr:08X}: assembled {expected}, after disassembly {found}')
+
+    print(f'Round trip {"failed" if mismatches else "passed"}: {len(mismatches)} mismatching word(s)')
+    return 1 if mismatches else 0
+
+
+def simulate_output(machine_codes: List[int], max_steps: int, stats: Optional[AsmStats] = None) -> int:
+    from rv32ias.isa import reg_abi_names
+    from rv32ias.simulator import Simulator
+    from rv32ias.simulator import SimulatorError
+
+    try:
+        simulator = Simulator(machine_codes)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    try:
+        with timed(stats, 'simulate'):
+            reason = simulator.run(max_steps)
+    except SimulatorError as e:
+        print(e)
+        return 1
+    finally:
+        if stats is not None:
+            stats.count('steps', simulator.steps)
+
+    print(f'Halted at pc {simulator.pc:08X} after {simulator.steps} steps ({reason.value})')
+
+    regs = simulator.regs
+    for row in range(0, 32, 4):
+        print('  '.join(f'{f"x{i}/{reg_abi_names[i]}":>8} {regs[i]:08X}' for i in range(row, row + 4)))
+
+    return 0
+
+
+def serve_output(socket_path: str, framing: str, cache_dir: str) -> int:
+    from rv32ias.server import serve_stdio
+    from rv32ias.server import serve_unix
+    from rv32ias.server import warm_up
+
+    warm_up()
+
+    try:
+        if socket_path:
+            print(f'Serving on {socket_path}', file=sys.stderr)
+            serve_unix(socket_path, framing, cache_dir)
+        else:
+            serve_stdio(framing, cache_dir)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def errors_output(asm_parser: 'AsmParser', max_errors: int) -> None:
+    diagnostics = sorted(asm_parser.diagnostics, key=lambda d: (d.source or '', d.line))
+
+    for diagnostic in diagnostics:
+        print(diagnostic)
+
+    more = ' (stopped at --max-errors)' if max_errors and len(diagnostics) >= max_errors else ''
+    print(f'{len(diagnostics)} error{"s" if len(diagnostics) != 1 else ""} found{more}')
+
+
+def verbose_output(asm_parser: 'AsmParser', pretty: str, output: str, stats: Optional[AsmStats] = None) -> None:
+    from rv32ias.listing import write_listing
+
+    # Encoding is timed on its own, not as part of the listing
+    asm_parser.machine_codes
+
+    with timed(stats, 'output'):
+        if output:
+            with open(output, 'w', buffering=LISTING_BUFFER) as f:
+                written = write_listing(asm_parser, f, pretty)
+        else:
+            written = write_listing(asm_parser, sys.stdout, pretty)
+            sys.stdout.flush()
+
+    if stats is not None:
+        stats.count('bytes_written', written)
 
 
 if __name__ == '__main__':
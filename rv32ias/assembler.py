@@ -1,14 +1,41 @@
-from typing import List
+from array import array
+from functools import lru_cache
+from typing import List, Sequence
 
 from rv32ias.isa import InstType
-from rv32ias.isa import reg_mapper
 from rv32ias.isa import rv32i_inst_dict
+from rv32ias.models import INST_NAMES
 from rv32ias.models import Instruction
+from rv32ias.models import InstructionView
+from rv32ias.models import Program
 
 __all__ = [
+    'assemble_instruction',
     'assemble_instructions',
+    'assemble_columns',
+    'columnize_instructions',
+    'patch_offset',
+    'columnize_program',
+    'FMT_CODES',
+    'load_numpy',
 ]
 
+# Below this many instructions the scalar path beats the NumPy setup cost
+BATCH_THRESHOLD = 256
+
+# Numeric code of each instruction format in the columnar form
+FMT_CODES = {inst_type: i for i, inst_type in enumerate(InstType)}
+
+
+@lru_cache(maxsize=1)
+def load_numpy():
+    # Importing NumPy takes longer than assembling a small program, so it waits for the first large batch
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
 
 def __assemble_handle_type_r(instruction: Instruction) -> int:
     inst_def = rv32i_inst_dict[instruction.inst]
@@ -17,9 +44,9 @@ def __assemble_handle_type_r(instruction: Instruction) -> int:
     funct3 = inst_def.funct3
     funct7 = inst_def.funct7
 
-    rd = reg_mapper(instruction.rd)
-    rs1 = reg_mapper(instruction.rs1)
-    rs2 = reg_mapper(instruction.rs2)
+    rd = instruction.rd_num
+    rs1 = instruction.rs1_num
+    rs2 = instruction.rs2_num
 
     return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
 
@@ -30,8 +57,8 @@ def __assemble_handle_type_i(instruction: Instruction) -> int:
     opcode = inst_def.opcode
     funct3 = inst_def.funct3
 
-    rd = reg_mapper(instruction.rd)
-    rs1 = reg_mapper(instruction.rs1)
+    rd = instruction.rd_num
+    rs1 = instruction.rs1_num
     imm = instruction.imm & 0xFFF
 
     if inst_def.inst in ('slli', 'srli', 'srai'):
@@ -46,8 +73,8 @@ def __assemble_handle_type_sb(instruction: Instruction) -> int:
     opcode = inst_def.opcode
     funct3 = inst_def.funct3
 
-    rs1 = reg_mapper(instruction.rs1)
-    rs2 = reg_mapper(instruction.rs2)
+    rs1 = instruction.rs1_num
+    rs2 = instruction.rs2_num
     imm = instruction.imm
 
     if inst_def.inst_type == InstType.S_:
@@ -65,7 +92,7 @@ def __assemble_handle_type_uj(instruction: Instruction) -> int:
 
     opcode = inst_def.opcode
 
-    rd = reg_mapper(instruction.rd)
+    rd = instruction.rd_num
     imm = instruction.imm
 
     if inst_def.inst_type == InstType.J_:
@@ -80,7 +107,7 @@ def __assemble_handle_type_uj(instruction: Instruction) -> int:
     return (imm << 12) | (rd << 7) | opcode
 
 
-def __assemble_instruction(instruction: Instruction) -> int:
+def assemble_instruction(instruction: Instruction) -> int:
     match rv32i_inst_dict[instruction.inst].inst_type:
         case InstType.R_:
             return __assemble_handle_type_r(instruction)
@@ -92,5 +119,142 @@ def __assemble_instruction(instruction: Instruction) -> int:
             return __assemble_handle_type_uj(instruction)
 
 
-def assemble_instructions(instructions: List[Instruction]) -> List[int]:
-    return [__assemble_instruction(line) for line in instructions]
+def patch_offset(word: int, offset: int) -> int:
+    # Re-target an encoded branch or jal without decoding the rest of the word
+    match word & 0x7F:
+        case 0b1100011:
+            imm7 = ((offset >> 6) & 0x40) | ((offset >> 5) & 0x3F)
+            imm5 = (offset & 0x1E) | ((offset >> 11) & 0x1)
+            return (word & 0x01FFF07F) | (imm7 << 25) | (imm5 << 7)
+        case 0b1101111:
+            imm20 = (offset >> 20) & 0x1
+            imm10_1 = (offset >> 1) & 0x3FF
+            imm11 = (offset >> 11) & 0x1
+            imm19_12 = (offset >> 12) & 0xFF
+            return (word & 0xFFF) | (((imm20 << 19) | (imm10_1 << 9) | (imm11 << 8) | imm19_12) << 12)
+
+    raise ValueError(f'Not a branch or jal: {word:08X}')
+
+
+def __template_word(inst: str) -> int:
+    inst_def = rv32i_inst_dict[inst]
+
+    template = inst_def.opcode
+    if inst_def.funct3 is not None:
+        template |= inst_def.funct3 << 12
+    if inst_def.funct7 is not None:
+        template |= inst_def.funct7 << 25
+
+    return template
+
+
+# Per mnemonic: (template word, format code)
+__templates = {inst: (__template_word(inst), FMT_CODES[d.inst_type]) for inst, d in rv32i_inst_dict.items()}
+
+
+@lru_cache(maxsize=1)
+def __numpy_tables() -> tuple:
+    np = load_numpy()
+    return (
+        np.array([__templates[inst][0] for inst in INST_NAMES], dtype=np.uint32),
+        np.array([__templates[inst][1] for inst in INST_NAMES], dtype=np.uint8),
+    )
+
+
+def columnize_instructions(instructions: Sequence[Instruction]) -> tuple:
+    template, fmt = array('I'), array('B')
+    rd, rs1, rs2, imm = array('B'), array('B'), array('B'), array('I')
+
+    for instruction in instructions:
+        t, f = __templates[instruction.inst]
+        template.append(t)
+        fmt.append(f)
+
+        rd.append(instruction.rd_num or 0)
+        rs1.append(instruction.rs1_num or 0)
+        rs2.append(instruction.rs2_num or 0)
+
+        # Only the low 21 bits of an immediate are ever encoded
+        imm.append((instruction.imm or 0) & 0xFFFFFFFF)
+
+    return template, fmt, rd, rs1, rs2, imm
+
+
+def columnize_program(program: Program) -> tuple:
+    if (np := load_numpy()) is None:
+        raise ImportError('columnize_program requires numpy')
+
+    template_table, fmt_table = __numpy_tables()
+
+    # Columns already hold interned ids, so only the id tables need mapping
+    ops = np.frombuffer(program.inst_ops, dtype=np.uint8)
+    regs = np.array(program.reg_nums, dtype=np.uint32)
+
+    return (
+        template_table[ops],
+        fmt_table[ops],
+        regs[np.frombuffer(program.inst_rd, dtype=np.uint8)],
+        regs[np.frombuffer(program.inst_rs1, dtype=np.uint8)],
+        regs[np.frombuffer(program.inst_rs2, dtype=np.uint8)],
+        np.frombuffer(program.inst_imm, dtype=np.int64).astype(np.uint32),
+    )
+
+
+def assemble_columns(template, fmt, rd, rs1, rs2, imm) -> 'np.ndarray':
+    if (np := load_numpy()) is None:
+        raise ImportError('assemble_columns requires numpy')
+
+    template = np.asarray(template, dtype=np.uint32)
+    fmt = np.asarray(fmt, dtype=np.uint8)
+    rd = np.asarray(rd, dtype=np.uint32)
+    rs1 = np.asarray(rs1, dtype=np.uint32)
+    rs2 = np.asarray(rs2, dtype=np.uint32)
+    imm = np.asarray(imm, dtype=np.uint32)
+
+    # Register fields are shared by every format that uses them; absent registers are 0
+    words = template | (rd << 7) | (rs1 << 15) | (rs2 << 20)
+
+    m = fmt == FMT_CODES[InstType.I_]
+    if m.any():
+        # Shift-immediates (OP-IMM with funct3 1 or 5) keep funct7 from the template and only take a 6-bit shamt
+        t = template[m]
+        funct3 = (t >> 12) & 0x7
+        shift = ((t & 0x7F) == 0b0010011) & ((funct3 == 1) | (funct3 == 5))
+        words[m] |= (imm[m] & np.where(shift, np.uint32(0x3F), np.uint32(0xFFF))) << 20
+
+    m = fmt == FMT_CODES[InstType.S_]
+    if m.any():
+        i = imm[m]
+        words[m] |= (((i >> 5) & 0x7F) << 25) | ((i & 0x1F) << 7)
+
+    m = fmt == FMT_CODES[InstType.B_]
+    if m.any():
+        i = imm[m]
+        imm7 = (((i >> 12) & 0x1) << 6) | ((i >> 5) & 0x3F)
+        imm5 = (i & 0x1E) | ((i >> 11) & 0x1)
+        words[m] |= (imm7 << 25) | (imm5 << 7)
+
+    m = fmt == FMT_CODES[InstType.U_]
+    if m.any():
+        words[m] |= (imm[m] & 0xFFFFF) << 12
+
+    m = fmt == FMT_CODES[InstType.J_]
+    if m.any():
+        i = imm[m]
+        imm20 = ((i >> 20) & 0x1) << 19
+        imm10_1 = ((i >> 1) & 0x3FF) << 9
+        imm11 = ((i >> 11) & 0x1) << 8
+        imm19_12 = (i >> 12) & 0xFF
+        words[m] |= (imm20 | imm10_1 | imm11 | imm19_12) << 12
+
+    return words
+
+
+def assemble_instructions(instructions: Sequence[Instruction]) -> List[int]:
+    if len(instructions) >= BATCH_THRESHOLD and load_numpy() is not None:
+        if isinstance(instructions, InstructionView):
+            return assemble_columns(*columnize_program(instructions.program)).tolist()
+
+        return assemble_columns(*columnize_instructions(instructions)).tolist()
+
+    return [assemble_instruction(line) for line in instructions]
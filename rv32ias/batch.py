@@ -0,0 +1,85 @@
+import glob
+import os
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from rv32ias.exceptions import AsmParseError
+from rv32ias.formats import OUTPUT_FORMATS
+from rv32ias.pipeline import assemble
+from rv32ias.pipeline import load_asm
+
+__all__ = [
+    'BatchResult',
+    'assemble_batch',
+    'assemble_file',
+    'expand_inputs',
+    'output_path',
+]
+
+
+@dataclass
+class BatchResult:
+    asm_file: str
+    output: str
+    instructions: int = 0
+    error: Optional[str] = None
+
+
+def expand_inputs(patterns: Iterable[str]) -> List[str]:
+    # Shells expand globs already, this covers quoted patterns and shells that don't
+    asm_files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            asm_files.extend(sorted(glob.glob(pattern, recursive=True)) or [pattern])
+        else:
+            asm_files.append(pattern)
+
+    return asm_files
+
+
+def output_path(asm_file: str, output_dir: str, fmt: str = 'hex') -> str:
+    stem = os.path.splitext(os.path.basename(asm_file))[0]
+    return os.path.join(output_dir, stem + OUTPUT_FORMATS[fmt].suffix)
+
+
+def assemble_file(asm_file: str, output: str, fmt: str = 'hex', cache_dir: Optional[str] = None) -> BatchResult:
+    try:
+        machine_codes = assemble(load_asm(asm_file), cache_dir, base_dir=os.path.dirname(asm_file))
+
+        with open(output, 'wb') as f:
+            f.write(OUTPUT_FORMATS[fmt].encode(machine_codes))
+    except (FileNotFoundError, AsmParseError) as e:
+        return BatchResult(asm_file, output, error=str(e))
+    except OSError as e:
+        return BatchResult(asm_file, output, error=f"Error occurred while writing file:\n -> {e}")
+    except Exception as e:
+        # Any other failure stays with its file, rather than ending the whole batch from inside a worker
+        return BatchResult(asm_file, output, error=f"Error occurred while assembling:\n -> {type(e).__name__}: {e}")
+
+    return BatchResult(asm_file, output, len(machine_codes))
+
+
+def assemble_batch(asm_files: List[str], output_dir: str, fmt: str = 'hex',
+                   cache_dir: Optional[str] = None, jobs: int = 1) -> List[BatchResult]:
+    outputs = [output_path(asm_file, output_dir, fmt) for asm_file in asm_files]
+
+    # ! Raise when two inputs would overwrite each other's output
+    seen = {}
+    for asm_file, output in zip(asm_files, outputs):
+        if output in seen:
+            raise ValueError(f"Error: {seen[output]} and {asm_file} both write to {output}")
+        seen[output] = asm_file
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    args = (asm_files, outputs, [fmt] * len(asm_files), [cache_dir] * len(asm_files))
+
+    if jobs == 1 or len(asm_files) == 1:
+        return list(map(assemble_file, *args))
+
+    # Only loaded here, starting the process pool machinery is slow
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Results come back in input order whatever order the workers finish in
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(assemble_file, *args, chunksize=max(1, len(asm_files) // (jobs * 8))))
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rv32ias.formats import to_le_bytes
+from rv32ias.isa import pseudo_inst_dict
+from rv32ias.isa import rv32i_inst_dict
+
+__all__ = [
+    'AsmCache',
+]
+
+# Entry layout: header, words, label addresses, '\n' joined label names (all little endian). The header gives
+# every length, so truncated entries are told apart from complete ones
+__HEADER = struct.Struct('<8sIII')
+__MAGIC = b'RV32IAS\x02'
+
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+@lru_cache(maxsize=1)
+def isa_fingerprint() -> bytes:
+    isa_table = [
+        (d.inst, d.inst_type.value, d.opcode, d.funct3, d.funct7, d.inst_arg_re) for d in rv32i_inst_dict.values()
+    ] + [
+        (d.inst, d.inst_arg_re, d.base, sorted(d.fixed.items())) for d in pseudo_inst_dict.values()
+    ]
+    return hashlib.sha256(repr(isa_table).encode()).digest()
+
+
+def __from_le(typecode: str, data: bytes) -> array:
+    values = array(typecode, data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_entry(words: Iterable[int], jump_table: Dict[str, int]) -> bytes:
+    words = words if isinstance(words, array) and words.typecode == 'I' else array('I', words)
+    addrs = array('I', jump_table.values())
+    names = '\n'.join(jump_table).encode()
+
+    header = __HEADER.pack(__MAGIC, len(words), len(addrs), len(names))
+    return header + to_le_bytes(words) + to_le_bytes(addrs) + names
+
+
+def unpack_entry(data: bytes) -> Optional[Tuple[array, Dict[str, int]]]:
+    if len(data) < __HEADER.size:
+        return None
+
+    magic, n_words, n_labels, names_size = __HEADER.unpack_from(data)
+    words_end = __HEADER.size + n_words * 4
+    addrs_end = words_end + n_labels * 4
+
+    if magic != __MAGIC or len(data) != addrs_end + names_size:
+        return None
+
+    try:
+        names = data[addrs_end:].decode().split('\n') if n_labels else []
+    except UnicodeDecodeError:
+        return None
+
+    if len(names) != n_labels:
+        return None
+
+    words = __from_le('I', data[__HEADER.size:words_end])
+    addrs = __from_le('I', data[words_end:addrs_end])
+
+    return words, dict(zip(names, addrs))
+
+
+class AsmCache:
+    # Bytes in each cache directory as last seen by this process, so writes only scan the directory once the
+    # limit is passed. Entries written by other processes are counted at the next scan
+    __sizes: Dict[str, int] = {}
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_CACHE_SIZE):
+        self.__cache_dir = cache_dir
+        self.__max_size = max_size
+        self.__size_key = os.path.realpath(cache_dir)
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(asm_txt: str, base_dir: Optional[str] = None) -> str:
+        from rv32ias import __version__
+
+        digest = hashlib.sha256()
+        digest.update(__version__.encode() + b'\0')
+        digest.update(isa_fingerprint())
+        digest.update(asm_txt.encode())
+
+        # Included sources are keyed by path, modification time and size too, their .incbin files along with
+        # those of the source
+        if '.include' in asm_txt:
+            from rv32ias.expand import include_files
+
+            for path, text in include_files(asm_txt, base_dir):
+                try:
+                    st = os.stat(path)
+                    digest.update(f'\0{path}\0{st.st_mtime_ns}\0{st.st_size}'.encode())
+                except OSError:
+                    digest.update(f'\0{path}\0missing'.encode())
+                if text is not None and '.incbin' in text:
+                    asm_txt += '\n' + text
+
+        # Included files are keyed by path, modification time and size rather than read
+        if '.incbin' in asm_txt:
+            from rv32ias.image import incbin_paths
+
+            for path in incbin_paths(asm_txt, base_dir):
+                try:
+                    st = os.stat(path)
+                    digest.update(f'\0{path}\0{st.st_mtime_ns}\0{st.st_size}'.encode())
+                except OSError:
+                    digest.update(f'\0{path}\0missing'.encode())
+
+        return digest.hexdigest()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.__cache_dir, f'{key}.bin')
+
+    def get(self, key: str) -> Optional[Tuple[array, Dict[str, int]]]:
+        path = self.__path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                entry = unpack_entry(f.read())
+            # Recently used entries are the last to be evicted
+            os.utime(path)
+        except OSError:
+            return None
+
+        return entry
+
+    def put(self, key: str, words: Iterable[int], jump_table: Dict[str, int]) -> None:
+        data = pack_entry(words, jump_table)
+
+        # Write aside and rename, so readers only ever see complete entries
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{key}.', suffix='.tmp', dir=self.__cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp creates private files, entries are meant to be shared
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.__path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        sizes = AsmCache.__sizes
+        if self.__size_key not in sizes:
+            sizes[self.__size_key] = self.__scan()[1]
+        else:
+            sizes[self.__size_key] += len(data)
+
+        if sizes[self.__size_key] > self.__max_size:
+            self.evict()
+
+    def __scan(self) -> Tuple[List[Tuple[float, int, str]], int]:
+        entries = []
+        total = 0
+
+        with os.scandir(self.__cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.bin'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        return entries, total
+
+    def evict(self) -> None:
+        entries, total = self.__scan()
+
+        if total > self.__max_size:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Another process got to it first
+                    pass
+
+                total -= size
+                if total <= self.__max_size:
+                    break
+
+        AsmCache.__sizes[self.__size_key] = total
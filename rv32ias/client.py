@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+from typing import List, Optional
+
+from rv32ias.server import encode_message
+from rv32ias.server import read_message
+
+__all__ = [
+    'AsmClient',
+]
+
+
+# Talks to `rv32ias --serve`, either over its Unix socket or by starting a
+# private server on a pipe when no socket is given
+class AsmClient:
+    def __init__(self, socket_path: Optional[str] = None, framing: str = 'lines'):
+        self.__framing = framing
+        self.__next_id = 0
+        self.__sock = None
+        self.__process = None
+
+        if socket_path:
+            self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.__sock.connect(socket_path)
+            self.__rfile = self.__sock.makefile('rb')
+            self.__wfile = self.__sock.makefile('wb')
+        else:
+            self.__process = subprocess.Popen(
+                [sys.executable, '-m', 'rv32ias', '--serve', '--framing', framing],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            self.__rfile = self.__process.stdout
+            self.__wfile = self.__process.stdin
+
+    def request(self, message: dict) -> dict:
+        self.__wfile.write(encode_message(message, self.__framing))
+        self.__wfile.flush()
+
+        if (payload := read_message(self.__rfile, self.__framing)) is None:
+            raise ConnectionError('Server closed the connection')
+
+        return json.loads(payload)
+
+    def assemble(self, source: str, **options) -> dict:
+        self.__next_id += 1
+        return self.request({'id': self.__next_id, 'source': source, **options})
+
+    def close(self) -> None:
+        self.__wfile.close()
+        self.__rfile.close()
+
+        if self.__sock is not None:
+            self.__sock.close()
+        if self.__process is not None:
+            self.__process.wait()
+
+    def __enter__(self) -> 'AsmClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Send assembly files to a running rv32ias server')
+    parser.add_argument('asm_file', type=str, nargs='+', help='Assembly file(s) to be assembled')
+    parser.add_argument('--socket', type=str, help='Server socket (starts a private server when omitted)')
+    parser.add_argument('--framing', type=str, choices=['lines', 'length'], default='lines', help='Message framing')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    with AsmClient(args.socket, args.framing) as client:
+        for asm_file in args.asm_file:
+            with open(asm_file, 'r') as f:
+                response = client.assemble(f.read(), context=True, base_dir=os.path.dirname(os.path.abspath(asm_file)))
+
+            if response['ok']:
+                print(f'{asm_file}: {len(response["words"])} words')
+                continue
+
+            failed += 1
+            if 'error' in response:
+                print(f'{asm_file}: {response["error"]}')
+                continue
+
+            print(f'{asm_file}: {len(response["errors"])} error(s)')
+            for error in response['errors']:
+                print(f'{error["type"]} Error: found at line {error["line"]} ({error["note"]})\n{error["context"]}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    exit(main())
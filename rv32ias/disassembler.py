@@ -0,0 +1,260 @@
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from rv32ias.isa import InstDef
+from rv32ias.isa import InstType
+from rv32ias.isa import reg_abi_names
+from rv32ias.isa import rv32i_inst_dict
+
+__all__ = [
+    'DecodedWord',
+    'decode_word',
+    'load_image',
+    'iter_disassembly',
+    'disassemble',
+    'round_trip',
+]
+
+Image = Union[bytes, bytearray, memoryview, array, Sequence[int]]
+
+
+class DecodedWord(NamedTuple):
+    inst: str
+    rd: int
+    rs1: int
+    rs2: int
+    imm: int
+
+
+def __sign(value: int, bits: int) -> int:
+    sign = 1 << (bits - 1)
+    return ((value & ((1 << bits) - 1)) ^ sign) - sign
+
+
+def __imm_none(word: int) -> int:
+    return 0
+
+
+def __imm_i(word: int) -> int:
+    return ((word >> 20) ^ 0x800) - 0x800
+
+
+def __imm_shamt(word: int) -> int:
+    return (word >> 20) & 0x1F
+
+
+def __imm_s(word: int) -> int:
+    return __sign(((word >> 20) & 0xFE0) | ((word >> 7) & 0x1F), 12)
+
+
+def __imm_b(word: int) -> int:
+    return __sign(((word >> 19) & 0x1000) | ((word << 4) & 0x800) | ((word >> 20) & 0x7E0) | ((word >> 7) & 0x1E), 13)
+
+
+def __imm_u(word: int) -> int:
+    return word >> 12
+
+
+def __imm_j(word: int) -> int:
+    return __sign(((word >> 11) & 0x100000) | (word & 0xFF000) | ((word >> 9) & 0x800) | ((word >> 20) & 0x7FE), 21)
+
+
+def __imm_decoder(inst_def: InstDef) -> Callable[[int], int]:
+    match inst_def.inst_type:
+        case InstType.I_:
+            return __imm_shamt if inst_def.funct7 is not None else __imm_i
+        case InstType.S_:
+            return __imm_s
+        case InstType.B_:
+            return __imm_b
+        case InstType.U_:
+            return __imm_u
+        case InstType.J_:
+            return __imm_j
+
+    return __imm_none
+
+
+def __arg_format(inst_def: InstDef) -> str:
+    # Operands in the order the assembler's argument pattern expects them
+    pattern = inst_def.inst_arg_pattern
+    fields = sorted(pattern.groupindex, key=pattern.groupindex.get)
+
+    if r'\(' in inst_def.inst_arg_re:
+        return f'{{{fields[0]}}}, {{imm}}({{rs1}})'
+    return ', '.join(f'{{{field}}}' for field in fields)
+
+
+def __decode_key(word: int) -> int:
+    # opcode, funct3 and funct7 packed into 17 bits
+    return (word & 0x7F) | ((word >> 5) & 0x380) | ((word >> 15) & 0x1FC00)
+
+
+@lru_cache(maxsize=1)
+def __decode_table() -> list:
+    # Every opcode/funct3/funct7 combination maps straight to its instruction, fields an
+    # instruction leaves free (funct7 of most I-types, funct3 of U/J) are filled in for all values
+    table = [None] * (1 << 17)
+
+    for inst_def in rv32i_inst_dict.values():
+        shift = inst_def.inst_type == InstType.I_ and inst_def.funct7 is not None
+        uses_funct7 = inst_def.inst_type == InstType.R_ or shift
+
+        entry = (inst_def.inst, inst_def.inst_type, __imm_decoder(inst_def), __arg_format(inst_def))
+
+        for funct3 in [inst_def.funct3] if inst_def.funct3 is not None else range(8):
+            for funct7 in [inst_def.funct7] if uses_funct7 else range(128):
+                table[inst_def.opcode | (funct3 << 7) | (funct7 << 10)] = entry
+
+    return table
+
+
+def decode_word(word: int) -> Optional[DecodedWord]:
+    if (entry := __decode_table()[__decode_key(word)]) is None:
+        return None
+
+    inst, _, decode_imm, _ = entry
+    return DecodedWord(inst, (word >> 7) & 0x1F, (word >> 15) & 0x1F, (word >> 20) & 0x1F, decode_imm(word))
+
+
+def __text_words(lines: List[str]) -> Optional[array]:
+    if all(len(line) == 32 and set(line) <= set('01') for line in lines):
+        return array('I', (int(line, 2) for line in lines))
+
+    if all(len(line) == 8 for line in lines):
+        try:
+            words = array('I', bytes.fromhex(''.join(lines)))
+        except ValueError:
+            return None
+        # Text images list each word most significant byte first
+        if sys.byteorder == 'little':
+            words.byteswap()
+        return words
+
+    return None
+
+
+def load_image(data: bytes) -> Tuple[array, int]:
+    # Reads what the hex, binary, readmemh, readmemb, elf and raw formats write, returns (words, base address)
+    if data[:4] == b'\x7fELF':
+        phoff, = struct.unpack_from('<I', data, 28)
+        _, offset, vaddr, _, filesz, _, _, _ = struct.unpack_from('<8I', data, phoff)
+        return __as_words(data[offset:offset + filesz]), vaddr
+
+    try:
+        lines = data.decode('ascii').split()
+    except UnicodeDecodeError:
+        lines = None
+
+    if lines:
+        base = 0
+        if lines[0].startswith('@'):
+            # Address markers count memory words, not bytes
+            base = int(lines.pop(0)[1:], 16) * 4
+
+        if lines and (words := __text_words(lines)) is not None:
+            return words, base
+
+    if len(data) % 4:
+        raise ValueError(f'Raw image size {len(data)} is not a multiple of 4 bytes')
+
+    return __as_words(data), 0
+
+
+def __as_words(image: Image) -> array:
+    if isinstance(image, array) and image.typecode == 'I':
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        words = array('I', bytes(image))
+        if sys.byteorder == 'big':
+            words.byteswap()
+        return words
+    return array('I', image)
+
+
+def __label(addr: int) -> str:
+    return f'L_{addr & 0xFFFFFFFF:08X}'
+
+
+def iter_disassembly(image: Image, base: int = 0, abi: bool = True) -> Iterator[str]:
+    # Yields source lines that assemble back into the image, branch and jump targets become synthetic labels
+    words = __as_words(image)
+    table = __decode_table()
+    regs = reg_abi_names if abi else tuple(f'x{i}' for i in range(32))
+    control = (InstType.B_, InstType.J_)
+    end = base + len(words) * 4
+
+    # First pass: control transfer targets, each distinct branch or jump is decoded once, up to its label.
+    # Targets off the word grid or outside the image have no line to label
+    targets = set()
+    jumps: Dict[int, Tuple[str, int]] = {}
+
+    for i, word in enumerate(words):
+        if (jump := jumps.get(word)) is None:
+            entry = table[(word & 0x7F) | ((word >> 5) & 0x380) | ((word >> 15) & 0x1FC00)]
+            if entry is None or entry[1] not in control:
+                continue
+
+            inst, _, decode_imm, fmt = entry
+            prefix = f'    {inst:<5} ' + fmt.format(
+                rd=regs[(word >> 7) & 0x1F], rs1=regs[(word >> 15) & 0x1F], rs2=regs[(word >> 20) & 0x1F], label=''
+            )
+            jump = jumps[word] = (prefix, decode_imm(word))
+
+        if base <= (target := base + i * 4 + jump[1]) <= end and not (target - base) % 4:
+            targets.add(target)
+
+    # Everything else reads the same wherever it sits, so repeated words are formatted once
+    memo: Dict[int, str] = {}
+
+    addr = base
+    for word in words:
+        if addr in targets:
+            yield f'{__label(addr)}:'
+
+        if (text := memo.get(word)) is None:
+            if (jump := jumps.get(word)) is not None:
+                if addr + jump[1] in targets:
+                    text = jump[0] + __label(addr + jump[1])
+                else:
+                    # Kept as data, the offset is only shown
+                    text = f'    .word 0x{word:08X}  # {jump[0].lstrip()}{jump[1]:+d}'
+            elif (entry := table[(word & 0x7F) | ((word >> 5) & 0x380) | ((word >> 15) & 0x1FC00)]) is None:
+                # Data, or an encoding outside RV32I
+                text = memo[word] = f'    .word 0x{word:08X}'
+            else:
+                inst, inst_type, decode_imm, fmt = entry
+                imm = decode_imm(word)
+                text = memo[word] = f'    {inst:<5} ' + fmt.format(
+                    rd=regs[(word >> 7) & 0x1F], rs1=regs[(word >> 15) & 0x1F], rs2=regs[(word >> 20) & 0x1F],
+                    imm=hex(imm) if inst_type == InstType.U_ else imm
+                )
+
+        addr += 4
+        yield text
+
+    # A target right past the last word still needs a home
+    if addr in targets:
+        yield f'{__label(addr)}:'
+
+
+def disassemble(image: Image, base: int = 0, abi: bool = True) -> str:
+    return '\n'.join(iter_disassembly(image, base, abi)) + '\n'
+
+
+def round_trip(asm_txt: str) -> List[Tuple[int, Optional[int], Optional[int]]]:
+    # Assemble, disassemble, assemble again; returns (address, first word, second word) for every difference,
+    # None where one image is shorter than the other
+    from rv32ias.pipeline import assemble
+
+    words = assemble(asm_txt)
+    again = assemble(disassemble(words))
+
+    mismatches = [(i * 4, a, b) for i, (a, b) in enumerate(zip(words, again)) if a != b]
+    for i in range(min(len(words), len(again)), max(len(words), len(again))):
+        mismatches.append((i * 4, words[i] if i < len(words) else None, again[i] if i < len(again) else None))
+
+    return mismatches
@@ -1,9 +1,32 @@
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Type, Union
+
+
 class AsmParseError(Exception):
     error_type = 'Unknown'
 
-    def __init__(self, i: int, code_space: str, msg: str) -> None:
-        msg = f' \033[93m({msg})\033[0m' if msg else ''
-        super().__init__(f"{self.error_type} Error: found at line {i}{msg}\n{code_space}")
+    # The code space may be given as a callable, it is then rendered the first time the error is displayed.
+    # `source` names the included file the line is in, None for the assembled source itself
+    def __init__(self, i: int, code_space: Union[str, Callable[[], str]], msg: str, span: tuple = None,
+                 source: Optional[str] = None) -> None:
+        super().__init__(i, msg)
+        self.line = i
+        self.note = msg
+        self.span = span
+        self.source = source
+        self.render_ctx = code_space if callable(code_space) else lambda: code_space
+        self.__code_space = None
+
+    @property
+    def code_space(self) -> str:
+        if self.__code_space is None:
+            self.__code_space = self.render_ctx()
+        return self.__code_space
+
+    def __str__(self) -> str:
+        msg = f' \033[93m({self.note})\033[0m' if self.note else ''
+        where = f'line {self.line} of {self.source}' if self.source else f'line {self.line}'
+        return f"{self.error_type} Error: found at {where}{msg}\n{self.code_space}"
 
 
 class AsmInvalidSyntaxError(AsmParseError):
@@ -24,3 +47,47 @@ class AsmInvalidInstructionError(AsmParseError):
 
 class AsmInvalidRegisterError(AsmParseError):
     error_type = 'Invalid Register'
+
+
+class AsmOutOfRangeError(AsmParseError):
+    error_type = 'Out of Range'
+
+
+class AsmLinkError(Exception):
+    error_type = 'Link'
+
+    # Raised once every unit is assembled, so it points at a unit and line rather than a code space
+    def __init__(self, unit: str, i: int, msg: str) -> None:
+        super().__init__(unit, i, msg)
+        self.unit = unit
+        self.line = i
+        self.note = msg
+
+    def __str__(self) -> str:
+        where = f'{self.unit} line {self.line}' if self.line else self.unit
+        return f"{self.error_type} Error: found in {where} \033[93m({self.note})\033[0m"
+
+
+@dataclass(frozen=True, slots=True)
+class AsmDiagnostic:
+    # Line number, counted from 1
+    line: int
+    # (offset, length) in the clean line content, None for the whole line
+    span: Optional[tuple]
+    # Error class the problem would have been raised as
+    error: Type[AsmParseError]
+    note: str
+    # Renders the code space around the line
+    render_ctx: Callable[[], str] = field(repr=False, compare=False)
+    # Included file the line is in, None for the assembled source itself
+    source: Optional[str] = None
+
+    @classmethod
+    def from_error(cls, e: AsmParseError) -> 'AsmDiagnostic':
+        return cls(e.line, e.span, type(e), e.note, e.render_ctx, e.source)
+
+    def to_error(self) -> AsmParseError:
+        return self.error(self.line, self.render_ctx, self.note, self.span, self.source)
+
+    def __str__(self) -> str:
+        return str(self.to_error())
@@ -0,0 +1,394 @@
+import os
+import re
+from array import array
+from functools import partial
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from rv32ias.exceptions import AsmInvalidSyntaxError
+from rv32ias.lexer import Token
+from rv32ias.lexer import tokenize
+from rv32ias.lexer import tokenize_line
+from rv32ias.models import AsmLineType
+from rv32ias.stats import AsmStats
+
+__all__ = [
+    'SourceFile',
+    'Macro',
+    'SourceMap',
+    'IncludeCache',
+    'MacroExpander',
+    'include_cache',
+    'load_source',
+    'include_files',
+]
+
+INCLUDE = '.include'
+MACRO = '.macro'
+ENDM = '.endm'
+
+# Includes and macro invocations nested deeper than this are errors, recursion never ends otherwise
+MAX_DEPTH = 64
+
+__INCLUDE_RE = re.compile(r'^[^\S\n]*\.include[^\S\n]+"?([^",#\s]+)', re.MULTILINE)
+# `\name` of a parameter, `\@` for the number of the expansion and `\()` to end a name
+PARAM_RE = re.compile(r'\\(@|\(\)|\w+)')
+NAME_RE = re.compile(r'[A-Za-z_]\w*')
+
+# (text, token, file, line, substitutions) of a line as the parser gets it. Substitutions are the (offset,
+# length) of every macro argument in the expanded line and of its reference in the original one, in order
+Line = Tuple[str, Token, int, int, Optional[List[Tuple[int, int, int, int]]]]
+
+
+class SourceFile(NamedTuple):
+    # Path for included files, empty for the assembled source
+    name: str
+    text: str
+    tokens: List[Token]
+
+
+class Macro(NamedTuple):
+    name: str
+    params: List[str]
+    defaults: Dict[str, str]
+    body: List[Line]
+
+
+def load_source(name: str, text: str) -> SourceFile:
+    tokens = list(tokenize(text))
+
+    # The line break that ends an included file does not start another line
+    if name and len(tokens) > 1 and text.endswith('\n'):
+        tokens.pop()
+
+    return SourceFile(name, text, tokens)
+
+
+def __render_line(file: SourceFile, n: int, span: Optional[tuple]) -> str:
+    from rv32ias.preprocessor import asm_line_from_token
+    from rv32ias.preprocessor import render_code_space
+
+    lo = max(0, min(n - 1, len(file.tokens) - 3))
+    context = [asm_line_from_token(k, file.text, file.tokens[k], 0) for k in range(lo, min(lo + 3, len(file.tokens)))]
+
+    return render_code_space(context[n - lo], context, span)
+
+
+def file_err_ctx(files: List[SourceFile], file_id: int, n: int, span: tuple = None, note='') -> tuple:
+    file = files[file_id]
+    return n + 1, partial(__render_line, file, n, span), note, span, file.name or None
+
+
+def __map_point(subs: List[Tuple[int, int, int, int]], p: int, end: bool) -> int:
+    # Text around arguments maps one to one, a position inside one maps to the edge of its reference
+    delta = 0
+    for exp_off, exp_len, orig_off, orig_len in subs:
+        if p < exp_off or (end and p == exp_off):
+            break
+        if p < exp_off + exp_len or (end and p == exp_off + exp_len):
+            return orig_off + orig_len if end else orig_off
+        delta = orig_off + orig_len - exp_off - exp_len
+    return p + delta
+
+
+def map_span(subs: List[Tuple[int, int, int, int]], body_offset: int, span: tuple) -> tuple:
+    start = __map_point(subs, body_offset + span[0], False)
+    end = __map_point(subs, body_offset + span[0] + span[1], True)
+    return start - body_offset, max(end - start, 0)
+
+
+class SourceMap:
+    # Where every line of the expanded program comes from: a file and a line of it, counted from 0
+    def __init__(self, files: List[SourceFile]):
+        self.files = files
+        self.file_ids = array('I')
+        self.line_nos = array('I')
+        # Only lines with macro arguments put in
+        self.subs: Dict[int, List[Tuple[int, int, int, int]]] = {}
+
+    def add(self, file_id: int, line_no: int, subs: Optional[list] = None) -> None:
+        if subs:
+            self.subs[len(self.line_nos)] = subs
+        self.file_ids.append(file_id)
+        self.line_nos.append(line_no)
+
+    def locate(self, i: int) -> Tuple[str, int]:
+        return self.files[self.file_ids[i]].name, self.line_nos[i]
+
+    def err_ctx(self, i: int, span: tuple = None, note='') -> tuple:
+        file_id, n = self.file_ids[i], self.line_nos[i]
+
+        if span is not None and i in self.subs:
+            token = self.files[file_id].tokens[n]
+            span = map_span(self.subs[i], token.body - token.start, span)
+
+        return file_err_ctx(self.files, file_id, n, span, note)
+
+
+class IncludeCache:
+    # Included files by absolute path, along with the modification time and size they were read at. A
+    # header included by many sources is read and lexed once per process, or once per --serve session
+    def __init__(self):
+        self.__files: Dict[str, Tuple[int, int, SourceFile]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: str) -> SourceFile:
+        st = os.stat(path)
+
+        entry = self.__files.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        with open(path, 'r') as f:
+            file = load_source(path, f.read())
+        self.__files[path] = (st.st_mtime_ns, st.st_size, file)
+
+        return file
+
+    def clear(self) -> None:
+        self.__files.clear()
+
+
+include_cache = IncludeCache()
+
+
+def include_files(asm_txt: str, base_dir: Optional[str] = None,
+                  cache: IncludeCache = include_cache) -> List[Tuple[str, Optional[str]]]:
+    # (path, text) of every file a source pulls in through .include, nested ones too, for cache keys. The
+    # text is None when the file cannot be read
+    files, seen = [], set()
+    pending = [(asm_txt, base_dir)]
+
+    while pending:
+        text, text_dir = pending.pop()
+        for path in __INCLUDE_RE.findall(text):
+            path = os.path.abspath(os.path.join(text_dir or '', os.path.expanduser(path)))
+            if path in seen:
+                continue
+            seen.add(path)
+
+            try:
+                included = cache.load(path).text
+            except OSError:
+                # Reported when the source is assembled
+                included = None
+            else:
+                pending.append((included, os.path.dirname(path)))
+            files.append((path, included))
+
+    return files
+
+
+def directive_name(text: str, token: Token) -> str:
+    end = token.args if token.args >= 0 else token.body_end
+    return text[token.body - token.start:end - token.start].rstrip()
+
+
+class MacroExpander:
+    # Lines come out one at a time as the parser takes them: includes are walked in place and macro
+    # bodies expanded on the fly, so no expansion is ever held whole
+    def __init__(self, source: SourceFile, base_dir: Optional[str] = None, cache: IncludeCache = include_cache,
+                 stats: Optional[AsmStats] = None):
+        self.files = [source]
+        self.source_map = SourceMap(self.files)
+        self.__file_ids = {source.name: 0}
+        self.__base_dir = base_dir
+        self.__cache = cache
+        self.__stats = stats
+
+        self.__macros: Dict[str, Macro] = {}
+        # Expansions so far, `\@` in a body is replaced by it
+        self.__expansions = 0
+        # Files being included, to catch cycles
+        self.__including: List[str] = []
+
+    def __err_ctx(self, line: Line, span: tuple = None, note='') -> tuple:
+        _, _, file_id, n, _ = line
+        return file_err_ctx(self.files, file_id, n, span, note)
+
+    def lines(self) -> Iterator[Line]:
+        return self.__walk(self.__file_lines(0), 0, self.__base_dir)
+
+    def __file_lines(self, file_id: int) -> Iterator[Line]:
+        file = self.files[file_id]
+        text = file.text
+        for n, token in enumerate(file.tokens):
+            yield text[token.start:token.end], token, file_id, n, None
+
+    def __walk(self, lines: Iterator[Line], depth: int, base_dir: Optional[str]) -> Iterator[Line]:
+        macros = self.__macros
+        directive, instruction = AsmLineType.DIRECTIVE, AsmLineType.INSTRUCTION
+
+        for line in lines:
+            text, token = line[0], line[1]
+
+            if token.type is directive:
+                name = directive_name(text, token)
+
+                # Handle include
+                if name == INCLUDE:
+                    yield from self.__include(line, depth, base_dir)
+                    continue
+
+                # Handle macro definition, its body is taken from the same lines
+                if name == MACRO:
+                    self.__define(line, lines)
+                    continue
+
+                # ! Raise when closing a macro that was never opened
+                if name == ENDM:
+                    raise AsmInvalidSyntaxError(*self.__err_ctx(line, None, '`.endm` without `.macro`'))
+
+            # Handle macro invocation
+            elif token.type is instruction and macros:
+                macro = macros.get(directive_name(text, token))
+                if macro is not None:
+                    yield from self.__invoke(macro, line, depth, base_dir)
+                    continue
+
+            yield line
+
+    def __args(self, line: Line) -> Tuple[str, int]:
+        # Argument text of a line, and its offset in the line body
+        text, token = line[0], line[1]
+        if token.args < 0:
+            return '', 0
+        return text[token.args - token.start:token.body_end - token.start], token.args - token.body
+
+    def __include(self, line: Line, depth: int, base_dir: Optional[str]) -> Iterator[Line]:
+        args, args_offset = self.__args(line)
+        path = args[1:-1] if len(args) > 1 and args[0] == args[-1] == '"' else args
+        span = (args_offset, len(args))
+
+        # ! Raise when the file name is missing
+        if not path:
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, None, '`.include` takes a file name'))
+
+        path = os.path.abspath(os.path.join(base_dir or '', os.path.expanduser(path)))
+
+        # ! Raise when a file includes itself, directly or not
+        if path in self.__including or depth >= MAX_DEPTH:
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, span, 'File includes itself'))
+
+        try:
+            file = self.__cache.load(path)
+        except OSError as e:
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, span, f'Cannot read file ({e.strerror})'))
+
+        if self.__stats is not None:
+            self.__stats.count('includes')
+
+        if (file_id := self.__file_ids.get(path)) is None:
+            file_id = self.__file_ids[path] = len(self.files)
+            self.files.append(file)
+
+        self.__including.append(path)
+        try:
+            yield from self.__walk(self.__file_lines(file_id), depth + 1, os.path.dirname(path))
+        finally:
+            self.__including.pop()
+
+    def __define(self, line: Line, lines: Iterator[Line]) -> None:
+        args, args_offset = self.__args(line)
+        names = [arg for arg in re.split(r'[\s,]+', args) if arg]
+
+        # ! Raise when the macro has no valid name
+        if not names or not NAME_RE.fullmatch(names[0]):
+            span = (args_offset, len(args)) if args else None
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, span, 'Invalid macro name'))
+
+        name, params, defaults = names[0], [], {}
+        for arg in names[1:]:
+            param, eq, default = arg.partition('=')
+
+            # ! Raise when a parameter is not a name, or named twice
+            if not NAME_RE.fullmatch(param) or param in params:
+                span = (args_offset + args.find(arg), len(arg))
+                raise AsmInvalidSyntaxError(*self.__err_ctx(line, span, 'Invalid macro parameter'))
+
+            params.append(param)
+            if eq:
+                defaults[param] = default
+
+        # ! Raise when the macro is defined twice
+        if name in self.__macros:
+            span = (args_offset + args.find(name), len(name))
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, span, f'Macro `{name}` already defined'))
+
+        # Body up to the matching .endm, macros defined inside it only come to be once it is expanded
+        body, nesting = [], 0
+        for body_line in lines:
+            if body_line[1].type is AsmLineType.DIRECTIVE:
+                directive = directive_name(body_line[0], body_line[1])
+                if directive == ENDM and not nesting:
+                    break
+                nesting += directive == MACRO
+                nesting -= directive == ENDM
+            body.append(body_line)
+        else:
+            # ! Raise when the file ends inside the macro
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, None, f'Macro `{name}` is missing `.endm`'))
+
+        self.__macros[name] = Macro(name, params, defaults, body)
+
+    def __invoke(self, macro: Macro, line: Line, depth: int, base_dir: Optional[str]) -> Iterator[Line]:
+        args, args_offset = self.__args(line)
+        values = [value.strip() for value in args.split(',')] if args else []
+
+        # ! Raise when there are more arguments than parameters
+        if len(values) > len(macro.params):
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, (args_offset, len(args)), 'Too many macro arguments'))
+
+        bound = {}
+        for j, param in enumerate(macro.params):
+            value = values[j] if j < len(values) and values[j] else macro.defaults.get(param)
+
+            # ! Raise when a parameter without default is left out
+            if value is None:
+                note = f'Missing macro argument `{param}`'
+                raise AsmInvalidSyntaxError(*self.__err_ctx(line, (0, len(macro.name)), note))
+            bound[param] = value
+
+        # ! Raise when macros expand each other without end
+        if depth >= MAX_DEPTH:
+            raise AsmInvalidSyntaxError(*self.__err_ctx(line, (0, len(macro.name)), 'Macros nested too deep'))
+
+        self.__expansions += 1
+        if self.__stats is not None:
+            self.__stats.count('macro_expansions')
+
+        body = self.__substitute(macro, bound, str(self.__expansions))
+        yield from self.__walk(body, depth + 1, base_dir)
+
+    def __substitute(self, macro: Macro, bound: Dict[str, str], expansion: str) -> Iterator[Line]:
+        for line in macro.body:
+            text, token, file_id, n, _ = line
+
+            # Lines without a parameter reference in their code are passed through as they are
+            code_end = token.body_end - token.start
+            if token.type is AsmLineType.COMMENT or '\\' not in text[:code_end]:
+                yield line
+                continue
+
+            pieces, subs, pos, out = [], [], 0, 0
+            for m in PARAM_RE.finditer(text, 0, code_end):
+                key = m.group(1)
+                value = expansion if key == '@' else '' if key == '()' else bound.get(key)
+
+                # ! Raise when referring to a parameter the macro does not have
+                if value is None:
+                    span = (m.start() - (token.body - token.start), m.end() - m.start())
+                    raise AsmInvalidSyntaxError(*self.__err_ctx(line, span, f'Unknown macro parameter `{key}`'))
+
+                pieces.append(text[pos:m.start()])
+                out += m.start() - pos
+                subs.append((out, len(value), m.start(), m.end() - m.start()))
+                pieces.append(value)
+                out += len(value)
+                pos = m.end()
+
+            pieces.append(text[pos:])
+            expanded = ''.join(pieces)
+            yield expanded, tokenize_line(expanded), file_id, n, subs
@@ -0,0 +1,149 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable
+
+__all__ = [
+    'OutputFormat',
+    'OUTPUT_FORMATS',
+    'to_le_bytes',
+    'encode_hex',
+    'encode_binary',
+    'encode_raw',
+    'encode_ihex',
+    'encode_readmemh',
+    'encode_readmemb',
+    'encode_elf',
+]
+
+# Every encoder turns the whole image into one buffer, written with a single call
+
+EM_RISCV = 243
+
+__ELF_HEADER = struct.Struct('<16sHHIIIIIHHHHHH')
+__ELF_PHDR = struct.Struct('<IIIIIIII')
+__ELF_IDENT = b'\x7fELF\x01\x01\x01' + bytes(9)
+
+# Data bytes per Intel HEX record
+IHEX_RECORD_SIZE = 16
+
+
+def __as_words(words: Iterable[int]) -> array:
+    return words if isinstance(words, array) and words.typecode == 'I' else array('I', words)
+
+
+def __to_be_bytes(words: array) -> bytes:
+    if sys.byteorder == 'little':
+        words = array(words.typecode, words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def to_le_bytes(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def __hex_lines(words: array) -> bytes:
+    # Big endian bytes read as hex are the words' hex digits, 4 bytes a line
+    if not words:
+        return b''
+    return __to_be_bytes(words).hex('\n', 4).upper().encode() + b'\n'
+
+
+def __binary_lines(words: array) -> bytes:
+    if not words:
+        return b''
+
+    # Format the whole image as one number, then lay its digits out 32 a line
+    digits = format(int.from_bytes(__to_be_bytes(words), 'big'), f'0{len(words) * 32}b').encode()
+    lines = bytearray(b'\n') * (len(words) * 33)
+    for j in range(32):
+        lines[j::33] = digits[j::32]
+
+    return bytes(lines)
+
+
+def encode_hex(words: Iterable[int], base: int = 0) -> bytes:
+    return __hex_lines(__as_words(words))
+
+
+def encode_binary(words: Iterable[int], base: int = 0) -> bytes:
+    return __binary_lines(__as_words(words))
+
+
+def encode_raw(words: Iterable[int], base: int = 0) -> bytes:
+    return to_le_bytes(__as_words(words))
+
+
+def __ihex_record(record_type: int, addr: int, data: bytes) -> str:
+    record = bytes((len(data), addr >> 8 & 0xFF, addr & 0xFF, record_type)) + data
+    return f':{(record + bytes((-sum(record) & 0xFF,))).hex().upper()}\n'
+
+
+def encode_ihex(words: Iterable[int], base: int = 0) -> bytes:
+    data = to_le_bytes(__as_words(words))
+    records = []
+    segment = None
+
+    for offset in range(0, len(data), IHEX_RECORD_SIZE):
+        addr = base + offset
+
+        # Extended linear address record whenever the upper 16 bits change
+        if addr >> 16 != segment:
+            segment = addr >> 16
+            records.append(__ihex_record(0x04, 0, segment.to_bytes(2, 'big')))
+
+        records.append(__ihex_record(0x00, addr & 0xFFFF, data[offset:offset + IHEX_RECORD_SIZE]))
+
+    records.append(__ihex_record(0x01, 0, b''))
+
+    return ''.join(records).encode()
+
+
+def encode_readmemh(words: Iterable[int], base: int = 0) -> bytes:
+    # Address markers count memory words, not bytes
+    return f'@{base // 4:08X}\n'.encode() + __hex_lines(__as_words(words))
+
+
+def encode_readmemb(words: Iterable[int], base: int = 0) -> bytes:
+    return f'@{base // 4:08X}\n'.encode() + __binary_lines(__as_words(words))
+
+
+def encode_elf(words: Iterable[int], base: int = 0) -> bytes:
+    text = to_le_bytes(__as_words(words))
+    text_offset = __ELF_HEADER.size + __ELF_PHDR.size
+
+    # Executable with a single read + execute segment and no section headers
+    header = __ELF_HEADER.pack(
+        __ELF_IDENT, 2, EM_RISCV, 1, base, __ELF_HEADER.size, 0, 0,
+        __ELF_HEADER.size, __ELF_PHDR.size, 1, 0, 0, 0
+    )
+    phdr = __ELF_PHDR.pack(1, text_offset, base, base, len(text), len(text), 0x5, 4)
+
+    return header + phdr + text
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    name: str
+    suffix: str
+    # Raw bytes rather than text, not fit for a terminal
+    is_binary: bool
+    encode: Callable[..., bytes]
+
+
+OUTPUT_FORMATS: Dict[str, OutputFormat] = {
+    fmt.name: fmt for fmt in (
+        OutputFormat('hex', '.hex', False, encode_hex),
+        OutputFormat('binary', '.bin.txt', False, encode_binary),
+        OutputFormat('raw', '.bin', True, encode_raw),
+        OutputFormat('ihex', '.ihex', False, encode_ihex),
+        OutputFormat('readmemh', '.mem', False, encode_readmemh),
+        OutputFormat('readmemb', '.memb', False, encode_readmemb),
+        OutputFormat('elf', '.elf', True, encode_elf),
+    )
+}
@@ -0,0 +1,273 @@
+import mmap
+import os
+import re
+import sys
+from array import array
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from rv32ias.exceptions import AsmInvalidInstructionError
+from rv32ias.exceptions import AsmInvalidSyntaxError
+from rv32ias.formats import to_le_bytes
+from rv32ias.models import Program
+
+__all__ = [
+    'TEXT',
+    'Directive',
+    'Section',
+    'SectionLayout',
+    'MemoryImage',
+    'parse_directive',
+    'align_up',
+    'layout_text',
+    'incbin_paths',
+]
+
+TEXT = '.text'
+
+# Padding inside .text is filled with `addi zero, zero, 0`
+NOP = 0x00000013
+
+SECTION_DIRECTIVES = ('.text', '.data', '.rodata', '.bss')
+# Labels made visible to other units, see rv32ias.linker
+SYMBOL_DIRECTIVES = ('.globl', '.global')
+# Bytes per value of the data directives
+DATA_DIRECTIVES = {'.word': 4, '.half': 2, '.byte': 1}
+
+__ARG_RE = re.compile(r'[^,\s](?:[^,]*[^,\s])?')
+__LABEL_RE = re.compile(r'[A-Za-z]\w*')
+__INCBIN_RE = re.compile(r'^[^\S\n]*\.incbin[^\S\n]+"?([^",#\s]+)', re.MULTILINE)
+
+
+class Directive(NamedTuple):
+    name: str
+    # Values of .word/.half/.byte (labels only in .word), the fill byte of .space, or the path of .incbin
+    values: Union[list, int, str, None]
+    # Bytes laid out, not counting alignment padding
+    size: int
+    # Alignment in bytes for .align/.balign, 1 otherwise
+    align: int = 1
+    # Switches the section when set
+    section: Optional[str] = None
+    # Bytes of the .incbin file skipped
+    skip: int = 0
+
+
+@dataclass
+class Section:
+    name: str
+    base: int = 0
+    size: int = 0
+    align: int = 4
+
+
+@dataclass
+class SectionLayout:
+    # .text first, then the other sections in the order they first show up
+    sections: List[Section]
+    # (line, section, offset, directive) of every directive that lays out bytes. Lines of .text are at
+    # their line address instead, which is only settled once the code is
+    items: List[Tuple[int, int, int, Directive]]
+    # (line, alignment) of the .align lines in .text, padded again whenever the code moves
+    text_aligns: List[Tuple[int, int]]
+    # Line -> (section, offset) of the labels outside .text
+    data_lines: Dict[int, Tuple[int, int]]
+    # Label -> (section, offset), filled in along with the jump table
+    data_labels: Dict[str, Tuple[int, int]]
+    # (line, label) of every label exported with .globl
+    exports: List[Tuple[int, str]] = field(default_factory=list)
+
+    def place(self, text_size: int) -> None:
+        # Sections go behind the code, one after the other
+        end = text_size
+        for section in self.sections[1:]:
+            section.base = align_up(end, section.align)
+            end = section.base + section.size
+        self.sections[0].size = text_size
+
+    def address(self, section: int, offset: int) -> int:
+        return self.sections[section].base + offset
+
+    @property
+    def size(self) -> int:
+        return max(section.base + section.size for section in self.sections)
+
+
+def align_up(value: int, alignment: int) -> int:
+    return value + (-value % alignment)
+
+
+def layout_text(program: Program, aligns: Sequence[Tuple[int, int]]) -> None:
+    # Line addresses from the line sizes, padding every .align line to its alignment on the way
+    sizes = program.im_sizes
+    im_ptrs = array('I')
+    addr, start = 0, 0
+
+    for line, alignment in aligns:
+        im_ptrs.extend(accumulate(sizes[start:line], initial=addr))
+        addr = im_ptrs[-1]
+        sizes[line] = -addr % alignment
+        addr += sizes[line]
+        start = line + 1
+
+    im_ptrs.extend(accumulate(sizes[start:], initial=addr))
+    im_ptrs.pop()
+    program.im_ptrs = im_ptrs
+
+
+def incbin_paths(asm_txt: str, base_dir: Optional[str] = None) -> List[str]:
+    # Files a source pulls in, found without parsing it, for cache keys
+    return [os.path.join(base_dir or '', os.path.expanduser(path)) for path in __INCBIN_RE.findall(asm_txt)]
+
+
+def __int_arg(idx: int, args: List[str], pos: List[int], j: int, err_ctx, note: str = 'Invalid value') -> int:
+    try:
+        return int(args[j], 0)
+    except ValueError:
+        raise AsmInvalidSyntaxError(*err_ctx(idx, (pos[j], len(args[j])), note))
+
+
+def parse_directive(idx: int, body: str, args_offset: int, err_ctx, base_dir: Optional[str] = None) -> Directive:
+    name = body[:args_offset].rstrip() if args_offset else body
+    args_txt = body[args_offset:] if args_offset else ''
+
+    # Comma separated arguments and their offsets in the line body
+    matches = list(__ARG_RE.finditer(args_txt))
+    args, pos = [m.group() for m in matches], [args_offset + m.start() for m in matches]
+
+    # ! Raise when an argument is missing between commas
+    if args_txt and len(args) != args_txt.count(',') + 1:
+        raise AsmInvalidSyntaxError(*err_ctx(idx, (args_offset, len(args_txt)), 'Invalid directive arguments'))
+
+    def expect(lo: int, hi: int) -> None:
+        # ! Raise when the directive takes a different number of arguments
+        if not lo <= len(args) <= hi:
+            span = (args_offset, len(args_txt)) if args else (0, len(name))
+            count = f'{lo}' if lo == hi else f'{lo} to {hi}'
+            raise AsmInvalidSyntaxError(*err_ctx(idx, span, f'`{name}` takes {count} argument(s)'))
+
+    if name in SECTION_DIRECTIVES:
+        expect(0, 0)
+        return Directive(name, None, 0, section=name)
+
+    if name == '.section':
+        expect(1, 1)
+        return Directive(name, None, 0, section=args[0])
+
+    if name in SYMBOL_DIRECTIVES:
+        expect(1, len(args) or 1)
+        for j, arg in enumerate(args):
+            if not __LABEL_RE.fullmatch(arg):
+                raise AsmInvalidSyntaxError(*err_ctx(idx, (pos[j], len(arg)), 'Invalid label'))
+        return Directive(name, args, 0)
+
+    if name in DATA_DIRECTIVES:
+        width = DATA_DIRECTIVES[name]
+        if not args:
+            raise AsmInvalidSyntaxError(*err_ctx(idx, (0, len(name)), f'`{name}` takes at least one value'))
+
+        values = []
+        for j, arg in enumerate(args):
+            # Labels stand for their address, which is only known once every section is placed
+            if name == '.word' and __LABEL_RE.fullmatch(arg):
+                values.append(arg)
+                continue
+
+            value = __int_arg(idx, args, pos, j, err_ctx)
+            if not -(1 << (width * 8 - 1)) <= value < 1 << (width * 8):
+                raise AsmInvalidSyntaxError(*err_ctx(idx, (pos[j], len(arg)), f'Value does not fit in {width} byte(s)'))
+            values.append(value & ((1 << (width * 8)) - 1))
+
+        return Directive(name, values, width * len(values))
+
+    if name in ('.space', '.zero'):
+        expect(1, 2 if name == '.space' else 1)
+        size = __int_arg(idx, args, pos, 0, err_ctx)
+        fill = __int_arg(idx, args, pos, 1, err_ctx) & 0xFF if len(args) > 1 else 0
+        if size < 0:
+            raise AsmInvalidSyntaxError(*err_ctx(idx, (pos[0], len(args[0])), 'Size must not be negative'))
+        return Directive(name, fill, size)
+
+    if name in ('.align', '.p2align', '.balign'):
+        expect(1, 1)
+        value = __int_arg(idx, args, pos, 0, err_ctx)
+        alignment = value if name == '.balign' else 1 << value if 0 <= value < 32 else 0
+        if alignment <= 0 or alignment & (alignment - 1):
+            raise AsmInvalidSyntaxError(*err_ctx(idx, (pos[0], len(args[0])), 'Alignment must be a power of two'))
+        return Directive(name, None, 0, align=alignment)
+
+    if name == '.incbin':
+        expect(1, 3)
+        path = args[0][1:-1] if len(args[0]) > 1 and args[0][0] == args[0][-1] == '"' else args[0]
+        path = os.path.join(base_dir or '', os.path.expanduser(path))
+
+        try:
+            file_size = os.stat(path).st_size
+        except OSError as e:
+            raise AsmInvalidSyntaxError(*err_ctx(idx, (pos[0], len(args[0])), f'Cannot read file ({e.strerror})'))
+
+        skip = __int_arg(idx, args, pos, 1, err_ctx) if len(args) > 1 else 0
+        count = __int_arg(idx, args, pos, 2, err_ctx) if len(args) > 2 else file_size - skip
+        if not 0 <= skip <= file_size or not 0 <= count <= file_size - skip:
+            span = (args_offset, len(args_txt))
+            raise AsmInvalidSyntaxError(*err_ctx(idx, span, 'Range is past the end of the file'))
+
+        return Directive(name, path, count, skip=skip)
+
+    # ! Raise when directive not supported
+    raise AsmInvalidInstructionError(*err_ctx(idx, (0, len(name)), f'Directive `{name}` not supported'))
+
+
+class MemoryImage:
+    # One preallocated buffer for every section, filled through memoryview slices: each write is a single copy
+    # from its source, with no intermediate bytes objects and no per byte loops
+    def __init__(self, size: int, sections: List[Section]):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.sections = sections
+
+    def write(self, addr: int, data) -> None:
+        self.view[addr:addr + len(data)] = data
+
+    def fill(self, addr: int, size: int, value: int) -> None:
+        if value:
+            self.view[addr:addr + size] = bytes((value,)) * size
+
+    def pad(self, addr: int, size: int) -> None:
+        # Alignment padding in code is made of nops where it can be
+        start = align_up(addr, 4)
+        words = (addr + size - start) // 4 if start <= addr + size else 0
+        if words:
+            self.write(start, to_le_bytes(array('I', [NOP])) * words)
+
+    def include(self, addr: int, path: str, skip: int, count: int) -> None:
+        # The file is mapped rather than read, and copied once, straight from the page cache into the image
+        if not count:
+            return
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                self.view[addr:addr + count] = view[skip:skip + count]
+
+    def put(self, addr: int, directive: Directive, jump_targets: Dict[str, int]) -> None:
+        if directive.name == '.incbin':
+            self.include(addr, directive.values, directive.skip, directive.size)
+        elif directive.name in ('.space', '.zero'):
+            self.fill(addr, directive.size, directive.values)
+        elif directive.name == '.word':
+            # Labels of other units are left at 0 for the linker
+            values = [jump_targets.get(v, 0) if isinstance(v, str) else v for v in directive.values]
+            self.write(addr, to_le_bytes(array('I', values)))
+        elif directive.name == '.half':
+            self.write(addr, to_le_bytes(array('H', directive.values)))
+        elif directive.name == '.byte':
+            self.write(addr, bytes(directive.values))
+
+    def words(self) -> array:
+        # The image as little endian words, copied out in one go
+        words = array('I')
+        words.frombytes(self.view[:len(self.data) // 4 * 4])
+        if sys.byteorder == 'big':
+            words.byteswap()
+        return words
@@ -1,13 +1,16 @@
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from functools import lru_cache
-from typing import Dict, Optional
+from functools import cached_property, lru_cache
+from typing import Dict, Optional, Union
 
 __all__ = [
     'InstType',
     'rv32i_inst_dict',
+    'pseudo_inst_dict',
     'reg_mapper',
+    'reg_table',
+    'reg_abi_names',
 ]
 
 
@@ -29,6 +32,11 @@ class InstDef:
     funct7: Optional[int]
     inst_arg_re: str
 
+    # Compiled on first use, most runs only ever see a few mnemonics
+    @cached_property
+    def inst_arg_pattern(self) -> re.Pattern:
+        return re.compile(self.inst_arg_re)
+
 
 @lru_cache(maxsize=32)
 def __gen_arg_regex(args: str) -> str:
@@ -95,21 +103,75 @@ __rv32i_instructions = [
 rv32i_inst_dict: Dict[str, InstDef] = {inst.inst: inst for inst in __rv32i_instructions}
 
 
+@dataclass
+class PseudoDef:
+    inst: str
+    inst_arg_re: str
+    # Instruction it stands for and the operands it fills in; None when the
+    # expansion depends on the operands and the layout (`li`, `la`, `call`)
+    base: Optional[str] = None
+    fixed: Dict[str, Union[str, int]] = field(default_factory=dict)
+
+    @cached_property
+    def inst_arg_pattern(self) -> re.Pattern:
+        return re.compile(self.inst_arg_re)
+
+
+__pseudo_instructions = [
+    # Group 1: Aliases of a single instruction
+    PseudoDef('nop', __gen_arg_regex(''), 'addi', {'rd': 'zero', 'rs1': 'zero', 'imm': 0}),
+    PseudoDef('mv', __gen_arg_regex('rd_rs1'), 'addi', {'imm': 0}),
+    PseudoDef('not', __gen_arg_regex('rd_rs1'), 'xori', {'imm': -1}),
+    PseudoDef('neg', __gen_arg_regex('rd_rs2'), 'sub', {'rs1': 'zero'}),
+    PseudoDef('seqz', __gen_arg_regex('rd_rs1'), 'sltiu', {'imm': 1}),
+    PseudoDef('snez', __gen_arg_regex('rd_rs2'), 'sltu', {'rs1': 'zero'}),
+
+    PseudoDef('beqz', __gen_arg_regex('rs1_label'), 'beq', {'rs2': 'zero'}),
+    PseudoDef('bnez', __gen_arg_regex('rs1_label'), 'bne', {'rs2': 'zero'}),
+    PseudoDef('bltz', __gen_arg_regex('rs1_label'), 'blt', {'rs2': 'zero'}),
+    PseudoDef('bgez', __gen_arg_regex('rs1_label'), 'bge', {'rs2': 'zero'}),
+    PseudoDef('blez', __gen_arg_regex('rs2_label'), 'bge', {'rs1': 'zero'}),
+    PseudoDef('bgtz', __gen_arg_regex('rs2_label'), 'blt', {'rs1': 'zero'}),
+    PseudoDef('bgt', __gen_arg_regex('rs2_rs1_label'), 'blt'),
+    PseudoDef('ble', __gen_arg_regex('rs2_rs1_label'), 'bge'),
+    PseudoDef('bgtu', __gen_arg_regex('rs2_rs1_label'), 'bltu'),
+    PseudoDef('bleu', __gen_arg_regex('rs2_rs1_label'), 'bgeu'),
+
+    PseudoDef('j', __gen_arg_regex('label'), 'jal', {'rd': 'zero'}),
+    PseudoDef('jr', __gen_arg_regex('rs1'), 'jalr', {'rd': 'zero', 'imm': 0}),
+    PseudoDef('ret', __gen_arg_regex(''), 'jalr', {'rd': 'zero', 'rs1': 'ra', 'imm': 0}),
+
+    # Group 2: One or two instructions, picked by the relaxation pass
+    PseudoDef('li', __gen_arg_regex('rd_imm')),
+    PseudoDef('la', __gen_arg_regex('rd_label')),
+    PseudoDef('call', __gen_arg_regex('label')),
+]
+
+pseudo_inst_dict: Dict[str, PseudoDef] = {inst.inst: inst for inst in __pseudo_instructions}
+
+
+# Index -> ABI name, for reverse lookups
+reg_abi_names = (
+    'zero', 'ra', 'sp', 'gp', 'tp', 't0', 't1', 't2',
+    's0', 's1', 'a0', 'a1', 'a2', 'a3', 'a4', 'a5',
+    'a6', 'a7', 's2', 's3', 's4', 's5', 's6', 's7',
+    's8', 's9', 's10', 's11', 't3', 't4', 't5', 't6',
+)
+
+# Name -> index, for every `xN` and ABI spelling
+reg_table: Dict[str, int] = {
+    **{f'x{i}': i for i in range(32)},
+    **{name: i for i, name in enumerate(reg_abi_names)},
+    'fp': 8,
+}
+
+
 def reg_mapper(reg: str) -> int:
-    if reg[0] == 'x':
-        if reg[1:].isdigit() and 0 <= int(reg[1:]) < 32:
-            return int(reg[1:])
-    else:
-        match reg:
-            case 'zero' | 'ra' | 'sp' | 'gp' | 'tp' | 's0' | 'fp' | 's1':
-                return {'zero': 0, 'ra': 1, 'sp': 2, 'gp': 3, 'tp': 4, 's0': 8, 'fp': 8, 's1': 9}[reg]
-            case 't0' | 't1' | 't2':
-                return 5 + int(reg[1:])
-            case 'a0' | 'a1' | 'a2' | 'a3' | 'a4' | 'a5' | 'a6' | 'a7':
-                return 10 + int(reg[1:])
-            case 's2' | 's3' | 's4' | 's5' | 's6' | 's7' | 's8' | 's9' | 's10' | 's11':
-                return 16 + int(reg[1:])
-            case 't3' | 't4' | 't5' | 't6':
-                return 25 + int(reg[1:])
+    if reg in reg_table:
+        return reg_table[reg]
+
+    # Zero padded spellings such as `x05`
+    if reg[:1] == 'x' and reg[1:].isdecimal() and int(reg[1:]) < 32:
+        return int(reg[1:])
 
     raise ValueError(f'Invalid register: {reg}')
@@ -0,0 +1,85 @@
+import re
+from typing import Iterator, NamedTuple
+
+from rv32ias.models import AsmLineType
+
+__all__ = [
+    'Token',
+    'tokenize',
+    'tokenize_line',
+    'shift_token',
+]
+
+# One match per source line. Horizontal whitespace is `[^\S\n]` so that no
+# match ever crosses a line break, and `\r` of CRLF sources is trimmed as
+# trailing whitespace. Every quantifier is possessive: words and gaps can
+# only be split one way, so the pattern never backtracks.
+LINE_RE = re.compile(r'''
+    ^[^\S\n]*+
+    (?:
+        (?P<inst>[^\s\#]++)
+        (?:[^\S\n]++(?P<args>[^\s\#]++(?:[^\S\n]++[^\s\#]++)*+))?+
+    )?+
+    [^\S\n]*+
+    (?P<comment>\#(?:[^\S\n]*+\S++)*+)?+
+    [^\S\n]*+$
+''', re.MULTILINE | re.VERBOSE)
+
+
+class Token(NamedTuple):
+    # Type of the line
+    type: AsmLineType
+    # Span of the whole line, without the line break
+    start: int
+    end: int
+    # Span of the clean line content
+    body: int
+    body_end: int
+    # Span of the tailing comment, (-1, -1) if there is none
+    tc: int = -1
+    tc_end: int = -1
+    # Start of the instruction arguments, -1 if there are none
+    args: int = -1
+
+
+def __make_token(m: re.Match, new=tuple.__new__) -> Token:
+    # Tokens are built through tuple.__new__, skipping the slower NamedTuple constructor
+    start, end = m.span()
+    tc, tc_end = m.span(3)
+
+    body, body_end = m.span(1)
+    if body >= 0:
+        args, args_end = m.span(2)
+        if args >= 0:
+            body_end = args_end
+
+        # A line whose code ends with a colon declares a label
+        if m.string[body_end - 1] == ':':
+            return new(Token, (AsmLineType.LABEL, start, end, body, body_end, tc, tc_end, -1))
+
+        if m.string[body] == '.':
+            return new(Token, (AsmLineType.DIRECTIVE, start, end, body, body_end, tc, tc_end, args))
+
+        return new(Token, (AsmLineType.INSTRUCTION, start, end, body, body_end, tc, tc_end, args))
+
+    if tc >= 0:
+        return new(Token, (AsmLineType.COMMENT, start, end, tc, tc_end, -1, -1, -1))
+
+    return new(Token, (AsmLineType.EMPTY, start, end, start, end, -1, -1, -1))
+
+
+def tokenize(text: str) -> Iterator[Token]:
+    return map(__make_token, LINE_RE.finditer(text))
+
+
+def tokenize_line(line: str) -> Token:
+    return __make_token(LINE_RE.match(line))
+
+
+def shift_token(token: Token, delta: int, new=tuple.__new__) -> Token:
+    # The same line moved `delta` characters further into a text, missing spans stay at -1
+    t_type, start, end, body, body_end, tc, tc_end, args = token
+    if tc >= 0:
+        tc, tc_end = tc + delta, tc_end + delta
+    return new(Token, (t_type, start + delta, end + delta, body + delta, body_end + delta, tc, tc_end,
+                       args + delta if args >= 0 else -1))
@@ -0,0 +1,240 @@
+import hashlib
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, List, NamedTuple, Optional
+
+from rv32ias.assembler import patch_offset
+from rv32ias.cache import AsmCache
+from rv32ias.exceptions import AsmLinkError
+from rv32ias.exceptions import AsmParseError
+from rv32ias.image import TEXT
+from rv32ias.image import MemoryImage
+from rv32ias.image import Section
+from rv32ias.image import align_up
+from rv32ias.models import Reloc
+from rv32ias.objfile import ObjectUnit
+from rv32ias.objfile import pack_unit
+from rv32ias.objfile import unpack_unit
+from rv32ias.pipeline import load_asm
+from rv32ias.relax import fits_branch
+from rv32ias.relax import fits_imm12
+from rv32ias.relax import fits_jal
+from rv32ias.relax import split_imm
+
+__all__ = [
+    'UnitResult',
+    'LinkedImage',
+    'object_path',
+    'load_unit',
+    'save_unit',
+    'build_unit',
+    'build_units',
+    'link',
+]
+
+OBJECT_SUFFIX = '.o'
+
+__WORD = struct.Struct('<I')
+
+
+class UnitResult(NamedTuple):
+    asm_file: str
+    unit: Optional[ObjectUnit] = None
+    # False when the unit was up to date in the object directory
+    rebuilt: bool = False
+    error: Optional[str] = None
+
+
+class LinkedImage(NamedTuple):
+    words: array
+    # Exported label -> address
+    symbols: Dict[str, int]
+    image: MemoryImage
+
+
+def object_path(asm_file: str, obj_dir: str) -> str:
+    # Sources of the same name in different directories get objects of their own
+    tag = hashlib.sha1(os.path.abspath(asm_file).encode()).hexdigest()[:8]
+    stem = os.path.splitext(os.path.basename(asm_file))[0]
+    return os.path.join(obj_dir, f'{stem}-{tag}{OBJECT_SUFFIX}')
+
+
+def load_unit(path: str) -> Optional[ObjectUnit]:
+    try:
+        with open(path, 'rb') as f:
+            return unpack_unit(f.read())
+    except OSError:
+        return None
+
+
+def save_unit(path: str, unit: ObjectUnit) -> None:
+    obj_dir = os.path.dirname(path) or '.'
+    os.makedirs(obj_dir, exist_ok=True)
+
+    # Write aside and rename, so a build killed half way never leaves a truncated object behind
+    fd, tmp_path = tempfile.mkstemp(prefix='.obj.', suffix='.tmp', dir=obj_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pack_unit(unit))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def __source_key(asm_txt: str, asm_file: str) -> str:
+    return AsmCache.key(asm_txt, os.path.dirname(asm_file))
+
+
+def build_unit(asm_file: str, obj_dir: Optional[str] = None) -> UnitResult:
+    from rv32ias.preprocessor import AsmParser
+
+    try:
+        asm_txt = load_asm(asm_file)
+        key = __source_key(asm_txt, asm_file)
+
+        asm_parser = AsmParser(asm_txt, base_dir=os.path.dirname(asm_file), unit=True)
+        unit = asm_parser.object_unit(asm_file, key)
+
+        if obj_dir is not None:
+            save_unit(object_path(asm_file, obj_dir), unit)
+    except (FileNotFoundError, AsmParseError) as e:
+        return UnitResult(asm_file, error=str(e))
+    except OSError as e:
+        return UnitResult(asm_file, error=f"Error occurred while writing object:\n -> {e}")
+    except Exception as e:
+        # Any other failure stays with its unit, rather than ending the whole build from inside a worker
+        return UnitResult(asm_file, error=f"Error occurred while assembling:\n -> {type(e).__name__}: {e}")
+
+    return UnitResult(asm_file, unit, True)
+
+
+def build_units(asm_files: List[str], obj_dir: Optional[str] = None, jobs: int = 1) -> List[UnitResult]:
+    # Objects carry the cache key of their source: only units whose source, included files or assembler
+    # changed are assembled again, in parallel
+    results: List[Optional[UnitResult]] = [None] * len(asm_files)
+
+    if obj_dir is not None:
+        for j, asm_file in enumerate(asm_files):
+            unit = load_unit(object_path(asm_file, obj_dir))
+            try:
+                if unit is not None and unit.key == __source_key(load_asm(asm_file), asm_file):
+                    results[j] = UnitResult(asm_file, unit)
+            except FileNotFoundError:
+                # Reported by build_unit
+                pass
+
+    stale = [j for j, result in enumerate(results) if result is None]
+    args = ([asm_files[j] for j in stale], [obj_dir] * len(stale))
+
+    if jobs == 1 or len(stale) <= 1:
+        built = list(map(build_unit, *args))
+    else:
+        # Only loaded here, starting the process pool machinery is slow
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            built = list(executor.map(build_unit, *args, chunksize=max(1, len(stale) // (jobs * 8))))
+
+    for j, result in zip(stale, built):
+        results[j] = result
+
+    return results
+
+
+def __patch(word: int, reloc: int, value: int) -> int:
+    if reloc == Reloc.PCREL:
+        return patch_offset(word, value)
+    if reloc == Reloc.HI20:
+        return (word & 0xFFF) | (split_imm(value)[0] << 12)
+    if reloc == Reloc.LO12:
+        return (word & 0xFFFFF) | ((split_imm(value)[1] & 0xFFF) << 20)
+    if reloc == Reloc.ABS12:
+        return (word & 0xFFFFF) | ((value & 0xFFF) << 20)
+    return value & 0xFFFFFFFF
+
+
+def __fits(word: int, reloc: int, value: int) -> bool:
+    if reloc == Reloc.PCREL:
+        return fits_branch(value) if word & 0x7F == 0b1100011 else fits_jal(value)
+    return reloc != Reloc.ABS12 or fits_imm12(value)
+
+
+def link(units: List[ObjectUnit]) -> LinkedImage:
+    # Sections of the same name are laid out together, in unit order: .text first, then the others in the
+    # order they first show up. Each unit's sections move as a whole, so only relocations need patching
+    order: Dict[str, int] = {TEXT: 0}
+    for unit in units:
+        for section in unit.sections:
+            order.setdefault(section.name, len(order))
+
+    pieces: List[List[tuple]] = [[] for _ in order]
+    for u, unit in enumerate(units):
+        for s, section in enumerate(unit.sections):
+            pieces[order[section.name]].append((u, s, section))
+
+    # Address of every unit section, and the gaps in .text padded with nops
+    bases = [[0] * len(unit.sections) for unit in units]
+    sections, text_gaps = [], []
+    end = 0
+    for name, group in zip(order, pieces):
+        start = addr = align_up(end, max((section.align for *_, section in group), default=4))
+        for u, s, section in group:
+            aligned = align_up(addr, section.align)
+            if name == TEXT and aligned > addr:
+                text_gaps.append((addr, aligned - addr))
+            bases[u][s] = aligned
+            addr = aligned + section.size
+        sections.append(Section(name, start, addr - start))
+        end = addr
+
+    # Global symbol index
+    symbols: Dict[str, int] = {}
+    owners: Dict[str, str] = {}
+    for u, unit in enumerate(units):
+        for label in unit.exports:
+            # ! Raise when two units export the same label
+            if label in symbols:
+                raise AsmLinkError(unit.name, 0, f'Label `{label}` also exported by {owners[label]}')
+            section, offset = unit.symbols[label]
+            symbols[label], owners[label] = bases[u][section] + offset, unit.name
+
+    image = MemoryImage(align_up(end, 4), sections)
+    for u, unit in enumerate(units):
+        for s, section in enumerate(unit.sections):
+            if section.data:
+                image.write(bases[u][s], section.data)
+    for addr, size in text_gaps:
+        image.pad(addr, size)
+
+    # Relocations are patched in place, one word at a time
+    data = image.data
+    for u, unit in enumerate(units):
+        local = unit.symbols
+        for r in unit.relocations:
+            if r.symbol in local:
+                section, offset = local[r.symbol]
+                target = bases[u][section] + offset
+            elif r.symbol in symbols:
+                target = symbols[r.symbol]
+            else:
+                # ! Raise when no unit exports the label
+                raise AsmLinkError(unit.name, r.line, f'Undefined label `{r.symbol}`')
+
+            addr = bases[u][r.section] + r.offset
+            word = __WORD.unpack_from(data, addr)[0]
+            value = target - addr if r.reloc == Reloc.PCREL else target
+
+            # ! Raise when the label is out of reach of its instruction
+            if not __fits(word, r.reloc, value):
+                raise AsmLinkError(unit.name, r.line, f'Label `{r.symbol}` out of range')
+
+            __WORD.pack_into(data, addr, __patch(word, r.reloc, value))
+
+    return LinkedImage(image.words(), symbols, image)
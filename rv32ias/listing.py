@@ -0,0 +1,109 @@
+from typing import Dict, Iterator, NamedTuple, Optional, TextIO
+
+from rv32ias.models import LINE_TYPE_IDS
+from rv32ias.models import AsmLineType
+from rv32ias.preprocessor import AsmParser
+
+__all__ = [
+    'ListingWidths',
+    'listing_widths',
+    'iter_listing',
+    'write_listing',
+]
+
+# Rows handed to the writer at once
+CHUNK_LINES = 8192
+
+
+class ListingWidths(NamedTuple):
+    label: int
+    asm: int
+
+
+def __label_table(asm_parser: AsmParser) -> Dict[int, str]:
+    # Instruction memory address -> jump label(s)
+    jump_table = {}
+    for label, addr in asm_parser.jump_table.items():
+        jump_table[addr] = jump_table[addr] + f', {label}' if addr in jump_table else label
+    return jump_table
+
+
+def listing_widths(asm_parser: AsmParser, pretty: Optional[str] = None) -> ListingWidths:
+    program = asm_parser.program
+    line_starts, n = program.line_starts, len(program.line_starts)
+
+    if pretty:
+        end = len(program.source)
+        asm = max(
+            ((line_starts[i + 1] - 1 if i + 1 < n else end) - line_starts[i] for i in program.inst_lines), default=0
+        )
+    else:
+        body_lens = program.body_lens
+        asm = max((body_lens[i] for i in program.inst_lines), default=0)
+
+    label = max([len(target) for target in __label_table(asm_parser).values()] + [5])
+
+    return ListingWidths(label, asm)
+
+
+def iter_listing(asm_parser: AsmParser, pretty: Optional[str] = None,
+                 widths: Optional[ListingWidths] = None) -> Iterator[str]:
+    # Rows are produced one at a time, fixed widths skip the sizing pass altogether
+    program = asm_parser.program
+    machine_codes = asm_parser.machine_codes
+    jump_table = __label_table(asm_parser)
+    label_w, asm_w = widths or listing_widths(asm_parser, pretty)
+
+    yield f"{'Addr':^9} | {'Label':^{label_w}} | {'Hex':^8} | {'Bin':^32} | {'Assembly':^{asm_w}}\n"
+    yield f"{'-' * 9} | {'-' * label_w} | {'-' * 8} | {'-' * 32} | {'-' * asm_w}\n"
+
+    if not pretty:
+        im_ptrs = program.im_ptrs
+        line, im_ptr = -1, 0
+        for i in program.inst_lines:
+            # Lines expanded to several words show their assembly on the first one only
+            if i != line:
+                line, im_ptr, asm = i, im_ptrs[i], program.body(i)
+            else:
+                im_ptr, asm = im_ptr + 4, ''
+            # Words are looked up by address, data and padding may sit in between
+            machine_code = machine_codes[im_ptr >> 2]
+            yield (
+                f'+{im_ptr:08X} | {jump_table.get(im_ptr, ""):^{label_w}} |'
+                f' {machine_code:08X} | {machine_code:032b} | {asm}\n'
+            )
+        return
+
+    line_types, im_ptrs, im_sizes = program.line_types, program.im_ptrs, program.im_sizes
+    inst_type = LINE_TYPE_IDS[AsmLineType.INSTRUCTION]
+    blank = f'{"*":^9} | {"":^{label_w}} | {"*":^8} | {"*":^32} | '
+
+    for i in range(len(program.line_starts)):
+        rows = []
+        # Words of a line are found by its address, scheduled code is not in source order
+        if line_types[i] == inst_type:
+            for im_ptr in range(im_ptrs[i], im_ptrs[i] + im_sizes[i], 4):
+                machine_code = machine_codes[im_ptr >> 2]
+                rows.append(
+                    f'+{im_ptr:08X} | {jump_table.get(im_ptr, ""):^{label_w}} |'
+                    f' {machine_code:08X} | {machine_code:032b} | '
+                )
+
+        asm = program.line(i).colorize(asm_w) if pretty == 'rainbow' else program.raw_line(i)
+        yield f'{rows[0] if rows else blank}{asm}\n'
+        for row in rows[1:]:
+            yield f'{row}\n'
+
+
+def write_listing(asm_parser: AsmParser, out: TextIO, pretty: Optional[str] = None,
+                  widths: Optional[ListingWidths] = None) -> int:
+    # Returns the number of characters written
+    written = 0
+    chunk = []
+    for row in iter_listing(asm_parser, pretty, widths):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_LINES:
+            written += out.write(''.join(chunk))
+            chunk.clear()
+
+    return written + out.write(''.join(chunk))
@@ -1,9 +1,14 @@
+from array import array
 from dataclasses import dataclass
-from enum import Enum
-from typing import Optional
+from enum import Enum, IntEnum
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from rv32ias.isa import InstType
+from rv32ias.isa import reg_mapper
+from rv32ias.isa import rv32i_inst_dict
 
-@dataclass
+
+@dataclass(slots=True)
 class Instruction:
     idx: int
     inst: str
@@ -11,6 +16,18 @@ class Instruction:
     rs1: Optional[str] = None
     rs2: Optional[str] = None
     imm: Optional[int] = None
+    # Register numbers, resolved from the spellings above when not given
+    rd_num: Optional[int] = None
+    rs1_num: Optional[int] = None
+    rs2_num: Optional[int] = None
+
+    def __post_init__(self):
+        if self.rd is not None and self.rd_num is None:
+            self.rd_num = reg_mapper(self.rd)
+        if self.rs1 is not None and self.rs1_num is None:
+            self.rs1_num = reg_mapper(self.rs1)
+        if self.rs2 is not None and self.rs2_num is None:
+            self.rs2_num = reg_mapper(self.rs2)
 
 
 class AsmLineType(Enum):
@@ -18,9 +35,22 @@ class AsmLineType(Enum):
     COMMENT = 'COMMENT'
     LABEL = 'LABEL'
     INSTRUCTION = 'INSTRUCTION'
+    DIRECTIVE = 'DIRECTIVE'
+
 
+class Reloc(IntEnum):
+    # How a label reference becomes the immediate of its instruction
+    PCREL = 0
+    # Upper 20 / lower 12 bits of the absolute address, as split for lui + addi
+    HI20 = 1
+    LO12 = 2
+    # Absolute address that must fit the 12 bit immediate on its own
+    ABS12 = 3
+    # Absolute address as a whole data word, only ever left for the linker
+    ABS32 = 4
 
-@dataclass
+
+@dataclass(slots=True)
 class AsmLine:
     # Line number in the original assembly code
     idx: int
@@ -54,6 +84,7 @@ class AsmLine:
         main_color = (
             magenta if self.type == AsmLineType.LABEL else
             green if self.type == AsmLineType.INSTRUCTION else
+            yellow if self.type == AsmLineType.DIRECTIVE else
             cyan
         )
 
@@ -70,3 +101,315 @@ class AsmLine:
 
     def __str__(self):
         return self.raw
+
+
+# Interned ids used by the columnar Program
+LINE_TYPES = tuple(AsmLineType)
+LINE_TYPE_IDS = {t: i for i, t in enumerate(LINE_TYPES)}
+INST_NAMES = tuple(rv32i_inst_dict)
+INST_IDS = {inst: i for i, inst in enumerate(INST_NAMES)}
+
+
+class ProgramView(Sequence):
+    __slots__ = ('program', '__getter', '__length')
+
+    def __init__(self, program: 'Program', getter: Callable, length: Callable[[], int]):
+        self.program = program
+        self.__getter = getter
+        self.__length = length
+
+    def __len__(self) -> int:
+        return self.__length()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.__getter(j) for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+
+        return self.__getter(i)
+
+    def __iter__(self) -> Iterator:
+        return map(self.__getter, range(len(self)))
+
+
+class InstructionView(ProgramView):
+    __slots__ = ()
+
+
+def shift_column(column: array, start: int, delta: int) -> None:
+    if delta:
+        column[start:] = array(column.typecode, map(delta.__add__, column[start:]))
+
+
+class Program:
+    LINE_COLUMNS = (
+        'line_starts', 'line_types', 'im_ptrs', 'im_sizes', 'body_offsets', 'body_lens', 'tc_offsets', 'tc_lens',
+        'args_offsets',
+    )
+    INST_COLUMNS = (
+        'inst_lines', 'inst_ops', 'inst_rd', 'inst_rs1', 'inst_rs2', 'inst_imm', 'inst_label', 'inst_reloc',
+    )
+
+    __slots__ = ('source', 'regs', 'reg_nums', '__reg_ids', 'labels', '__label_ids') + LINE_COLUMNS + INST_COLUMNS
+
+    def __init__(self, source: str = ''):
+        # The source is kept once; lines are slices of it rebuilt on demand
+        self.source = source
+
+        # Interned register spellings and their numbers, id 0 stands for "no register"
+        self.regs: List[Optional[str]] = [None]
+        self.reg_nums: List[int] = [0]
+        self.__reg_ids = {None: 0}
+
+        # Interned names of referenced labels, id 0 stands for "no label"
+        self.labels: List[Optional[str]] = [None]
+        self.__label_ids = {None: 0}
+
+        # Line columns, one entry per source line
+        self.line_starts = array('I')
+        self.line_types = array('B')
+        self.im_ptrs = array('I')
+        # Bytes of machine code a line assembles to, pseudo-instructions and relaxed branches take more than 4,
+        # directives in .text as many as they lay out
+        self.im_sizes = array('I')
+        self.body_offsets = array('I')
+        self.body_lens = array('I')
+        self.tc_offsets = array('I')
+        self.tc_lens = array('I')
+        self.args_offsets = array('I')
+
+        # Instruction columns, one entry per instruction
+        self.inst_lines = array('I')
+        self.inst_ops = array('B')
+        self.inst_rd = array('B')
+        self.inst_rs1 = array('B')
+        self.inst_rs2 = array('B')
+        self.inst_imm = array('q')
+        self.inst_label = array('I')
+        self.inst_reloc = array('B')
+
+    def add_line(self, start: int, line_type: AsmLineType, im_ptr: int, body_offset: int, body_len: int,
+                 tc_offset: int = 0, tc_len: int = 0, args_offset: int = 0, im_size: int = None) -> None:
+        self.line_starts.append(start)
+        self.line_types.append(LINE_TYPE_IDS[line_type])
+        self.im_ptrs.append(im_ptr)
+        self.im_sizes.append(im_size if im_size is not None else 4 if line_type == AsmLineType.INSTRUCTION else 0)
+        self.body_offsets.append(body_offset)
+        self.body_lens.append(body_len)
+        self.tc_offsets.append(tc_offset)
+        self.tc_lens.append(tc_len)
+        self.args_offsets.append(args_offset)
+
+    def add_tokens(self, tokens: Iterable, im_ptr: int = 0) -> int:
+        # Hot loop of the parser: column appends are bound once up front
+        line_start, line_type, im_ptrs = self.line_starts.append, self.line_types.append, self.im_ptrs.append
+        im_size = self.im_sizes.append
+        body_offset, body_len = self.body_offsets.append, self.body_lens.append
+        tc_offset, tc_len, args_offset = self.tc_offsets.append, self.tc_lens.append, self.args_offsets.append
+
+        comment, instruction, directive = AsmLineType.COMMENT, AsmLineType.INSTRUCTION, AsmLineType.DIRECTIVE
+        type_ids = LINE_TYPE_IDS
+
+        for t_type, start, _, body, body_end, tc, tc_end, args in tokens:
+            line_start(start)
+            line_type(type_ids[t_type])
+            im_ptrs(im_ptr)
+            body_offset(body - start)
+            body_len(body_end - body)
+
+            if tc >= 0 and t_type is not comment:
+                tc_offset(tc - start)
+                tc_len(tc_end - tc)
+            else:
+                tc_offset(0)
+                tc_len(0)
+
+            # Every instruction is laid out at 4 bytes, the relaxation pass grows the ones that need more
+            if t_type is instruction:
+                args_offset(args - body if args >= 0 else 0)
+                im_size(4)
+                im_ptr += 4
+            elif t_type is directive:
+                # Sized once every directive is parsed, see AsmParser
+                args_offset(args - body if args >= 0 else 0)
+                im_size(0)
+            else:
+                args_offset(0)
+                im_size(0)
+
+        return im_ptr
+
+    def reg_id(self, reg: Optional[str], num: Optional[int] = None) -> int:
+        if reg not in self.__reg_ids:
+            self.__reg_ids[reg] = len(self.regs)
+            self.regs.append(reg)
+            self.reg_nums.append(reg_mapper(reg) if num is None else num)
+
+        return self.__reg_ids[reg]
+
+    def label_id(self, label: Optional[str]) -> int:
+        if label not in self.__label_ids:
+            self.__label_ids[label] = len(self.labels)
+            self.labels.append(label)
+
+        return self.__label_ids[label]
+
+    def add_instruction(self, idx: int, inst: str, rd: Optional[str] = None, rs1: Optional[str] = None,
+                        rs2: Optional[str] = None, imm: Optional[int] = None, rd_num: Optional[int] = None,
+                        rs1_num: Optional[int] = None, rs2_num: Optional[int] = None, label: Optional[str] = None,
+                        reloc: int = Reloc.PCREL) -> None:
+        self.inst_lines.append(idx)
+        self.inst_ops.append(INST_IDS[inst])
+        self.inst_rd.append(self.reg_id(rd, rd_num))
+        self.inst_rs1.append(self.reg_id(rs1, rs1_num))
+        self.inst_rs2.append(self.reg_id(rs2, rs2_num))
+        self.inst_label.append(self.label_id(label))
+        self.inst_reloc.append(reloc)
+
+        try:
+            self.inst_imm.append(imm or 0)
+        except OverflowError:
+            # Only the low 32 bits of an immediate are ever encoded
+            self.inst_imm.append(((imm & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000)
+
+    def copy(self) -> 'Program':
+        program = Program(self.source)
+        program.regs, program.reg_nums, program.__reg_ids = list(self.regs), list(self.reg_nums), dict(self.__reg_ids)
+        program.labels, program.__label_ids = list(self.labels), dict(self.__label_ids)
+
+        for name in self.LINE_COLUMNS + self.INST_COLUMNS:
+            setattr(program, name, getattr(self, name)[:])
+
+        return program
+
+    def __scratch(self) -> 'Program':
+        # An empty program that interns into the tables of this one
+        program = Program()
+        program.regs, program.reg_nums, program.__reg_ids = self.regs, self.reg_nums, self.__reg_ids
+        program.labels, program.__label_ids = self.labels, self.__label_ids
+
+        return program
+
+    def line_start(self, i: int) -> int:
+        return self.line_starts[i] if i < len(self.line_starts) else len(self.source) + 1
+
+    def line_im_ptr(self, i: int) -> int:
+        return self.im_ptrs[i] if i < len(self.im_ptrs) else self.size
+
+    def replace_lines(self, a: int, b: int, lines: List[str], tokens: Iterable) -> int:
+        # Swap lines [a, b) for `lines`, given the tokens of '\n'.join(lines); returns the im_ptr delta
+        n = len(self.line_starts)
+        im_start, im_end = self.line_im_ptr(a), self.line_im_ptr(b)
+
+        before = self.source[:self.line_start(a) - 1] if a > 0 else None
+        middle = '\n'.join(lines) if lines else None
+        after = self.source[self.line_start(b):] if b < n else None
+        self.source = '\n'.join(part for part in (before, middle, after) if part is not None)
+
+        mid_start = len(before) + 1 if before is not None else 0
+        after_start = mid_start + len(middle) + 1 if middle is not None else mid_start
+
+        scratch = self.__scratch()
+        im_delta = scratch.add_tokens(tokens, im_start) - im_end
+        shift_column(scratch.line_starts, 0, mid_start)
+
+        char_delta = after_start - self.line_start(b) if b < n else 0
+        for name in self.LINE_COLUMNS:
+            getattr(self, name)[a:b] = getattr(scratch, name)
+
+        shift_column(self.line_starts, a + len(lines), char_delta)
+        shift_column(self.im_ptrs, a + len(lines), im_delta)
+
+        return im_delta
+
+    def replace_instructions(self, k0: int, k1: int, instructions: Iterable[Tuple[int, str, dict]],
+                             line_delta: int = 0) -> int:
+        # Swap instructions [k0, k1) for parsed (line, mnemonic, arguments); returns the new count
+        scratch = self.__scratch()
+        for idx, inst, args_dict in instructions:
+            scratch.add_instruction(idx, inst, **args_dict)
+
+        for name in self.INST_COLUMNS:
+            getattr(self, name)[k0:k1] = getattr(scratch, name)
+
+        count = len(scratch.inst_lines)
+        shift_column(self.inst_lines, k0 + count, line_delta)
+
+        return count
+
+    def splice_instructions(self, edits: Iterable[Tuple[int, int, Iterable[Tuple[int, str, dict]]]]) -> None:
+        # Many replace_instructions at once: (k0, k1, parsed instructions), sorted and not overlapping
+        scratch = self.__scratch()
+        columns = {name: array(getattr(self, name).typecode) for name in self.INST_COLUMNS}
+
+        k = 0
+        for k0, k1, instructions in edits:
+            start = len(scratch.inst_lines)
+            for idx, inst, args_dict in instructions:
+                scratch.add_instruction(idx, inst, **args_dict)
+
+            for name, column in columns.items():
+                column.extend(getattr(self, name)[k:k0])
+                column.extend(getattr(scratch, name)[start:])
+            k = k1
+
+        for name, column in columns.items():
+            column.extend(getattr(self, name)[k:])
+            setattr(self, name, column)
+
+    def inst_addr(self, k: int) -> int:
+        # Lines expanded to several instructions lay them out one after the other
+        i, j = self.inst_lines[k], k
+        while j and self.inst_lines[j - 1] == i:
+            j -= 1
+        return self.im_ptrs[i] + 4 * (k - j)
+
+    def raw_line(self, i: int) -> str:
+        start = self.line_starts[i]
+        end = self.line_starts[i + 1] - 1 if i + 1 < len(self.line_starts) else len(self.source)
+        return self.source[start:end]
+
+    def body(self, i: int) -> str:
+        start = self.line_starts[i] + self.body_offsets[i]
+        return self.source[start:start + self.body_lens[i]]
+
+    def line(self, i: int) -> AsmLine:
+        raw = self.raw_line(i)
+        line_type = LINE_TYPES[self.line_types[i]]
+        body_offset, body_len = self.body_offsets[i], self.body_lens[i]
+        tc_offset, tc_len = self.tc_offsets[i], self.tc_lens[i]
+
+        line = AsmLine(i, line_type, self.im_ptrs[i], raw, raw[body_offset:body_offset + body_len], body_offset)
+        if tc_len:
+            line.tc, line.tc_offset = raw[tc_offset:tc_offset + tc_len], tc_offset
+
+        return line
+
+    def instruction(self, k: int) -> Instruction:
+        inst = INST_NAMES[self.inst_ops[k]]
+        imm = self.inst_imm[k] if rv32i_inst_dict[inst].inst_type != InstType.R_ else None
+        rd, rs1, rs2 = self.inst_rd[k], self.inst_rs1[k], self.inst_rs2[k]
+
+        return Instruction(
+            self.inst_lines[k], inst, self.regs[rd], self.regs[rs1], self.regs[rs2], imm,
+            self.reg_nums[rd] if rd else None, self.reg_nums[rs1] if rs1 else None, self.reg_nums[rs2] if rs2 else None,
+        )
+
+    @property
+    def size(self) -> int:
+        if not self.im_ptrs:
+            return 0
+
+        return self.im_ptrs[-1] + self.im_sizes[-1]
+
+    @property
+    def lines(self) -> ProgramView:
+        return ProgramView(self, self.line, self.line_starts.__len__)
+
+    @property
+    def instructions(self) -> InstructionView:
+        return InstructionView(self, self.instruction, self.inst_lines.__len__)
@@ -0,0 +1,161 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from rv32ias.formats import to_le_bytes
+from rv32ias.models import Reloc
+
+__all__ = [
+    'ObjectSection',
+    'Relocation',
+    'ObjectUnit',
+    'pack_unit',
+    'unpack_unit',
+]
+
+# Unit layout: header, section/symbol/relocation tables, section bytes, '\n' joined names (all little endian)
+__HEADER = struct.Struct('<8s64sIIII')
+__MAGIC = b'RV32OBJ\x01'
+
+# Table columns, one 32 bit value each
+__SECTION_FIELDS = 4
+__SYMBOL_FIELDS = 4
+__RELOC_FIELDS = 5
+
+
+class ObjectSection(NamedTuple):
+    name: str
+    align: int
+    size: int
+    # Bytes of the section, empty when they are all zero
+    data: bytes
+
+
+class Relocation(NamedTuple):
+    section: int
+    offset: int
+    # rv32ias.models.Reloc
+    reloc: int
+    symbol: str
+    # Line of the reference, counted from 1
+    line: int
+
+
+@dataclass
+class ObjectUnit:
+    name: str
+    # Cache key of the source it was assembled from, a unit is stale once its source has another
+    key: str
+    # .text first
+    sections: List[ObjectSection]
+    # Label -> (section, offset), of every label of the unit
+    symbols: Dict[str, Tuple[int, int]]
+    # Labels other units can refer to
+    exports: List[str]
+    # References the linker patches: every absolute one, and pc relative ones to other units
+    relocations: List[Relocation]
+
+
+def __from_le(data: bytes) -> array:
+    values = array('I', data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_unit(unit: ObjectUnit) -> bytes:
+    names, name_ids = [], {}
+
+    def name_id(name: str) -> int:
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    name_id(unit.name)
+    exports = set(unit.exports)
+
+    sections = array('I')
+    for section in unit.sections:
+        sections.extend((name_id(section.name), section.align, section.size, len(section.data)))
+
+    symbols = array('I')
+    for label, (section, offset) in unit.symbols.items():
+        symbols.extend((name_id(label), section, offset, label in exports))
+
+    relocations = array('I')
+    for r in unit.relocations:
+        relocations.extend((r.section, r.offset, r.reloc, name_id(r.symbol), r.line))
+
+    header = __HEADER.pack(__MAGIC, unit.key.encode(), len(unit.sections), len(unit.symbols),
+                           len(unit.relocations), len(names))
+
+    return b''.join([
+        header, to_le_bytes(sections), to_le_bytes(symbols), to_le_bytes(relocations),
+        *(section.data for section in unit.sections), '\n'.join(names).encode(),
+    ])
+
+
+def unpack_unit(data: bytes) -> Optional[ObjectUnit]:
+    if len(data) < __HEADER.size:
+        return None
+
+    magic, key, n_sections, n_symbols, n_relocs, n_names = __HEADER.unpack_from(data)
+    sections_end = __HEADER.size + n_sections * __SECTION_FIELDS * 4
+    symbols_end = sections_end + n_symbols * __SYMBOL_FIELDS * 4
+    relocs_end = symbols_end + n_relocs * __RELOC_FIELDS * 4
+
+    if magic != __MAGIC or len(data) < relocs_end:
+        return None
+
+    sections = __from_le(data[__HEADER.size:sections_end])
+    data_end = relocs_end + sum(sections[3::__SECTION_FIELDS])
+
+    if len(data) < data_end:
+        return None
+
+    try:
+        names = data[data_end:].decode().split('\n')
+    except UnicodeDecodeError:
+        return None
+
+    if len(names) != n_names:
+        return None
+
+    symbols = __from_le(data[sections_end:symbols_end])
+    relocs = __from_le(data[symbols_end:relocs_end])
+
+    # Tables that point outside the unit are treated like any other damaged object, so the unit is rebuilt
+    # instead of failing the link
+    try:
+        unit_sections, pos = [], relocs_end
+        for j in range(0, len(sections), __SECTION_FIELDS):
+            name, align, size, stored = sections[j:j + __SECTION_FIELDS]
+            if not align or align & (align - 1) or stored not in (0, size):
+                return None
+            unit_sections.append(ObjectSection(names[name], align, size, data[pos:pos + stored]))
+            pos += stored
+
+        unit_symbols, exports = {}, []
+        for j in range(0, len(symbols), __SYMBOL_FIELDS):
+            name, section, offset, exported = symbols[j:j + __SYMBOL_FIELDS]
+            if section >= n_sections or offset > unit_sections[section].size:
+                return None
+            unit_symbols[names[name]] = (section, offset)
+            if exported:
+                exports.append(names[name])
+
+        columns = (relocs[f::__RELOC_FIELDS] for f in range(__RELOC_FIELDS))
+        relocations = [
+            Relocation(section, offset, reloc, names[name], line)
+            for section, offset, reloc, name, line in zip(*columns)
+        ]
+        for r in relocations:
+            if r.section >= n_sections or r.offset + 4 > unit_sections[r.section].size or r.reloc >= len(Reloc):
+                return None
+
+        return ObjectUnit(names[0], key.rstrip(b'\0').decode(), unit_sections, unit_symbols, exports, relocations)
+    except (IndexError, UnicodeDecodeError):
+        return None
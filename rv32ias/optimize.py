@@ -0,0 +1,200 @@
+from array import array
+from bisect import bisect_left
+from itertools import compress
+from typing import Callable, Collection, Dict, Iterable, NamedTuple, Tuple
+
+from rv32ias.isa import InstType
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.models import INST_IDS
+from rv32ias.models import Program
+from rv32ias.schedule import END_OPS
+from rv32ias.schedule import reg_columns
+from rv32ias.schedule import row_addrs
+
+__all__ = [
+    'Rows',
+    'PeepholeRule',
+    'PEEPHOLE_RULES',
+    'index_rules',
+    'OptimizeReport',
+    'optimize',
+]
+
+# Instructions that only write rd, dropping them changes nothing else
+ALU_R = ('add', 'sub', 'xor', 'or', 'and', 'sll', 'srl', 'sra', 'slt', 'sltu')
+ALU_I = ('addi', 'xori', 'ori', 'andi', 'slli', 'srli', 'srai', 'slti', 'sltiu')
+PURE = ALU_R + ALU_I + ('lui',)
+
+BRANCH_OPS = frozenset(
+    INST_IDS[inst] for inst, inst_def in rv32i_inst_dict.items() if inst_def.inst_type == InstType.B_
+)
+JAL, JALR, ADDI = INST_IDS['jal'], INST_IDS['jalr'], INST_IDS['addi']
+
+
+class Rows(NamedTuple):
+    # Instruction columns as the rules see them, registers as numbers
+    ops: array
+    rd: array
+    rs1: array
+    rs2: array
+    imm: array
+    label: array
+
+
+class PeepholeRule(NamedTuple):
+    name: str
+    mnemonics: Tuple[str, ...]
+    # (rows, k, prev) -> True when row k does nothing. `prev` is the row that runs straight into it, or -1 when
+    # it can be entered some other way
+    match: Callable[[Rows, int, int], bool]
+
+
+def __writes_zero(r: Rows, k: int, prev: int) -> bool:
+    return not r.rd[k]
+
+
+def __zero_immediate(r: Rows, k: int, prev: int) -> bool:
+    return r.rd[k] == r.rs1[k] and not r.imm[k] and not r.label[k]
+
+
+def __all_ones(r: Rows, k: int, prev: int) -> bool:
+    return r.rd[k] == r.rs1[k] and r.imm[k] == -1 and not r.label[k]
+
+
+def __zero_operand(r: Rows, k: int, prev: int) -> bool:
+    return r.rd[k] == r.rs1[k] and not r.rs2[k]
+
+
+def __zero_first_operand(r: Rows, k: int, prev: int) -> bool:
+    return r.rd[k] == r.rs2[k] and not r.rs1[k]
+
+
+def __move_back(r: Rows, k: int, prev: int) -> bool:
+    # mv a, b then mv b, a
+    return (prev >= 0 and r.ops[prev] == ADDI and not r.imm[prev] and not r.imm[k] and not r.label[prev]
+            and not r.label[k] and r.rd[k] == r.rs1[prev] and r.rs1[k] == r.rd[prev])
+
+
+def __repeated(r: Rows, k: int, prev: int) -> bool:
+    # The same result written twice, from registers the first write left alone
+    return (prev >= 0 and r.ops[prev] == r.ops[k] and r.rd[prev] == r.rd[k] and r.rs1[prev] == r.rs1[k]
+            and r.rs2[prev] == r.rs2[k] and r.imm[prev] == r.imm[k] and r.label[prev] == r.label[k]
+            and r.rd[k] != r.rs1[k] and r.rd[k] != r.rs2[k])
+
+
+PEEPHOLE_RULES = [
+    PeepholeRule('write to zero', PURE, __writes_zero),
+    PeepholeRule('zero immediate', ('addi', 'xori', 'ori', 'slli', 'srli', 'srai'), __zero_immediate),
+    PeepholeRule('and all ones', ('andi',), __all_ones),
+    PeepholeRule('zero operand', ('add', 'sub', 'xor', 'or', 'sll', 'srl', 'sra'), __zero_operand),
+    PeepholeRule('zero first operand', ('add', 'xor', 'or'), __zero_first_operand),
+    PeepholeRule('move back', ('addi',), __move_back),
+    PeepholeRule('repeated', PURE, __repeated),
+]
+
+
+def index_rules(rules: Iterable[PeepholeRule]) -> Dict[int, Tuple[PeepholeRule, ...]]:
+    # Rules by the mnemonic they apply to, every row is only tried against its own
+    index = {}
+    for rule in rules:
+        for inst in rule.mnemonics:
+            index[INST_IDS[inst]] = index.get(INST_IDS[inst], ()) + (rule,)
+    return index
+
+
+RULE_INDEX = index_rules(PEEPHOLE_RULES)
+
+
+class OptimizeReport(NamedTuple):
+    instructions: int
+    # Instructions dropped by each peephole rule
+    rules: Dict[str, int]
+    # Instructions no path from the entry or an address taken label reaches
+    dead: int
+
+    @property
+    def removed(self) -> int:
+        return sum(self.rules.values()) + self.dead
+
+    @property
+    def saved(self) -> int:
+        # Bytes of code, before any change to .align padding
+        return 4 * self.removed
+
+
+def __reachable(program: Program, addrs: array, rd: array, roots: Collection[int]) -> bytearray:
+    # Rows reached from the first one and from every root address, following branches, jumps and fall through.
+    # Jumps that link return behind themselves, jalr targets are only known as roots
+    ops, imm = program.inst_ops, program.inst_imm
+    n = len(addrs)
+    reached = bytearray(n)
+
+    pending = [0] + [bisect_left(addrs, addr) for addr in roots]
+    while pending:
+        k = pending.pop()
+        while k < n and not reached[k]:
+            reached[k] = 1
+            op = ops[k]
+            if op in BRANCH_OPS or op == JAL:
+                pending.append(bisect_left(addrs, addrs[k] + imm[k]))
+            if (op == JAL or op == JALR) and not rd[k]:
+                break
+            k += 1
+
+    return reached
+
+
+def optimize(program: Program, targets: Collection[int], roots: Collection[int]) -> OptimizeReport:
+    # One pass over the rows: unreachable lines go, then every row is matched against the rules of its
+    # mnemonic. `targets` are the label addresses, `roots` the ones code may be entered at other than by a
+    # branch or jump. Dropped lines are left at a size of 0, laying the code out again is up to the caller
+    addrs = row_addrs(program)
+    rd, rs1, rs2 = reg_columns(program)
+    ops, inst_lines, im_sizes = program.inst_ops, program.inst_lines, program.im_sizes
+    rows = Rows(ops, rd, rs1, rs2, program.inst_imm, program.inst_label)
+    targets = set(targets)
+
+    reached = __reachable(program, addrs, rd, roots)
+
+    # Lines are dropped whole: a line of several words is dead when none of them is reached
+    live_lines = {inst_lines[k] for k in compress(range(len(addrs)), reached)}
+
+    keep = bytearray(len(addrs))
+    counts: Dict[str, int] = {}
+    dead, prev = 0, -1
+    for k in range(len(addrs)):
+        line = inst_lines[k]
+        if line not in live_lines:
+            dead += 1
+            prev = -1
+            continue
+
+        # Rules only look at lines of one word, and back only along straight line code
+        if im_sizes[line] != 4:
+            keep[k], prev = 1, -1
+            continue
+        if prev >= 0 and (addrs[k] != addrs[prev] + 4 or addrs[k] in targets or ops[prev] in END_OPS):
+            prev = -1
+
+        for rule in RULE_INDEX.get(ops[k], ()):
+            if rule.match(rows, k, prev):
+                counts[rule.name] = counts.get(rule.name, 0) + 1
+                break
+        else:
+            keep[k], prev = 1, k
+            continue
+        prev = -1
+
+    report = OptimizeReport(len(addrs), counts, dead)
+    if not report.removed:
+        return report
+
+    for k in range(len(addrs)):
+        if not keep[k]:
+            im_sizes[inst_lines[k]] = 0
+
+    for name in Program.INST_COLUMNS:
+        column = getattr(program, name)
+        setattr(program, name, array(column.typecode, compress(column, keep)))
+
+    return report
@@ -1,8 +1,61 @@
-from typing import List
+from typing import Iterator, List, Optional, TextIO, Tuple
 
-from rv32ias.assembler import assemble_instructions
-from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+from rv32ias.stats import timed
 
+# Stages are imported where they are used: a cache hit never loads the parser,
+# and a plain run never loads the cache or the stream parser
 
-def assemble(asm_txt: str) -> List[int]:
-    return assemble_instructions(AsmParser(asm_txt).instructions)
+
+def load_asm(asm_file: str, stats: Optional[AsmStats] = None) -> str:
+    try:
+        with timed(stats, 'load'), open(asm_file, 'r') as f:
+            asm_txt = f.read()
+            if stats is not None:
+                stats.count('bytes_read', f.buffer.tell())
+    except Exception as e:
+        raise FileNotFoundError(f"Error occurred while reading file:\n -> {e}")
+
+    return asm_txt
+
+
+def assemble(asm_txt: str, cache_dir: Optional[str] = None, stats: Optional[AsmStats] = None,
+             base_dir: Optional[str] = None) -> List[int]:
+    if cache_dir is None:
+        from rv32ias.preprocessor import AsmParser
+        return AsmParser(asm_txt, stats=stats, base_dir=base_dir).machine_codes.tolist()
+
+    from rv32ias.cache import AsmCache
+
+    with timed(stats, 'cache'):
+        cache = AsmCache(cache_dir)
+        key = cache.key(asm_txt, base_dir)
+        entry = cache.get(key)
+
+    if entry is not None:
+        if stats is not None:
+            stats.count('cache.hits')
+        return entry[0].tolist()
+
+    if stats is not None:
+        stats.count('cache.misses')
+
+    from rv32ias.preprocessor import AsmParser
+
+    asm_parser = AsmParser(asm_txt, stats=stats, base_dir=base_dir)
+    machine_codes = asm_parser.machine_codes
+    with timed(stats, 'cache'):
+        cache.put(key, machine_codes, asm_parser.jump_table)
+
+    return machine_codes.tolist()
+
+
+def assemble_stream(asm_file: TextIO) -> Iterator[Tuple[int, int]]:
+    from rv32ias.stream import AsmStreamParser
+
+    stream_parser = AsmStreamParser()
+
+    for line in asm_file:
+        yield from stream_parser.feed(line)
+
+    stream_parser.close()
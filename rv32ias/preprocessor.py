@@ -1,157 +1,861 @@
-import re
-from typing import List, Tuple, Dict
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import partial
+from itertools import chain
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Dict
 
+from rv32ias.assembler import assemble_instruction
+from rv32ias.assembler import assemble_instructions
+from rv32ias.assembler import patch_offset
+
+from rv32ias.exceptions import AsmDiagnostic
 from rv32ias.exceptions import AsmDuplicateLabelError
 from rv32ias.exceptions import AsmInvalidInstructionError
 from rv32ias.exceptions import AsmInvalidRegisterError
 from rv32ias.exceptions import AsmInvalidSyntaxError
+from rv32ias.exceptions import AsmOutOfRangeError
+from rv32ias.exceptions import AsmParseError
 from rv32ias.exceptions import AsmUndefinedLabelError
+from rv32ias.isa import PseudoDef
+from rv32ias.isa import pseudo_inst_dict
 from rv32ias.isa import reg_mapper
 from rv32ias.isa import rv32i_inst_dict
+from rv32ias.lexer import Token
+from rv32ias.lexer import shift_token
+from rv32ias.lexer import tokenize
+from rv32ias.lexer import tokenize_line
 from rv32ias.models import AsmLine
+from rv32ias.models import INST_NAMES
+from rv32ias.models import LINE_TYPES
 from rv32ias.models import AsmLineType
 from rv32ias.models import Instruction
+from rv32ias.models import LINE_TYPE_IDS
+from rv32ias.models import Program
+from rv32ias.models import Reloc
+from rv32ias.relax import fits_imm32
+from rv32ias.relax import offset_fits
+from rv32ias.relax import relax
+from rv32ias.relax import reloc_fits
+from rv32ias.relax import resolve_reloc
+from rv32ias.stats import AsmStats
+from rv32ias.stats import timed
+
+# Sections, images, objects and the macro preprocessor are imported by the sources and modes that use them
+if TYPE_CHECKING:
+    from rv32ias.expand import SourceMap
+    from rv32ias.image import MemoryImage
+    from rv32ias.image import SectionLayout
+    from rv32ias.objfile import ObjectUnit
+    from rv32ias.optimize import OptimizeReport
+    from rv32ias.schedule import ScheduleReport
+
+# (raw_i, span, note) -> (line number, code space, note, span) as taken by AsmParseError
+ErrCtxBuilder = Callable[..., tuple]
+
+
+def asm_line_from_token(i: int, text: str, token: Token, im_ptr: int) -> AsmLine:
+    raw = text[token.start:token.end]
+    body_offset = token.body - token.start
+
+    asm_line = AsmLine(i, token.type, im_ptr, raw, text[token.body:token.body_end], body_offset)
+    if token.tc >= 0 and token.type != AsmLineType.COMMENT:
+        asm_line.tc, asm_line.tc_offset = text[token.tc:token.tc_end], token.tc - token.start
+
+    return asm_line
+
+
+def analyze_line(i: int, line: str, im_ptr: int) -> AsmLine:
+    return asm_line_from_token(i, line, tokenize_line(line), im_ptr)
+
+
+def render_code_space(line: AsmLine, context: Sequence[AsmLine], span: tuple = None) -> str:
+    if span is None:
+        span = (0, len(line.body))
+
+    code_space = []
+    for code in context:
+        if code.idx == line.idx:
+            label = 'err!'
+            offset = line.body_offset
+            code_a = code.raw[:offset + span[0]]
+            code_b = code.raw[offset + span[0]:offset + sum(span)]
+            code_c = code.raw[offset + sum(span):]
+            code = f"{code_a}\033[43m{code_b}\033[0m{code_c}"
+            code_space.append(f"\033[91m{label:^6} -> \033[0m{code}")
+        else:
+            label = code.idx + 1
+            code_space.append(f'\033[90m{label:^6} -> {code}\033[0m')
+
+    return '\n'.join(code_space)
+
+
+def build_err_ctx(line: AsmLine, context: Sequence[AsmLine], span: tuple = None, note='') -> tuple:
+    return line.idx + 1, partial(render_code_space, line, list(context), span), note, span
+
+
+def parse_label(idx: int, body: str, jump_targets: Dict[str, int], err_ctx: ErrCtxBuilder) -> str:
+    label = body[:-1]
+
+    if not label or not label[0].isalpha():
+        span, note = (0, len(label)), 'Label must start with alphabet'
+        raise AsmInvalidSyntaxError(*err_ctx(idx, span, note))
+
+    if label in jump_targets:
+        span, note = (0, len(label)), 'Duplicate label found'
+        raise AsmDuplicateLabelError(*err_ctx(idx, span, note))
+
+    return label
+
+
+def parse_instruction(idx: int, body: str, args_offset: int,
+                      err_ctx: ErrCtxBuilder) -> Tuple[str, dict, Optional[str], Optional[tuple]]:
+    inst = body[:args_offset].rstrip() if args_offset else body
+
+    # ! Raise when a label shares its line with an instruction or directive
+    if inst.endswith(':'):
+        raise AsmInvalidSyntaxError(*err_ctx(idx, (0, len(inst)), 'Label must be on a line of its own'))
+
+    inst_def = rv32i_inst_dict.get(inst) or pseudo_inst_dict.get(inst)
+
+    # ! Raise when only one word in line, unless the instruction takes no arguments
+    if not args_offset and (inst_def is None or inst_def.inst_arg_re != '^$'):
+        raise AsmInvalidSyntaxError(*err_ctx(idx, note='Incomplete instruction'))
+
+    # ! Raise when instruction not in RV32I Instruction Dictionary
+    if inst_def is None:
+        span, note = (0, len(inst)), f'Instruction `{inst}` not supported'
+        raise AsmInvalidInstructionError(*err_ctx(idx, span, note))
+
+    args = body[args_offset:] if args_offset else ''
+    re_match = inst_def.inst_arg_pattern.match(args)
+
+    # ! Raise when instruction arguments not match
+    if re_match is None:
+        span, note = (args_offset, len(args)), 'Invalid instruction arguments'
+        raise AsmInvalidSyntaxError(*err_ctx(idx, span, note))
+
+    args_dict = re_match.groupdict()
+    args_pos = {k: args_offset + re_match.span(k)[0] for k in args_dict.keys()}
+
+    # Handle immediate
+    if 'imm' in args_dict:
+        try:
+            args_dict['imm'] = int(args_dict['imm'], 0)
+        except ValueError:
+            span, note = (args_pos['imm'], len(args_dict['imm'])), 'Invalid immediate value'
+            raise AsmInvalidSyntaxError(*err_ctx(idx, span, note))
+
+        # ! Raise when li immediate does not fit in a register
+        if inst == 'li' and not fits_imm32(args_dict['imm']):
+            span, note = (args_pos['imm'], len(re_match.group('imm'))), 'Immediate out of range'
+            raise AsmOutOfRangeError(*err_ctx(idx, span, note))
+
+    # Handle pseudo-instruction aliases, they are parsed as the instruction they stand for
+    if isinstance(inst_def, PseudoDef) and inst_def.base is not None:
+        inst, args_dict = inst_def.base, {**inst_def.fixed, **args_dict}
+
+    # ! Raise when invalid register
+    for reg_name, num_name in [('rd', 'rd_num'), ('rs1', 'rs1_num'), ('rs2', 'rs2_num')]:
+        if reg_name in args_dict:
+            try:
+                args_dict[num_name] = reg_mapper(args_dict[reg_name])
+            except ValueError:
+                span, note = (args_pos[reg_name], len(args_dict[reg_name])), 'Invalid register'
+                raise AsmInvalidRegisterError(*err_ctx(idx, span, note))
+
+    # Labels are left for the caller to resolve
+    label = args_dict.pop('label', None)
+    label_span = (args_pos['label'], len(label)) if label is not None else None
+
+    return inst, args_dict, label, label_span
 
 
 class AsmParser:
-    def __init__(self, asm_raw: str):
-        self.__asm: List[AsmLine] = self.__analyze_asm(asm_raw)
+    def __init__(self, asm_raw: str, collect_errors: bool = False, max_errors: int = None,
+                 stats: Optional[AsmStats] = None, base_dir: Optional[str] = None, unit: bool = False):
+        self.__stats = stats
+        # Directory `.incbin` paths are relative to
+        self.__base_dir = base_dir
+        # Assembled as one unit of a linked program: labels may be defined by other units, see object_unit
+        self.__unit = unit
+
+        self.__diagnostics: List[AsmDiagnostic] = []
+        self.__collect_errors = collect_errors
+        self.__max_errors = max_errors
+
+        # Where the lines of sources with .include or macros come from, None for any other source
+        self.__source_map: Optional['SourceMap'] = None
+
+        if '.include' in asm_raw or '.macro' in asm_raw:
+            with timed(stats, 'preprocess'):
+                self.__program: Program = self.__expand_asm(asm_raw)
+        else:
+            with timed(stats, 'analysis'):
+                self.__program: Program = self.__analyze_asm(asm_raw)
 
         self.__jump_targets: Dict[str, int] = {}
-        self.__parsed_instructions: List[Instruction] = []
+        self.__machine_codes: Optional[array] = None
+        self.__image: Optional['MemoryImage'] = None
+        # Set once some line was laid out at other than 4 bytes
+        self.__relaxed = False
+        # Sections and data, only for sources with directives
+        self.__layout: Optional['SectionLayout'] = None
+        # Set once instructions were removed or reordered, lines are then no longer laid out in source order
+        self.__optimized = False
+        self.__scheduled = False
+
+        if LINE_TYPE_IDS[AsmLineType.DIRECTIVE] in self.__program.line_types:
+            with timed(stats, 'layout'):
+                self.__layout_sections()
+        with timed(stats, 'jump_table'):
+            self.__build_jump_table()
+        with timed(stats, 'parse'):
+            items = self.__parse_asm()
+        if items is not None:
+            with timed(stats, 'relax'):
+                self.__relax(items)
+        if self.__relaxed or self.__layout is not None:
+            with timed(stats, 'layout'):
+                self.__place_sections()
 
-        self.__build_jump_table()
-        self.__parse_asm()
+        # Passes find errors in their own order, they are kept in line order and capped after that
+        self.__diagnostics.sort(key=lambda d: (d.source or '', d.line))
+        if self.__max_errors:
+            del self.__diagnostics[self.__max_errors:]
+
+        # Edits are applied whole or not at all, so they always raise
+        self.__collect_errors = False
+
+        if stats is not None:
+            self.__count_stats(stats)
+
+    def __count_stats(self, stats: AsmStats) -> None:
+        program = self.__program
+
+        # Counted straight from the columns, nothing is counted while parsing
+        for type_id, n in Counter(program.line_types).items():
+            stats.count(f'lines.{LINE_TYPES[type_id].value.lower()}', n)
+        for op, n in Counter(program.inst_ops).items():
+            stats.count(f'instructions.{rv32i_inst_dict[INST_NAMES[op]].inst_type.value}', n)
+
+        stats.count('labels', len(self.__jump_targets))
+        stats.count('errors', len(self.__diagnostics))
 
     @staticmethod
-    def __analyze_asm(asm_raw: str) -> List[AsmLine]:
-        asm = []
-        im_ptr = 0
+    def __analyze_asm(asm_raw: str) -> Program:
+        program = Program(asm_raw)
+        program.add_tokens(tokenize(asm_raw))
 
-        for i, line in enumerate(asm_raw.split('\n')):
-            re_match = re.match(r'^\s*(?P<code>.*?)\s*(?P<comment>#.*?)?\s*$', line)
+        return program
 
-            code, code_offset = re_match.group('code'), re_match.start('code')
-            cmt, cmt_offset = re_match.group('comment'), re_match.start('comment')
+    def __expand_asm(self, asm_raw: str) -> Program:
+        # Includes and macros are expanded while the lines are added, the program holds the expanded source
+        from rv32ias.expand import MacroExpander
+        from rv32ias.expand import include_cache
+        from rv32ias.expand import load_source
 
-            if not cmt:
-                cmt, cmt_offset = None, None
+        expander = MacroExpander(load_source('', asm_raw), self.__base_dir, include_cache, self.__stats)
+        source_map = expander.source_map
+        hits, misses = include_cache.hits, include_cache.misses
+        texts = []
 
-            if not code and not cmt:
-                asm.append(AsmLine(i, AsmLineType.EMPTY, im_ptr, line, line, 0))
-            elif not code:
-                asm.append(AsmLine(i, AsmLineType.COMMENT, im_ptr, line, cmt, cmt_offset))
-            elif code[-1] == ':':
-                asm.append(AsmLine(i, AsmLineType.LABEL, im_ptr, line, code, code_offset, cmt, cmt_offset))
-            else:
-                asm.append(AsmLine(i, AsmLineType.INSTRUCTION, im_ptr, line, code, code_offset, cmt, cmt_offset))
-                im_ptr += 4
+        def tokens() -> Iterator[Token]:
+            offset = 0
+            for text, token, file_id, n, subs in expander.lines():
+                texts.append(text)
+                source_map.add(file_id, n, subs)
+                yield shift_token(token, offset - token.start)
+                offset += len(text) + 1
+
+        program = Program()
+        try:
+            program.add_tokens(tokens())
+        except AsmParseError as e:
+            # Nothing past a broken include or macro can be told apart, the lines in front of it are kept
+            self.__report(e)
+
+        # Sources of nothing but macro definitions still have a line
+        if not texts:
+            program.add_tokens(tokenize(''))
+            source_map.add(0, 0)
+
+        program.source = '\n'.join(texts)
+        self.__source_map = source_map
+
+        if self.__stats is not None:
+            self.__stats.count('include.hits', include_cache.hits - hits)
+            self.__stats.count('include.misses', include_cache.misses - misses)
+
+        return program
 
-        return asm
+    def __build_err_ctx(self, raw_i: int, span: tuple = None, note='') -> tuple:
+        # Lines of preprocessed sources are reported at the file and line they come from
+        if self.__source_map is not None:
+            return self.__source_map.err_ctx(raw_i, span, note)
+
+        # The code space is only rendered when the error gets displayed
+        return raw_i + 1, partial(self.__render_err_ctx, self.__program, raw_i, span), note, span
+
+    @staticmethod
+    def __render_err_ctx(program: Program, raw_i: int, span: tuple = None) -> str:
+        asm = program.lines
 
-    def __build_err_ctx(self, raw_i: int, span: tuple = None, note='') -> Tuple[int, str, str]:
         if raw_i == 0:
             code_begin_index = 0
-            error_line = 0
-        elif raw_i == len(self.asm) - 1:
-            code_begin_index = len(self.asm) - 3
-            error_line = 2
+        elif raw_i == len(asm) - 1:
+            code_begin_index = len(asm) - 3
         else:
             code_begin_index = raw_i - 1
-            error_line = 1
-
-        if span is None:
-            span = (0, len(self.asm[raw_i].body))
-
-        code_space = []
-        for i, code in enumerate(self.asm[code_begin_index:code_begin_index + 3]):
-            if i == error_line:
-                label = 'err!'
-                offset = self.asm[raw_i].body_offset
-                code_a = code.raw[:offset + span[0]]
-                code_b = code.raw[offset + span[0]:offset + sum(span)]
-                code_c = code.raw[offset + sum(span):]
-                code = f"{code_a}\033[43m{code_b}\033[0m{code_c}"
-                code_space.append(f"\033[91m{label:^6} -> \033[0m{code}")
+
+        context = asm[max(code_begin_index, 0):code_begin_index + 3]
+
+        return render_code_space(asm[raw_i], context, span)
+
+    def __report(self, e: AsmParseError) -> None:
+        if not self.__collect_errors:
+            raise e
+
+        self.__diagnostics.append(AsmDiagnostic.from_error(e))
+
+    def __lines_of_type(self, line_type: AsmLineType, start: int = 0, stop: int = None) -> Iterator[int]:
+        type_id = LINE_TYPE_IDS[line_type]
+        line_types = self.__program.line_types[start:stop]
+        return (start + i for i, t in enumerate(line_types) if t == type_id)
+
+    def __layout_sections(self) -> None:
+        # Sizes every directive and lays out the sections other than .text; lines of .text are laid out in place
+        from rv32ias.image import SYMBOL_DIRECTIVES
+        from rv32ias.image import TEXT
+        from rv32ias.image import Section
+        from rv32ias.image import SectionLayout
+        from rv32ias.image import align_up
+        from rv32ias.image import layout_text
+        from rv32ias.image import parse_directive
+
+        program = self.__program
+        line_types, im_sizes = program.line_types, program.im_sizes
+        label_type, inst_type = LINE_TYPE_IDS[AsmLineType.LABEL], LINE_TYPE_IDS[AsmLineType.INSTRUCTION]
+
+        self.__layout = layout = SectionLayout([Section(TEXT)], [], [], {}, {})
+        section_ids = {TEXT: 0}
+        current = 0
+        unaligned = False
+
+        directives = list(self.__lines_of_type(AsmLineType.DIRECTIVE))
+        for j, d in enumerate(directives):
+            try:
+                directive = parse_directive(d, program.body(d), program.args_offsets[d], self.__build_err_ctx,
+                                            self.__base_dir)
+            except AsmParseError as e:
+                self.__report(e)
+                directive = None
+
+            if directive is None:
+                pass
+            elif directive.name in SYMBOL_DIRECTIVES:
+                layout.exports.extend((d, label) for label in directive.values)
+            elif directive.section is not None:
+                if (current := section_ids.get(directive.section)) is None:
+                    current = section_ids[directive.section] = len(layout.sections)
+                    layout.sections.append(Section(directive.section))
+            elif current == 0:
+                if directive.align > 1:
+                    layout.text_aligns.append((d, directive.align))
+                    layout.sections[0].align = max(layout.sections[0].align, directive.align)
+                else:
+                    im_sizes[d] = directive.size
+                    layout.items.append((d, 0, 0, directive))
+                    unaligned |= directive.size % 4 != 0
             else:
-                label = code_begin_index + i + 1
-                code_space.append(f'\033[90m{label:^6} -> {code}\033[0m')
+                section = layout.sections[current]
+                offset = align_up(section.size, directive.align)
+                section.size, section.align = offset + directive.size, max(section.align, directive.align)
+                if directive.size:
+                    layout.items.append((d, current, offset, directive))
 
-        return raw_i + 1, '\n'.join(code_space), note
+            if not current:
+                continue
 
-    def __build_jump_table(self) -> None:
-        for line in (i for i in self.asm if i.type == AsmLineType.LABEL):
-            label = line.body[:-1]
+            # Lines up to the next directive stay in its section, and take no room in .text
+            offset = layout.sections[current].size
+            for i in range(d + 1, directives[j + 1] if j + 1 < len(directives) else len(line_types)):
+                if line_types[i] == label_type:
+                    layout.data_lines[i] = (current, offset)
+                elif line_types[i] == inst_type:
+                    im_sizes[i] = 0
+                    # A label sharing the line is reported when the line is parsed
+                    if not program.body(i)[:program.args_offsets[i]].rstrip().endswith(':'):
+                        note = 'Instruction outside .text'
+                        self.__report(AsmInvalidSyntaxError(*self.__build_err_ctx(i, None, note)))
 
-            if not label[0].isalpha():
-                span, note = (0, len(label)), 'Label must start with alphabet'
-                raise AsmInvalidSyntaxError(*self.__build_err_ctx(line.idx, span, note))
+        layout_text(program, layout.text_aligns)
+        layout.place(program.size)
 
-            if label in self.__jump_targets:
-                span, note = (0, len(label)), 'Duplicate label found'
-                raise AsmDuplicateLabelError(*self.__build_err_ctx(line.idx, span, note))
+        # ! Raise when data in .text leaves an instruction off its 4 byte boundary
+        if unaligned:
+            im_ptrs = program.im_ptrs
+            for i in self.__lines_of_type(AsmLineType.INSTRUCTION):
+                if im_ptrs[i] & 3 and i not in layout.data_lines:
+                    note = 'Instruction not 4 byte aligned'
+                    self.__report(AsmInvalidSyntaxError(*self.__build_err_ctx(i, None, note)))
 
-            self.__jump_targets[label] = line.im_ptr
+    def __build_jump_table(self, start: int = 0, stop: int = None) -> None:
+        program = self.__program
+        layout = self.__layout
 
-    def __parse_asm(self) -> None:
-        for line in (i for i in self.asm if i.type == AsmLineType.INSTRUCTION):
-            # ! Raise when only one word in line
+        for i in self.__lines_of_type(AsmLineType.LABEL, start, stop):
             try:
-                inst, args = line.body.split(maxsplit=1)
-            except ValueError:
-                raise AsmInvalidSyntaxError(*self.__build_err_ctx(line.idx, note='Incomplete instruction'))
-
-            # ! Raise when instruction not in RV32I Instruction Dictionary
-            if inst not in rv32i_inst_dict:
-                span, note = (0, len(inst)), f'Instruction `{inst}` not supported'
-                raise AsmInvalidInstructionError(*self.__build_err_ctx(line.idx, span, note))
-
-            re_match = re.match(rv32i_inst_dict[inst].inst_arg_re, args)
-            args_offset = line.body.index(args)
-
-            # ! Raise when instruction arguments not match
-            if re_match is None:
-                span, note = (args_offset, len(args)), 'Invalid instruction arguments'
-                raise AsmInvalidSyntaxError(*self.__build_err_ctx(line.idx, span, note))
-
-            args_dict = re_match.groupdict()
-            args_pos = {k: args_offset + re_match.span(k)[0] for k in args_dict.keys()}
-
-            # Handle immediate
-            if 'imm' in args_dict:
-                try:
-                    args_dict['imm'] = int(args_dict['imm'], 0)
-                except ValueError:
-                    span, note = (args_pos['imm'], len(args_dict['imm'])), 'Invalid immediate value'
-                    raise AsmInvalidSyntaxError(*self.__build_err_ctx(line.idx, span, note))
-
-            # Handle label
-            if 'label' in args_dict:
-                if (label := args_dict.pop('label')) in self.__jump_targets:
-                    args_dict['imm'] = self.__jump_targets[label] - line.im_ptr
+                label = parse_label(i, program.body(i), self.__jump_targets, self.__build_err_ctx)
+            except AsmParseError as e:
+                self.__report(e)
+                continue
+
+            # Labels outside .text are placed again once the size of the code is settled
+            if layout is not None and (position := layout.data_lines.get(i)) is not None:
+                layout.data_labels[label] = position
+                self.__jump_targets[label] = layout.address(*position)
+            else:
+                self.__jump_targets[label] = program.im_ptrs[i]
+
+        if layout is not None and not self.__unit:
+            self.__check_data_refs()
+
+    def __check_data_refs(self) -> None:
+        program = self.__program
+
+        # ! Raise when a .word refers to an undefined label
+        for line, _, _, directive in self.__layout.items:
+            if directive.name != '.word':
+                continue
+            for value in directive.values:
+                if isinstance(value, str) and value not in self.__jump_targets:
+                    body = program.body(line)
+                    span = (body.find(value, program.args_offsets[line]), len(value))
+                    self.__report(AsmUndefinedLabelError(*self.__build_err_ctx(line, span, 'Undefined label')))
+
+    def __parse_lines(self, start: int = 0, stop: int = None) -> Iterator[Tuple[int, str, dict, tuple]]:
+        program = self.__program
+
+        for i in self.__lines_of_type(AsmLineType.INSTRUCTION, start, stop):
+            try:
+                inst, args_dict, label, label_span = parse_instruction(
+                    i, program.body(i), program.args_offsets[i], self.__build_err_ctx
+                )
+
+                # Handle label
+                if label is not None:
+                    if label in self.__jump_targets:
+                        # ! Raise when jumping into data, only its address can be taken
+                        if self.__layout is not None and label in self.__layout.data_labels and inst != 'la':
+                            note = 'Jump target outside .text'
+                            raise AsmInvalidSyntaxError(*self.__build_err_ctx(i, label_span, note))
+
+                        args_dict['imm'] = self.__jump_targets[label] - program.im_ptrs[i]
+                    elif self.__unit:
+                        # Labels of other units are patched in by the linker
+                        args_dict['imm'] = 0
+                    else:
+                        raise AsmUndefinedLabelError(*self.__build_err_ctx(i, label_span, 'Undefined label'))
+
+                    args_dict['label'] = label
+            except AsmParseError as e:
+                self.__report(e)
+                continue
+
+            yield i, inst, args_dict
+
+    def __parse_asm(self) -> Optional[List[Tuple[int, str, dict]]]:
+        # Returns the lines left for relaxation, None when every line fits in 4 bytes as parsed
+        program = self.__program
+        items, out_of_reach = [], False
+
+        for i, inst, args_dict in self.__parse_lines():
+            # Handle instructions outside .text, already reported by the layout
+            if not program.im_sizes[i]:
+                continue
+
+            # Handle pseudo-instructions with more than one form, they are laid out once every line is known
+            if inst in pseudo_inst_dict:
+                items.append((i, inst, args_dict))
+                continue
+
+            if 'label' in args_dict and not offset_fits(inst, args_dict['imm']):
+                out_of_reach = True
+
+            program.add_instruction(i, inst, **args_dict)
+
+        return items if items or out_of_reach else None
+
+    def __relax(self, items: List[Tuple[int, str, dict]]) -> None:
+        layout = self.__layout
+        # Units are moved by the linker, absolute addresses are only known once it has placed them
+        relax(self.__program, items, self.__jump_targets, layout.data_labels if layout is not None else (),
+              long_la=self.__unit)
+        self.__relaxed = True
+
+    def __place_sections(self) -> None:
+        # Settles the addresses of everything behind the relaxed code, then resolves every label reference
+        from rv32ias.image import layout_text
+
+        program, layout, jump_targets = self.__program, self.__layout, self.__jump_targets
+
+        if layout is not None:
+            if self.__relaxed and layout.text_aligns:
+                layout_text(program, layout.text_aligns)
+                for i in self.__lines_of_type(AsmLineType.LABEL):
+                    if i not in layout.data_lines and (label := program.body(i)[:-1]) in jump_targets:
+                        jump_targets[label] = program.im_ptrs[i]
+
+            layout.place(program.size)
+            for label, position in layout.data_labels.items():
+                jump_targets[label] = layout.address(*position)
+
+        self.__resolve_labels(report=True)
+
+    def __reparse(self, old_program: Program) -> Tuple[int, int]:
+        # Lay the edited source out again from scratch; returns the span of words that changed
+        old_words = self.__machine_codes
+        parser = AsmParser(self.__program.source, base_dir=self.__base_dir, unit=self.__unit)
+
+        self.__program, self.__jump_targets = parser.__program, parser.__jump_targets
+        self.__relaxed, self.__layout = parser.__relaxed, parser.__layout
+        self.__machine_codes = self.__image = None
+
+        if old_words is None:
+            return 0, max(self.__program.size, old_program.size)
+
+        words = self.machine_codes
+        n = min(len(words), len(old_words))
+        lo = next((k for k in range(n) if words[k] != old_words[k]), n)
+
+        if len(words) != len(old_words):
+            return lo * 4, max(len(words), len(old_words)) * 4
+
+        hi = next((k + 1 for k in range(n - 1, lo - 1, -1) if words[k] != old_words[k]), lo)
+        return lo * 4, hi * 4
+
+    def __resolve_labels(self, ks: Iterable[int] = None, report: bool = False) -> List[int]:
+        # Re-resolve label references (all of them by default); returns the instructions whose offset changed.
+        # With `report`, references out of reach of their instruction are reported too
+        program = self.__program
+        labels, inst_label, inst_imm = program.labels, program.inst_label, program.inst_imm
+        inst_reloc = program.inst_reloc
+
+        if ks is None:
+            ks = [k for k, label_id in enumerate(inst_label) if label_id]
+
+        changed = []
+        for k in ks:
+            if not (label_id := inst_label[k]):
+                continue
+
+            i = program.inst_lines[k]
+
+            if (target := self.__jump_targets.get(labels[label_id])) is None:
+                if self.__unit:
+                    continue
+                *_, label_span = parse_instruction(i, program.body(i), program.args_offsets[i], self.__build_err_ctx)
+                raise AsmUndefinedLabelError(*self.__build_err_ctx(i, label_span, 'Undefined label'))
+
+            if inst_imm[k] != (imm := resolve_reloc(inst_reloc[k], target, program.inst_addr(k))):
+                inst_imm[k] = imm
+                changed.append(k)
+
+            if report and not reloc_fits(INST_NAMES[program.inst_ops[k]], inst_reloc[k], imm):
+                *_, label_span = parse_instruction(i, program.body(i), program.args_offsets[i], self.__build_err_ctx)
+                self.__report(AsmOutOfRangeError(*self.__build_err_ctx(i, label_span, 'Jump target out of range')))
+
+        return changed
+
+    def apply_edit(self, line_range: Tuple[int, int], new_text: str) -> Tuple[int, int]:
+        old_program, old_jump_targets = self.__program, self.__jump_targets
+
+        # ! Raise when the lines are not those of the source, expanded from includes and macros
+        if self.__source_map is not None:
+            raise ValueError('Edits not supported for sources with .include or .macro')
+
+        # ! Raise when instructions were removed or reordered
+        if self.__optimized or self.__scheduled:
+            raise ValueError('Edits not supported after optimizing or scheduling')
+
+        a, b = line_range
+        n = len(old_program.line_starts)
+        if not 0 <= a <= b <= n:
+            raise ValueError(f'Invalid line range: {line_range}')
+
+        lines = new_text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        if not lines and a == 0 and b == n:
+            lines = ['']
+
+        # Work on a copy so that a failing edit leaves the parser untouched
+        self.__program = program = old_program.copy()
+        self.__jump_targets = jump_targets = dict(old_jump_targets)
+
+        try:
+            im_start, im_end = program.line_im_ptr(a), program.line_im_ptr(b)
+            k0 = bisect_left(program.inst_lines, a)
+            k1 = bisect_left(program.inst_lines, b)
+
+            im_delta = program.replace_lines(a, b, lines, tokenize('\n'.join(lines)) if lines else ())
+            stop = a + len(lines)
+
+            # Sections can shift anywhere on an edit, they are laid out again as a whole
+            if self.__layout is not None or LINE_TYPE_IDS[AsmLineType.DIRECTIVE] in program.line_types[a:stop]:
+                return self.__reparse(old_program)
+
+            # A relaxed layout stays settled while the edit replaces single words, grows the code and moves no
+            # label: every long form is still needed, short forms out of reach are caught below
+            if self.__relaxed and (im_delta < 0 or any(size > 4 for size in old_program.im_sizes[a:b])
+                                   or LINE_TYPE_IDS[AsmLineType.LABEL] in old_program.line_types[a:b]):
+                return self.__reparse(old_program)
+
+            # Drop the labels of the replaced lines, then move the ones behind them
+            for i in range(a, b):
+                if old_program.line_types[i] == LINE_TYPE_IDS[AsmLineType.LABEL]:
+                    jump_targets.pop(old_program.body(i)[:-1], None)
+
+            if im_delta:
+                # Labels right in front of the edit share its start address but stay put
+                keep = set()
+                for i in range(a - 1, -1, -1):
+                    if old_program.im_ptrs[i] != im_start:
+                        break
+                    if old_program.line_types[i] == LINE_TYPE_IDS[AsmLineType.LABEL]:
+                        keep.add(old_program.body(i)[:-1])
+
+                for label, addr in jump_targets.items():
+                    if addr > im_start or (addr == im_start == im_end and label not in keep):
+                        jump_targets[label] = addr + im_delta
+
+            self.__build_jump_table(a, stop)
+
+            # New references are resolved together with the old ones below
+            parsed = []
+            for i in self.__lines_of_type(AsmLineType.INSTRUCTION, a, stop):
+                inst, args_dict, label, _ = parse_instruction(
+                    i, program.body(i), program.args_offsets[i], self.__build_err_ctx
+                )
+                parsed.append((i, inst, {**args_dict, 'label': label}))
+
+            # Pseudo-instructions can take more than one word
+            if any(inst in pseudo_inst_dict for _, inst, _ in parsed):
+                return self.__reparse(old_program)
+
+            count = program.replace_instructions(k0, k1, parsed, stop - b)
+
+            # Only references into moved, removed or added labels can change outside the edit
+            if im_delta or jump_targets != old_jump_targets:
+                changed = [k for k in self.__resolve_labels() if not k0 <= k < k0 + count]
+            else:
+                self.__resolve_labels(range(k0, k0 + count))
+                changed = []
+
+            inst_ops, inst_imm, inst_label = program.inst_ops, program.inst_imm, program.inst_label
+            inst_reloc = program.inst_reloc
+            if any(inst_label[k] and not reloc_fits(INST_NAMES[inst_ops[k]], inst_reloc[k], inst_imm[k])
+                   for k in chain(changed, range(k0, k0 + count))):
+                return self.__reparse(old_program)
+        except Exception:
+            self.__program, self.__jump_targets = old_program, old_jump_targets
+            raise
+
+        if self.__machine_codes is not None:
+            words = self.__machine_codes
+            words[k0:k1] = array('I', assemble_instructions(program.instructions[k0:k0 + count]))
+            for k in changed:
+                # Absolute references of relaxed `la` and `call` are encoded again
+                if inst_reloc[k] == Reloc.PCREL:
+                    words[k] = patch_offset(words[k], inst_imm[k])
                 else:
-                    span, note = (args_pos['label'], len(label)), 'Undefined label'
-                    raise AsmUndefinedLabelError(*self.__build_err_ctx(line.idx, span, note))
+                    words[k] = assemble_instruction(program.instructions[k])
+
+        # Everything behind the edit moves when its size changes
+        lo = im_start
+        hi = max(program.size, old_program.size) if im_delta else im_end
+        if changed:
+            addrs = [program.inst_addr(k) for k in changed]
+            lo, hi = min(lo, min(addrs)), max(hi, max(addrs) + 4)
+
+        return lo, hi
+
+    def optimize(self) -> 'OptimizeReport':
+        # Peephole rules and dead code removal, see rv32ias.optimize
+        from rv32ias.image import layout_text
+        from rv32ias.optimize import optimize
+
+        # ! Raise when the instructions were reordered, the code is laid out again in source order
+        if self.__scheduled:
+            raise ValueError('Optimize before scheduling')
+
+        program, layout, jump_targets = self.__program, self.__layout, self.__jump_targets
+
+        with timed(self.__stats, 'optimize'):
+            report = optimize(program, jump_targets.values(), self.__address_taken())
+
+            if report.removed:
+                self.__optimized = True
+                self.__machine_codes = self.__image = None
+
+                # Labels in .text move up with the code behind them, the rest follows in __place_sections
+                layout_text(program, layout.text_aligns if layout is not None else ())
+                for i in self.__lines_of_type(AsmLineType.LABEL):
+                    if layout is None or i not in layout.data_lines:
+                        jump_targets[program.body(i)[:-1]] = program.im_ptrs[i]
+
+                self.__place_sections()
+
+        if self.__stats is not None:
+            self.__stats.count('optimize.removed', report.removed)
+            self.__stats.count('optimize.dead', report.dead)
 
-            # ! Raise when invalid register
-            for reg_name in ['rd', 'rs1', 'rs2']:
-                if reg_name in args_dict:
-                    try:
-                        reg_mapper(args_dict[reg_name])
-                    except ValueError:
-                        span, note = (args_pos[reg_name], len(args_dict[reg_name])), 'Invalid register'
-                        raise AsmInvalidRegisterError(*self.__build_err_ctx(line.idx, span, note))
+        return report
+
+    def __address_taken(self) -> List[int]:
+        # Addresses code may be entered at through a register: labels loaded with la or listed in .word, and
+        # exported ones
+        program, layout, jump_targets = self.__program, self.__layout, self.__jump_targets
+        labels, inst_label, inst_reloc = program.labels, program.inst_label, program.inst_reloc
+
+        taken = {labels[label_id] for k, label_id in enumerate(inst_label) if label_id and inst_reloc[k] != Reloc.PCREL}
+        if layout is not None:
+            taken.update(label for _, label in layout.exports)
+            for *_, directive in layout.items:
+                if directive.name == '.word':
+                    taken.update(value for value in directive.values if isinstance(value, str))
+
+        return [jump_targets[label] for label in taken if label in jump_targets]
+
+    def schedule(self) -> 'ScheduleReport':
+        # Reorders instructions within basic blocks to fill load-use stall slots, see rv32ias.schedule
+        from rv32ias.schedule import schedule
+
+        with timed(self.__stats, 'schedule'):
+            report = schedule(self.__program, self.__jump_targets.values())
+
+            if report.moved:
+                self.__scheduled = True
+                self.__machine_codes = self.__image = None
+                self.__resolve_labels()
+
+        if self.__stats is not None:
+            self.__stats.count('schedule.moved', report.moved)
+            self.__stats.count('schedule.stalls_removed', report.removed)
+
+        return report
+
+    @property
+    def program(self) -> Program:
+        return self.__program
 
-            self.__parsed_instructions.append(Instruction(line.idx, inst, **args_dict))
+    @property
+    def asm(self) -> Sequence[AsmLine]:
+        return self.__program.lines
 
     @property
-    def asm(self) -> List[AsmLine]:
-        return self.__asm
+    def diagnostics(self) -> List[AsmDiagnostic]:
+        return self.__diagnostics
 
     @property
     def jump_table(self) -> Dict[str, int]:
         return self.__jump_targets
 
     @property
-    def instructions(self) -> List[Instruction]:
-        return self.__parsed_instructions
+    def instructions(self) -> Sequence[Instruction]:
+        return self.__program.instructions
+
+    @property
+    def machine_codes(self) -> array:
+        if self.__machine_codes is None:
+            with timed(self.__stats, 'encode'):
+                self.__machine_codes = array('I', assemble_instructions(self.instructions))
+
+            if self.__layout is not None:
+                with timed(self.__stats, 'image'):
+                    self.__image = self.__build_image(self.__machine_codes)
+                    self.__machine_codes = self.__image.words()
+
+        return self.__machine_codes
+
+    @property
+    def image(self) -> Optional['MemoryImage']:
+        # Every section in one buffer, only for sources with directives
+        self.machine_codes
+        return self.__image
+
+    def object_unit(self, name: str, key: str = '') -> 'ObjectUnit':
+        # The assembled unit as the linker takes it, see rv32ias.linker
+        from rv32ias.formats import to_le_bytes
+        from rv32ias.image import TEXT
+        from rv32ias.objfile import ObjectSection
+        from rv32ias.objfile import ObjectUnit
+        from rv32ias.objfile import Relocation
+
+        program, layout, jump_targets = self.__program, self.__layout, self.__jump_targets
+        words = self.machine_codes
+
+        if layout is None:
+            sections = [ObjectSection(TEXT, 4, program.size, to_le_bytes(words))]
+            data_labels, exports, items = {}, [], []
+        else:
+            view = self.__image.view
+            sections = []
+            for s in layout.sections:
+                # Sections of zeros such as .bss are stored as their size alone
+                data = bytes(view[s.base:s.base + s.size])
+                sections.append(ObjectSection(s.name, s.align, s.size, data if data.count(0) != s.size else b''))
+            data_labels, exports, items = layout.data_labels, layout.exports, layout.items
+
+        symbols = {label: data_labels.get(label) or (0, addr) for label, addr in jump_targets.items()}
+
+        # ! Raise when exporting a label the unit does not define
+        for line, label in exports:
+            if label not in jump_targets:
+                body = program.body(line)
+                span = (body.find(label, program.args_offsets[line]), len(label))
+                raise AsmUndefinedLabelError(*self.__build_err_ctx(line, span, 'Undefined label'))
+
+        # Absolute addresses all move with the unit, pc relative ones only when they leave it
+        relocations = []
+        labels, inst_label, inst_reloc = program.labels, program.inst_label, program.inst_reloc
+        for k, label_id in enumerate(inst_label):
+            if label_id and (inst_reloc[k] != Reloc.PCREL or labels[label_id] not in jump_targets):
+                line = program.inst_lines[k] + 1
+                relocations.append(Relocation(0, program.inst_addr(k), inst_reloc[k], labels[label_id], line))
+
+        for line, sec, offset, directive in items:
+            if directive.name == '.word':
+                offset = offset if sec else program.im_ptrs[line]
+                relocations.extend(
+                    Relocation(sec, offset + 4 * j, Reloc.ABS32, value, line + 1)
+                    for j, value in enumerate(directive.values) if isinstance(value, str)
+                )
+
+        return ObjectUnit(name, key, sections, symbols, [label for _, label in exports], relocations)
+
+    def __build_image(self, words: array) -> 'MemoryImage':
+        from rv32ias.formats import to_le_bytes
+        from rv32ias.image import MemoryImage
+        from rv32ias.image import align_up
+
+        program, layout = self.__program, self.__layout
+        image = MemoryImage(align_up(layout.size, 4), layout.sections)
+
+        # Instructions go in runs of consecutive words, cut wherever data or padding sits in between
+        code = memoryview(to_le_bytes(words) if sys.byteorder == 'big' else words).cast('B')
+        breaks = sorted({line for line, _ in layout.text_aligns} | {line for line, sec, *_ in layout.items if not sec})
+        ks = [bisect_left(program.inst_lines, line) for line in breaks]
+        for k0, k1 in zip([0] + ks, ks + [len(words)]):
+            if k0 < k1:
+                image.write(program.inst_addr(k0), code[k0 * 4:k1 * 4])
+
+        for line, _ in layout.text_aligns:
+            image.pad(program.im_ptrs[line], program.im_sizes[line])
+        for line, sec, offset, directive in layout.items:
+            addr = layout.address(sec, offset) if sec else program.im_ptrs[line]
+            image.put(addr, directive, self.__jump_targets)
+
+        return image
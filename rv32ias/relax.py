@@ -0,0 +1,294 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from heapq import heappop, heappush
+from itertools import accumulate
+from operator import add
+from typing import Collection, Dict, List, Tuple
+
+from rv32ias.isa import InstType
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.models import INST_NAMES
+from rv32ias.models import Program
+from rv32ias.models import Reloc
+
+__all__ = [
+    'fits_imm12',
+    'fits_imm32',
+    'fits_branch',
+    'fits_jal',
+    'offset_fits',
+    'split_imm',
+    'expand_li',
+    'expand_la',
+    'expand_call',
+    'resolve_reloc',
+    'reloc_fits',
+    'relax',
+]
+
+# Reach of the short forms, in bytes
+BRANCH_REACH = 1 << 12
+JAL_REACH = 1 << 20
+# `la` targets below this fit the 12 bit immediate of a single addi
+LA_REACH = 1 << 11
+
+INVERTED_BRANCHES = {
+    'beq': 'bne', 'bne': 'beq', 'blt': 'bge', 'bge': 'blt', 'bltu': 'bgeu', 'bgeu': 'bltu',
+}
+
+# (line, mnemonic, arguments) as taken by Program.add_instruction
+Row = Tuple[int, str, dict]
+
+
+def fits_imm12(value: int) -> bool:
+    return -2048 <= value <= 2047
+
+
+def fits_imm32(value: int) -> bool:
+    # `li` takes signed and unsigned 32 bit values alike
+    return -(1 << 31) <= value < (1 << 32)
+
+
+def fits_branch(offset: int) -> bool:
+    return -BRANCH_REACH <= offset < BRANCH_REACH
+
+
+def fits_jal(offset: int) -> bool:
+    return -JAL_REACH <= offset < JAL_REACH
+
+
+def offset_fits(inst: str, offset: int) -> bool:
+    return fits_branch(offset) if rv32i_inst_dict[inst].inst_type == InstType.B_ else fits_jal(offset)
+
+
+def split_imm(value: int) -> Tuple[int, int]:
+    # (upper 20 bits for lui, lower 12 for the addi or jalr after it); the lower part is sign extended
+    # by the hardware, so the upper part is rounded to make up for it
+    value &= 0xFFFFFFFF
+    lo = ((value & 0xFFF) ^ 0x800) - 0x800
+    return ((value - lo) >> 12) & 0xFFFFF, lo
+
+
+def expand_li(idx: int, rd: str, rd_num: int, value: int) -> List[Row]:
+    if fits_imm12(value):
+        return [(idx, 'addi', dict(rd=rd, rd_num=rd_num, rs1='zero', rs1_num=0, imm=value))]
+
+    hi, lo = split_imm(value)
+    rows = [(idx, 'lui', dict(rd=rd, rd_num=rd_num, imm=hi))]
+    if lo:
+        rows.append((idx, 'addi', dict(rd=rd, rd_num=rd_num, rs1=rd, rs1_num=rd_num, imm=lo)))
+
+    return rows
+
+
+def expand_la(idx: int, rd: str, rd_num: int, label: str, long: bool) -> List[Row]:
+    # Immediates are left to label resolution, as the address of a data label is only known once sections are placed
+    if not long:
+        return [(idx, 'addi', dict(rd=rd, rd_num=rd_num, rs1='zero', rs1_num=0, label=label, reloc=Reloc.ABS12))]
+    return [
+        (idx, 'lui', dict(rd=rd, rd_num=rd_num, label=label, reloc=Reloc.HI20)),
+        (idx, 'addi', dict(rd=rd, rd_num=rd_num, rs1=rd, rs1_num=rd_num, label=label, reloc=Reloc.LO12)),
+    ]
+
+
+def expand_call(idx: int, label: str, long: bool) -> List[Row]:
+    if not long:
+        return [(idx, 'jal', dict(rd='ra', rd_num=1, label=label))]
+
+    # Out of jal reach: absolute address through ra, which the call overwrites anyway
+    return [
+        (idx, 'lui', dict(rd='ra', rd_num=1, label=label, reloc=Reloc.HI20)),
+        (idx, 'jalr', dict(rd='ra', rd_num=1, rs1='ra', rs1_num=1, label=label, reloc=Reloc.LO12)),
+    ]
+
+
+def resolve_reloc(reloc: int, target: int, addr: int) -> int:
+    if reloc == Reloc.PCREL:
+        return target - addr
+    if reloc == Reloc.HI20:
+        return split_imm(target)[0]
+    if reloc == Reloc.LO12:
+        return split_imm(target)[1]
+    return target
+
+
+def reloc_fits(inst: str, reloc: int, imm: int) -> bool:
+    if reloc == Reloc.PCREL:
+        return offset_fits(inst, imm)
+    return reloc != Reloc.ABS12 or fits_imm12(imm)
+
+
+def relax(program: Program, items: List[Tuple[int, str, dict]], jump_targets: Dict[str, int],
+          data_labels: Collection[str] = (), long_la: bool = False) -> None:
+    # `items` are the (line, 'li' | 'la' | 'call', arguments) lines that have no instruction yet. Lines only
+    # ever grow from 4 to 8 bytes, starting from the layout where every one of them takes 4, so a worklist
+    # of the short forms a growth can break converges; it is then laid out again and its final instructions
+    # emitted. Label references are left for the caller to resolve, `la` of a label in `data_labels` is
+    # always long as data is placed behind the code, and so is every `la` with `long_la`. References to
+    # labels missing from `jump_targets` belong to other units: they keep their short form.
+    im_ptrs = program.im_ptrs
+    n = len(im_ptrs)
+    growth = 0
+
+    # Fenwick tree of the growth in front of each line, moving everything behind a line is O(log n)
+    tree = [0] * (n + 1)
+    grown = bytearray(n)
+
+    def addr(i: int) -> int:
+        a = im_ptrs[i]
+        while i:
+            a += tree[i]
+            i &= i - 1
+        return a
+
+    def target_line(label: str) -> int:
+        # Labels share the line numbering of the layout, and so move along with it
+        return bisect_left(im_ptrs, jump_targets[label])
+
+    # Candidates: labelled branches, calls, and `la` grouped by target
+    labels, inst_label, inst_ops, inst_lines = program.labels, program.inst_label, program.inst_ops, program.inst_lines
+    branch_ops = {i for i, inst in enumerate(INST_NAMES) if rv32i_inst_dict[inst].inst_type == InstType.B_}
+
+    br_rows = [
+        k for k, label_id in enumerate(inst_label)
+        if label_id and inst_ops[k] in branch_ops and labels[label_id] in jump_targets
+    ]
+    br_lines = [inst_lines[k] for k in br_rows]
+    br_targets = [target_line(labels[inst_label[k]]) for k in br_rows]
+    br_long, br_queued = bytearray(len(br_rows)), bytearray(len(br_rows))
+
+    calls = [(i, args) for i, inst, args in items if inst == 'call' and args['label'] in jump_targets]
+    call_lines = [i for i, _ in calls]
+    call_targets = [target_line(args['label']) for _, args in calls]
+    call_long, call_queued = bytearray(len(calls)), bytearray(len(calls))
+    # A call reaches far wider than any window, it waits here until the growth so far could have used up
+    # the margin it had when last checked: (growth to look again at, call)
+    call_heap = []
+
+    la_groups: Dict[int, List[int]] = {}
+    for i, inst, args in items:
+        if inst == 'la' and not long_la and args['label'] not in data_labels:
+            la_groups.setdefault(target_line(args['label']), []).append(i)
+    la_targets = sorted(la_groups)
+    la_long, la_queued = set(), set()
+
+    worklist = deque()
+
+    def enqueue_window(lines: list, reach: int, long: bytearray, queued: bytearray, kind: int, at: int) -> None:
+        # Lines behind the growth have just moved 4 further away
+        lo = bisect_left(lines, at - reach, key=addr)
+        hi = bisect_right(lines, at + reach + 4, key=addr)
+        for j in range(lo, hi):
+            if not long[j] and not queued[j]:
+                queued[j] = 1
+                worklist.append((kind, j))
+
+    def grow(i: int, spread: bool = True) -> None:
+        nonlocal growth
+        grown[i] = 4
+        growth += 4
+
+        j = i + 1
+        while j <= n:
+            tree[j] += 4
+            j += j & -j
+
+        if not spread:
+            return
+
+        # Only short forms that reach across line i can break
+        at = addr(i)
+        enqueue_window(br_lines, BRANCH_REACH, br_long, br_queued, 0, at)
+        while call_heap and call_heap[0][0] <= growth:
+            _, j = heappop(call_heap)
+            if not call_queued[j]:
+                call_queued[j] = 1
+                worklist.append((1, j))
+        if at < LA_REACH:
+            for j in range(bisect_right(la_targets, i), len(la_targets)):
+                if addr(t := la_targets[j]) >= LA_REACH + 4:
+                    break
+                if t not in la_queued:
+                    la_queued.add(t)
+                    worklist.append((2, t))
+
+    # Sizes known up front, every candidate is checked once against them
+    for i, inst, args in items:
+        if inst == 'li' and len(expand_li(i, args['rd'], args['rd_num'], args['imm'])) > 1:
+            grow(i, spread=False)
+        elif inst == 'la' and (long_la or args['label'] in data_labels):
+            grow(i, spread=False)
+
+    br_queued[:] = b'\x01' * len(br_rows)
+    call_queued[:] = b'\x01' * len(calls)
+    la_queued.update(la_targets)
+    worklist.extend((0, j) for j in range(len(br_rows)))
+    worklist.extend((1, j) for j in range(len(calls)))
+    worklist.extend((2, t) for t in la_targets)
+
+    while worklist:
+        kind, j = worklist.popleft()
+
+        if kind == 0:
+            br_queued[j] = 0
+            if not br_long[j] and not fits_branch(addr(br_targets[j]) - addr(br_lines[j])):
+                br_long[j] = 1
+                grow(br_lines[j])
+        elif kind == 1:
+            call_queued[j] = 0
+            offset = addr(call_targets[j]) - addr(call_lines[j])
+            if not fits_jal(offset):
+                call_long[j] = 1
+                grow(call_lines[j])
+            else:
+                margin = JAL_REACH - 1 - offset if offset >= 0 else JAL_REACH + offset
+                heappush(call_heap, (growth + margin + 1, j))
+        else:
+            la_queued.discard(j)
+            if j not in la_long and addr(j) >= LA_REACH:
+                la_long.add(j)
+                for i in la_groups[j]:
+                    grow(i)
+
+    # Final layout
+    new_im_ptrs = array('I', map(add, im_ptrs, accumulate(grown, initial=0)))
+    im_sizes = program.im_sizes
+    for i, g in enumerate(grown):
+        if g:
+            im_sizes[i] += g
+
+    for label, target in jump_targets.items():
+        if label not in data_labels and (i := bisect_left(im_ptrs, target)) < n:
+            jump_targets[label] = new_im_ptrs[i]
+    program.im_ptrs = new_im_ptrs
+
+    # Instructions of the grown lines and the items
+    regs, reg_nums = program.regs, program.reg_nums
+    edits = []
+
+    for j, k in enumerate(br_rows):
+        if br_long[j]:
+            i, rs1, rs2 = inst_lines[k], program.inst_rs1[k], program.inst_rs2[k]
+            inst = INVERTED_BRANCHES[INST_NAMES[inst_ops[k]]]
+            edits.append((k, k + 1, [
+                (i, inst, dict(rs1=regs[rs1], rs1_num=reg_nums[rs1], rs2=regs[rs2], rs2_num=reg_nums[rs2], imm=8)),
+                (i, 'jal', dict(rd='zero', rd_num=0, label=labels[inst_label[k]])),
+            ]))
+
+    calls_long = {i for j, (i, _) in enumerate(calls) if call_long[j]}
+    for i, inst, args in items:
+        if inst == 'li':
+            rows = expand_li(i, args['rd'], args['rd_num'], args['imm'])
+        elif inst == 'la':
+            label = args['label']
+            rows = expand_la(i, args['rd'], args['rd_num'], label,
+                             long_la or label in data_labels or jump_targets[label] >= LA_REACH)
+        else:
+            rows = expand_call(i, args['label'], i in calls_long)
+
+        k = bisect_left(inst_lines, i)
+        edits.append((k, k, rows))
+
+    edits.sort(key=lambda edit: (edit[0], edit[1]))
+    program.splice_instructions(edits)
@@ -0,0 +1,238 @@
+from array import array
+from heapq import heappop, heappush
+from typing import Collection, List, NamedTuple, Optional, Tuple
+
+from rv32ias.isa import InstType
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.models import INST_IDS
+from rv32ias.models import Program
+
+__all__ = [
+    'ScheduleReport',
+    'row_addrs',
+    'reg_columns',
+    'load_use_stalls',
+    'schedule',
+]
+
+LOAD_OPS = frozenset(INST_IDS[inst] for inst in ('lb', 'lh', 'lw', 'lbu', 'lhu'))
+STORE_OPS = frozenset(INST_IDS[inst] for inst in ('sb', 'sh', 'sw'))
+# Branches and jumps end a basic block and stay its last instruction
+END_OPS = frozenset(
+    INST_IDS[inst] for inst, inst_def in rv32i_inst_dict.items() if inst_def.inst_type in (InstType.B_, InstType.J_)
+) | {INST_IDS['jalr']}
+
+# Cycles until a register written by a load can be used: on an in-order 5 stage pipeline the loaded value is
+# forwarded from the memory stage, so an instruction right behind the load stalls one cycle
+LOAD_LATENCY = 2
+
+
+class ScheduleReport(NamedTuple):
+    blocks: int
+    # Blocks laid out in another order
+    scheduled: int
+    # Instructions now at another address
+    moved: int
+    # Load-use stall cycles of one pass through the code, before and after
+    stalls_before: int
+    stalls_after: int
+
+    @property
+    def removed(self) -> int:
+        return self.stalls_before - self.stalls_after
+
+
+def row_addrs(program: Program) -> array:
+    # Address of every instruction row, lines expanded to several words lay them out one after the other
+    inst_lines, im_ptrs = program.inst_lines, program.im_ptrs
+    addrs = array('I', bytes(4 * len(inst_lines)))
+
+    line, addr = -1, 0
+    for k, i in enumerate(inst_lines):
+        addr = addr + 4 if i == line else im_ptrs[i]
+        addrs[k], line = addr, i
+
+    return addrs
+
+
+def reg_columns(program: Program) -> Tuple[array, array, array]:
+    # Register numbers of every row, 0 for none: x0 is never a dependency
+    reg_nums = program.reg_nums
+    return tuple(array('B', [reg_nums[r] for r in column]) for column in (
+        program.inst_rd, program.inst_rs1, program.inst_rs2
+    ))
+
+
+def __stall(ops, rd, rs1, rs2, k: int, n: int) -> bool:
+    # Row n uses the register row k loads
+    return ops[k] in LOAD_OPS and rd[k] != 0 and rd[k] in (rs1[n], rs2[n])
+
+
+def load_use_stalls(program: Program, addrs: Optional[array] = None) -> int:
+    # Stall cycles of every load directly followed by a user of its result, where one runs into the other
+    addrs = addrs if addrs is not None else row_addrs(program)
+    ops, (rd, rs1, rs2) = program.inst_ops, reg_columns(program)
+
+    return sum(
+        __stall(ops, rd, rs1, rs2, k, k + 1) for k in range(len(addrs) - 1) if addrs[k + 1] == addrs[k] + 4
+    )
+
+
+def __blocks(program: Program, addrs: array, targets: Collection[int]) -> List[range]:
+    # Runs of rows that are only entered at the top and left at the bottom: split at jump targets, after
+    # branches and jumps, and around data, padding and lines of more than one word, which stay where they are
+    inst_lines, im_sizes, ops = program.inst_lines, program.im_sizes, program.inst_ops
+
+    blocks, start = [], 0
+    for k in range(1, len(addrs)):
+        if (addrs[k] != addrs[k - 1] + 4 or addrs[k] in targets or ops[k - 1] in END_OPS
+                or im_sizes[inst_lines[k]] != 4 or im_sizes[inst_lines[k - 1]] != 4):
+            blocks.append(range(start, k))
+            start = k
+    if addrs:
+        blocks.append(range(start, len(addrs)))
+
+    return blocks
+
+
+def __order(ops, rd, rs1, rs2, rows: range, prev: int, tail: int) -> List[int]:
+    # List scheduling over the dependency graph of the rows, the highest first, but never the user of the
+    # load just placed while something else is ready. `prev` and `tail` are the rows running into the block
+    # and following it, or -1
+    n = len(rows)
+    dst, src1, src2 = rd[rows.start:rows.stop], rs1[rows.start:rows.stop], rs2[rows.start:rows.stop]
+    # Register each row loads, 0 for rows other than loads
+    loaded = [r if op in LOAD_OPS else 0 for op, r in zip(ops[rows.start:rows.stop], dst)]
+    stores = [op in STORE_OPS for op in ops[rows.start:rows.stop]]
+
+    preds: List[set] = [set() for _ in range(n)]
+    last_write, reads, last_store, loads = {}, {}, -1, []
+
+    for j in range(n):
+        deps, r1, r2, w = preds[j], src1[j], src2[j], dst[j]
+
+        # Read after write, write after write and write after read
+        if r1 in last_write:
+            deps.add(last_write[r1])
+        if r2 in last_write:
+            deps.add(last_write[r2])
+        if w:
+            if w in last_write:
+                deps.add(last_write[w])
+            deps.update(reads.get(w, ()))
+
+        # Memory is one location: loads stay behind stores, stores behind both
+        if stores[j]:
+            if last_store >= 0:
+                deps.add(last_store)
+            deps.update(loads)
+            last_store, loads = j, []
+        elif loaded[j]:
+            if last_store >= 0:
+                deps.add(last_store)
+            loads.append(j)
+
+        if r1:
+            reads.setdefault(r1, []).append(j)
+        if r2 and r2 != r1:
+            reads.setdefault(r2, []).append(j)
+        if w:
+            last_write[w], reads[w] = j, []
+
+        deps.discard(j)
+
+    succs: List[List[int]] = [[] for _ in range(n)]
+    for j, deps in enumerate(preds):
+        for d in deps:
+            succs[d].append(j)
+
+    # Longest latency path to the end of the block
+    height = [1] * n
+    tail_reads = (rs1[tail], rs2[tail]) if tail >= 0 else ()
+    for j in range(n - 1, -1, -1):
+        r = loaded[j]
+        h = LOAD_LATENCY if r and r in tail_reads else 1
+        for s in succs[j]:
+            h = max(h, (LOAD_LATENCY if r and (r == src1[s] or r == src2[s]) else 1) + height[s])
+        height[j] = h
+
+    waiting = [len(deps) for deps in preds]
+    ready = [(-height[j], j) for j in range(n) if not waiting[j]]
+    ready.sort()
+
+    order = []
+    last = rd[prev] if prev >= 0 and ops[prev] in LOAD_OPS else 0
+    while ready:
+        # Skip over users of the last load while there is anything else to place
+        skipped, pick = [], None
+        while ready:
+            item = heappop(ready)
+            if not last or (last != src1[item[1]] and last != src2[item[1]]):
+                pick = item
+                break
+            skipped.append(item)
+        if pick is None:
+            pick = skipped.pop(0)
+        for item in skipped:
+            heappush(ready, item)
+
+        j = pick[1]
+        order.append(j)
+        last = loaded[j]
+        for s in succs[j]:
+            waiting[s] -= 1
+            if not waiting[s]:
+                heappush(ready, (-height[s], s))
+
+    return order
+
+
+def schedule(program: Program, targets: Collection[int]) -> ScheduleReport:
+    # Reorders the instructions of every basic block to fill load-use stall slots, in place. Blocks keep their
+    # address range, so labels stay put and only the lines moved within a block get new addresses
+    addrs = row_addrs(program)
+    targets = set(targets)
+    ops, (rd, rs1, rs2) = program.inst_ops, reg_columns(program)
+    inst_lines, im_ptrs = program.inst_lines, program.im_ptrs
+
+    def cost(rows: List[int], prev: int, after: int) -> int:
+        chain = ([prev] if prev >= 0 else []) + rows + ([after] if after >= 0 else [])
+        return sum(__stall(ops, rd, rs1, rs2, a, b) for a, b in zip(chain, chain[1:]))
+
+    stalls_before = load_use_stalls(program, addrs)
+    blocks = __blocks(program, addrs, targets)
+    scheduled = moved = 0
+
+    for rows in blocks:
+        # Rows running into the block and out of it, unless data sits in between
+        start, stop = rows.start, rows.stop
+        prev = start - 1 if start and addrs[start] == addrs[start - 1] + 4 else -1
+        after = stop if stop < len(addrs) and addrs[stop] == addrs[stop - 1] + 4 else -1
+
+        # The branch or jump that ends the block stays last
+        end = stop - 1 if ops[stop - 1] in END_OPS else stop
+        if end - start < 2:
+            continue
+
+        before = cost(list(rows), prev, after)
+        if not before:
+            continue
+
+        tail = end if end < stop else after
+        order = [start + j for j in __order(ops, rd, rs1, rs2, range(start, end), prev, tail)] + list(range(end, stop))
+        if cost(order, prev, after) >= before:
+            continue
+
+        for column in [getattr(program, name) for name in Program.INST_COLUMNS] + [rd, rs1, rs2]:
+            column[start:stop] = array(column.typecode, [column[k] for k in order])
+
+        # Every line of the block is one word, the block keeps its address range
+        for j in range(start, stop):
+            im_ptrs[inst_lines[j]] = addrs[j]
+
+        scheduled += 1
+        moved += sum(k != j for j, k in enumerate(order, start))
+
+    stalls_after = load_use_stalls(program, addrs) if scheduled else stalls_before
+
+    return ScheduleReport(len(blocks), scheduled, moved, stalls_before, stalls_after)
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import signal
+import stat
+import struct
+import sys
+from functools import partial
+from typing import Any, BinaryIO, Optional
+
+from rv32ias.exceptions import AsmDiagnostic
+from rv32ias.exceptions import AsmParseError
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.pipeline import assemble
+from rv32ias.preprocessor import AsmParser
+
+__all__ = [
+    'FRAMINGS',
+    'MAX_MESSAGE_SIZE',
+    'AsmProtocolError',
+    'encode_message',
+    'read_message',
+    'read_message_async',
+    'handle_request',
+    'warm_up',
+    'serve_stdio',
+    'serve_unix',
+]
+
+# 'lines': one JSON document per line, 'length': 4 byte big endian size, then the JSON document
+FRAMINGS = ('lines', 'length')
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+__LENGTH = struct.Struct('>I')
+
+
+class AsmProtocolError(Exception):
+    pass
+
+
+def encode_message(message: dict, framing: str = 'lines') -> bytes:
+    # JSON escapes newlines inside strings, so a document always fits on one line
+    data = json.dumps(message, separators=(',', ':')).encode()
+
+    if framing == 'length':
+        return __LENGTH.pack(len(data)) + data
+    return data + b'\n'
+
+
+def __check_size(size: int) -> None:
+    if size > MAX_MESSAGE_SIZE:
+        raise AsmProtocolError(f'Message of {size} bytes is over the {MAX_MESSAGE_SIZE} byte limit')
+
+
+def read_message(stream: BinaryIO, framing: str = 'lines') -> Optional[bytes]:
+    if framing == 'length':
+        header = stream.read(__LENGTH.size)
+        if len(header) < __LENGTH.size:
+            return None
+
+        (size,) = __LENGTH.unpack(header)
+        __check_size(size)
+
+        payload = stream.read(size)
+        if len(payload) < size:
+            raise AsmProtocolError('Connection closed in the middle of a message')
+        return payload
+
+    while line := stream.readline(MAX_MESSAGE_SIZE + 1):
+        __check_size(len(line) - 1)
+        if line.strip():
+            return line
+
+    return None
+
+
+async def read_message_async(reader: asyncio.StreamReader, framing: str = 'lines') -> Optional[bytes]:
+    try:
+        if framing == 'length':
+            (size,) = __LENGTH.unpack(await reader.readexactly(__LENGTH.size))
+            __check_size(size)
+            return await reader.readexactly(size)
+
+        while line := await reader.readline():
+            if line.strip():
+                return line
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise AsmProtocolError('Connection closed in the middle of a message')
+    except (asyncio.LimitOverrunError, ValueError):
+        # readline() reports an overlong line as ValueError
+        raise AsmProtocolError(f'Message is over the {MAX_MESSAGE_SIZE} byte limit')
+
+    return None
+
+
+def __diagnostic_to_dict(diagnostic: AsmDiagnostic, context: bool) -> dict:
+    entry = {
+        'type': diagnostic.error.error_type,
+        'line': diagnostic.line,
+        'span': list(diagnostic.span) if diagnostic.span is not None else None,
+        'note': diagnostic.note,
+    }
+    if diagnostic.source is not None:
+        entry['source'] = diagnostic.source
+
+    # Rendering the code space is the costly part of an error, so clients opt in
+    if context:
+        entry['context'] = diagnostic.render_ctx()
+
+    return entry
+
+
+def handle_request(payload: bytes, cache_dir: Optional[str] = None) -> dict:
+    try:
+        request = json.loads(payload)
+        source = request['source']
+        max_errors = request.get('max_errors')
+        base_dir = request.get('base_dir')
+        if not isinstance(source, str):
+            raise TypeError('source must be a string')
+        if max_errors is not None and (not isinstance(max_errors, int) or max_errors < 1):
+            raise TypeError('max_errors must be a positive integer')
+        if base_dir is not None and not isinstance(base_dir, str):
+            raise TypeError('base_dir must be a string')
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return {'id': None, 'ok': False, 'error': f'Bad request: {e!r}'}
+
+    request_id = request.get('id')
+
+    try:
+        return __assemble_request(request_id, source, max_errors, bool(request.get('context')), cache_dir, base_dir)
+    except Exception as e:
+        # ! One bad request must not take the server down with it
+        return {'id': request_id, 'ok': False, 'error': f'Internal error: {e!r}'}
+
+
+def __assemble_request(request_id: Any, source: str, max_errors: Optional[int], context: bool,
+                       cache_dir: Optional[str], base_dir: Optional[str]) -> dict:
+    try:
+        words = assemble(source, cache_dir, base_dir=base_dir)
+    except AsmParseError:
+        # Only failing sources are parsed a second time, now collecting every error
+        asm_parser = AsmParser(source, collect_errors=True, max_errors=max_errors, base_dir=base_dir)
+        errors = [__diagnostic_to_dict(d, context) for d in asm_parser.diagnostics]
+
+        return {'id': request_id, 'ok': False, 'errors': errors}
+
+    return {'id': request_id, 'ok': True, 'words': words}
+
+
+def warm_up() -> None:
+    # Pay for lazy imports and pattern compilation before the first request arrives
+    for inst_def in rv32i_inst_dict.values():
+        inst_def.inst_arg_pattern
+    assemble('warm_up:\n    addi t0, zero, 1\n    beq  t0, zero, warm_up\n')
+
+
+def serve_stdio(framing: str = 'lines', cache_dir: Optional[str] = None) -> None:
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+    try:
+        while (payload := read_message(stdin, framing)) is not None:
+            stdout.write(encode_message(handle_request(payload, cache_dir), framing))
+            stdout.flush()
+    except AsmProtocolError as e:
+        stdout.write(encode_message({'id': None, 'ok': False, 'error': str(e)}, framing))
+        stdout.flush()
+
+
+async def __serve_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         framing: str, cache_dir: Optional[str]) -> None:
+    # Requests of one client are answered in order. They are assembled on worker threads, so a large request
+    # does not hold up reading and answering other clients
+    loop = asyncio.get_running_loop()
+    try:
+        while (payload := await read_message_async(reader, framing)) is not None:
+            response = await loop.run_in_executor(None, handle_request, payload, cache_dir)
+            writer.write(encode_message(response, framing))
+            await writer.drain()
+    except AsmProtocolError as e:
+        writer.write(encode_message({'id': None, 'ok': False, 'error': str(e)}, framing))
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def __serve_unix(socket_path: str, framing: str, cache_dir: Optional[str]) -> None:
+    server = await asyncio.start_unix_server(
+        partial(__serve_client, framing=framing, cache_dir=cache_dir), socket_path, limit=MAX_MESSAGE_SIZE
+    )
+
+    # SIGTERM stops the server cleanly, so the socket file gets removed
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+
+    async with server:
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+
+def serve_unix(socket_path: str, framing: str = 'lines', cache_dir: Optional[str] = None) -> None:
+    # A socket left behind by a previous server is replaced, anything else is not ours to remove
+    try:
+        if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+    except FileNotFoundError:
+        pass
+
+    try:
+        asyncio.run(__serve_unix(socket_path, framing, cache_dir))
+    finally:
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
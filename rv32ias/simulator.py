@@ -0,0 +1,327 @@
+import struct
+from array import array
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from rv32ias.disassembler import decode_word
+from rv32ias.formats import to_le_bytes
+from rv32ias.isa import reg_mapper
+
+__all__ = [
+    'HaltReason',
+    'SimulatorError',
+    'Simulator',
+    'predecode',
+]
+
+MASK = 0xFFFFFFFF
+SIGN = 0x80000000
+
+# Memory given to a program when no size is asked for, the stack starts at its top
+MEMORY_SIZE = 1 << 20
+
+__u16 = struct.Struct('<H')
+__u32 = struct.Struct('<I')
+
+
+class HaltReason(Enum):
+    SELF_LOOP = 'self loop'
+    STEP_LIMIT = 'step limit'
+    END_OF_CODE = 'end of code'
+
+
+class SimulatorError(Exception):
+    def __init__(self, pc: int, msg: str):
+        self.pc = pc
+        super().__init__(f'Simulator Error: at pc {pc:08X} ({msg})')
+
+
+# Handlers take (regs, memory, pc, rd, rs1, rs2, imm) and return the next pc.
+# A destination of x0 is redirected to a scratch register, so no handler needs to guard against writing it
+def __add(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (x[rs1] + x[rs2]) & MASK
+    return pc + 4
+
+
+def __sub(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (x[rs1] - x[rs2]) & MASK
+    return pc + 4
+
+
+def __xor(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] ^ x[rs2]
+    return pc + 4
+
+
+def __or(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] | x[rs2]
+    return pc + 4
+
+
+def __and(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] & x[rs2]
+    return pc + 4
+
+
+def __sll(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (x[rs1] << (x[rs2] & 0x1F)) & MASK
+    return pc + 4
+
+
+def __srl(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] >> (x[rs2] & 0x1F)
+    return pc + 4
+
+
+def __sra(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (((x[rs1] ^ SIGN) - SIGN) >> (x[rs2] & 0x1F)) & MASK
+    return pc + 4
+
+
+def __slt(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = int((x[rs1] ^ SIGN) < (x[rs2] ^ SIGN))
+    return pc + 4
+
+
+def __sltu(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = int(x[rs1] < x[rs2])
+    return pc + 4
+
+
+def __addi(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (x[rs1] + imm) & MASK
+    return pc + 4
+
+
+def __xori(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] ^ (imm & MASK)
+    return pc + 4
+
+
+def __ori(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] | (imm & MASK)
+    return pc + 4
+
+
+def __andi(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] & imm & MASK
+    return pc + 4
+
+
+def __slli(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (x[rs1] << imm) & MASK
+    return pc + 4
+
+
+def __srli(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = x[rs1] >> imm
+    return pc + 4
+
+
+def __srai(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = (((x[rs1] ^ SIGN) - SIGN) >> imm) & MASK
+    return pc + 4
+
+
+def __slti(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = int((x[rs1] ^ SIGN) - SIGN < imm)
+    return pc + 4
+
+
+def __sltiu(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = int(x[rs1] < (imm & MASK))
+    return pc + 4
+
+
+def __lb(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = ((m[(x[rs1] + imm) & MASK] ^ 0x80) - 0x80) & MASK
+    return pc + 4
+
+
+def __lh(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = ((__u16.unpack_from(m, (x[rs1] + imm) & MASK)[0] ^ 0x8000) - 0x8000) & MASK
+    return pc + 4
+
+
+def __lw(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = __u32.unpack_from(m, (x[rs1] + imm) & MASK)[0]
+    return pc + 4
+
+
+def __lbu(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = m[(x[rs1] + imm) & MASK]
+    return pc + 4
+
+
+def __lhu(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = __u16.unpack_from(m, (x[rs1] + imm) & MASK)[0]
+    return pc + 4
+
+
+def __sb(x, m, pc, rd, rs1, rs2, imm):
+    m[(x[rs1] + imm) & MASK] = x[rs2] & 0xFF
+    return pc + 4
+
+
+def __sh(x, m, pc, rd, rs1, rs2, imm):
+    __u16.pack_into(m, (x[rs1] + imm) & MASK, x[rs2] & 0xFFFF)
+    return pc + 4
+
+
+def __sw(x, m, pc, rd, rs1, rs2, imm):
+    __u32.pack_into(m, (x[rs1] + imm) & MASK, x[rs2])
+    return pc + 4
+
+
+def __beq(x, m, pc, rd, rs1, rs2, imm):
+    return pc + imm if x[rs1] == x[rs2] else pc + 4
+
+
+def __bne(x, m, pc, rd, rs1, rs2, imm):
+    return pc + imm if x[rs1] != x[rs2] else pc + 4
+
+
+def __blt(x, m, pc, rd, rs1, rs2, imm):
+    return pc + imm if (x[rs1] ^ SIGN) < (x[rs2] ^ SIGN) else pc + 4
+
+
+def __bge(x, m, pc, rd, rs1, rs2, imm):
+    return pc + imm if (x[rs1] ^ SIGN) >= (x[rs2] ^ SIGN) else pc + 4
+
+
+def __bltu(x, m, pc, rd, rs1, rs2, imm):
+    return pc + imm if x[rs1] < x[rs2] else pc + 4
+
+
+def __bgeu(x, m, pc, rd, rs1, rs2, imm):
+    return pc + imm if x[rs1] >= x[rs2] else pc + 4
+
+
+def __jal(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = pc + 4
+    return (pc + imm) & MASK
+
+
+def __jalr(x, m, pc, rd, rs1, rs2, imm):
+    target = (x[rs1] + imm) & 0xFFFFFFFE
+    x[rd] = pc + 4
+    return target
+
+
+def __lui(x, m, pc, rd, rs1, rs2, imm):
+    x[rd] = imm
+    return pc + 4
+
+
+def __illegal(x, m, pc, rd, rs1, rs2, imm):
+    raise SimulatorError(pc, f'Illegal instruction {imm:08X}')
+
+
+__HANDLERS = {
+    'add': __add, 'sub': __sub, 'xor': __xor, 'or': __or, 'and': __and,
+    'sll': __sll, 'srl': __srl, 'sra': __sra, 'slt': __slt, 'sltu': __sltu,
+    'addi': __addi, 'xori': __xori, 'ori': __ori, 'andi': __andi,
+    'slli': __slli, 'srli': __srli, 'srai': __srai, 'slti': __slti, 'sltiu': __sltiu,
+    'lb': __lb, 'lh': __lh, 'lw': __lw, 'lbu': __lbu, 'lhu': __lhu,
+    'sb': __sb, 'sh': __sh, 'sw': __sw,
+    'beq': __beq, 'bne': __bne, 'blt': __blt, 'bge': __bge, 'bltu': __bltu, 'bgeu': __bgeu,
+    'jal': __jal, 'jalr': __jalr, 'lui': __lui,
+}
+
+Decoded = Tuple[Callable[..., int], int, int, int, int]
+
+
+def predecode(words: Sequence[int], base: int = 0) -> Dict[int, Decoded]:
+    # pc -> (handler, rd, rs1, rs2, imm); a missing pc is outside the code, misaligned or past its end
+    code: Dict[int, Decoded] = {}
+    decoded: Dict[int, Decoded] = {}
+
+    for i, word in enumerate(words):
+        # Equal words decode to the same tuple, whatever their address
+        if (entry := decoded.get(word)) is None:
+            if (fields := decode_word(word)) is None:
+                entry = (__illegal, 32, 0, 0, word)
+            else:
+                imm = fields.imm << 12 if fields.inst == 'lui' else fields.imm
+                entry = (__HANDLERS[fields.inst], fields.rd or 32, fields.rs1, fields.rs2, imm)
+            decoded[word] = entry
+
+        code[base + i * 4] = entry
+
+    return code
+
+
+class Simulator:
+    def __init__(self, words: Sequence[int], base: int = 0, memory_size: int = MEMORY_SIZE):
+        end = base + len(words) * 4
+        if end > memory_size:
+            raise ValueError(f'Image ends at {end:#x}, past the {memory_size:#x} bytes of memory')
+
+        # Flat little endian memory, the image is copied in once through a view
+        self.memory = bytearray(memory_size)
+        memoryview(self.memory)[base:end] = to_le_bytes(array('I', words))
+
+        # x0 reads as zero, writes to it land in the extra slot at index 32
+        self.__regs = [0] * 33
+        self.__regs[reg_mapper('sp')] = memory_size & MASK
+
+        self.__code = predecode(words, base)
+        self.__end = end
+        self.pc = base
+        self.steps = 0
+        self.halted: Optional[HaltReason] = None
+
+    @property
+    def regs(self) -> List[int]:
+        return [0] + self.__regs[1:32]
+
+    def reg(self, reg: Union[str, int]) -> int:
+        return self.regs[reg if isinstance(reg, int) else reg_mapper(reg)]
+
+    def set_reg(self, reg: Union[str, int], value: int) -> None:
+        if (num := reg if isinstance(reg, int) else reg_mapper(reg)) != 0:
+            self.__regs[num] = value & MASK
+
+    def load_word(self, addr: int) -> int:
+        return int.from_bytes(self.memory[addr:addr + 4], 'little')
+
+    def step(self) -> Optional[HaltReason]:
+        reason = self.run(1)
+        return None if reason == HaltReason.STEP_LIMIT else reason
+
+    def run(self, max_steps: Optional[int] = None) -> HaltReason:
+        if self.halted is not None and self.halted != HaltReason.STEP_LIMIT:
+            return self.halted
+
+        code = self.__code
+        x = self.__regs
+        mem = self.memory
+        pc = self.pc
+        left = -1 if max_steps is None else max_steps
+        reason = HaltReason.STEP_LIMIT
+
+        try:
+            while left:
+                if (entry := code.get(pc)) is None:
+                    if pc == self.__end:
+                        reason = HaltReason.END_OF_CODE
+                        break
+                    raise SimulatorError(pc, 'Jumped outside the code' if pc & 3 == 0 else 'Misaligned pc')
+
+                handler, rd, rs1, rs2, imm = entry
+                npc = handler(x, mem, pc, rd, rs1, rs2, imm)
+                left -= 1
+
+                # `exit: jal t2, exit` and friends spin forever, stop at the first lap
+                if npc == pc:
+                    reason = HaltReason.SELF_LOOP
+                    break
+                pc = npc
+        except (IndexError, struct.error):
+            raise SimulatorError(pc, 'Memory access out of range') from None
+        finally:
+            self.steps += (max_steps if max_steps is not None else -1) - left
+            self.pc = pc
+
+        self.halted = reason
+        return reason
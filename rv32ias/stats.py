@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Dict, Iterator, Optional
+
+__all__ = [
+    'AsmStats',
+    'timed',
+]
+
+# Shared by every untimed stage, so disabled stats cost one comparison per stage
+__NO_STATS = nullcontext()
+
+
+class AsmStats:
+    # Stages: load, cache, preprocess, analysis, layout, jump_table, parse, relax, optimize, schedule, encode,
+    # image, assemble, link, output
+    # Counters: lines.<line type>, instructions.<format>, labels, errors, cache.hits/misses, include.hits/misses,
+    # includes, macro_expansions, optimize.removed/dead, schedule.moved/stalls_removed, units(.rebuilt),
+    # bytes_read/written
+    def __init__(self, callback: Optional[Callable[[str, float], None]] = None):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.__callback = callback
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+            if self.__callback is not None:
+                self.__callback(name, elapsed)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self) -> dict:
+        return {'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+    def to_json(self) -> str:
+        import json
+        return json.dumps(self.to_dict(), indent=2)
+
+    def format(self) -> str:
+        total = sum(self.timings.values())
+
+        rows = [f"{'Stage':<12} {'ms':>10} {'share':>7}"]
+        for name, seconds in self.timings.items():
+            share = seconds / total if total else 0
+            rows.append(f'{name:<12} {seconds * 1000:10.3f} {share:7.1%}')
+        rows.append(f"{'total':<12} {total * 1000:10.3f}")
+
+        if self.counters:
+            rows.append('')
+            width = max(map(len, self.counters))
+            rows.extend(f'{name:<{width}} {value:>12,}' for name, value in sorted(self.counters.items()))
+
+        return '\n'.join(rows)
+
+
+def timed(stats: Optional[AsmStats], name: str) -> ContextManager:
+    return stats.stage(name) if stats is not None else __NO_STATS
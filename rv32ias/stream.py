@@ -0,0 +1,158 @@
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from rv32ias.assembler import assemble_instruction
+from rv32ias.exceptions import AsmInvalidSyntaxError
+from rv32ias.exceptions import AsmOutOfRangeError
+from rv32ias.exceptions import AsmUndefinedLabelError
+from rv32ias.models import AsmLine
+from rv32ias.models import AsmLineType
+from rv32ias.models import Instruction
+from rv32ias.lexer import tokenize_line
+from rv32ias.preprocessor import asm_line_from_token
+from rv32ias.preprocessor import build_err_ctx
+from rv32ias.preprocessor import parse_instruction
+from rv32ias.preprocessor import parse_label
+from rv32ias.relax import expand_li
+from rv32ias.relax import offset_fits
+from rv32ias.relax import split_imm
+
+__all__ = [
+    'AsmStreamParser',
+    'iter_ordered',
+]
+
+
+# Single pass assembler: every fed line returns the (address, word) pairs it
+# resolved. References to labels not yet seen wait in a fixup table until the
+# label shows up, so memory is bound by labels and pending fixups.
+# Sizes are settled as lines are fed, so nothing is relaxed: branches out of
+# reach are errors, `call` is always a jal and `la` always lui + addi.
+# Directives are errors too.
+class AsmStreamParser:
+    def __init__(self):
+        self.__im_ptr = 0
+        self.__line_idx = 0
+
+        # Last few lines, kept only to give errors some context
+        self.__window: deque[AsmLine] = deque(maxlen=3)
+
+        self.__jump_targets: Dict[str, int] = {}
+        # Fixups patch either a pc relative offset, or the 'hi' / 'lo' part of an absolute address
+        self.__fixups: Dict[str, List[Tuple[int, Instruction, AsmLine, tuple, Optional[str]]]] = {}
+
+    def __build_err_ctx(self, raw_i: int, span: tuple = None, note='') -> tuple:
+        line = next(line for line in self.__window if line.idx == raw_i)
+        return build_err_ctx(line, self.__window, span, note)
+
+    def feed(self, line: str) -> List[Tuple[int, int]]:
+        line = line.rstrip('\r\n')
+        token = tokenize_line(line)
+
+        asm_line = asm_line_from_token(self.__line_idx, line, token, self.__im_ptr)
+        self.__window.append(asm_line)
+        self.__line_idx += 1
+
+        if asm_line.type == AsmLineType.LABEL:
+            label = parse_label(asm_line.idx, asm_line.body, self.__jump_targets, self.__build_err_ctx)
+            self.__jump_targets[label] = asm_line.im_ptr
+
+            return [
+                (im_ptr, assemble_instruction(self.__resolve(instruction, im_ptr, asm_line.im_ptr, part, line, span)))
+                for im_ptr, instruction, line, span, part in self.__fixups.pop(label, ())
+            ]
+
+        # ! Raise when directive, sections are only laid out once the whole source is known
+        if asm_line.type == AsmLineType.DIRECTIVE:
+            note = 'Directives not supported when streaming'
+            raise AsmInvalidSyntaxError(*self.__build_err_ctx(asm_line.idx, (0, len(asm_line.body)), note))
+
+        if asm_line.type != AsmLineType.INSTRUCTION:
+            return []
+
+        args_offset = token.args - token.body if token.args >= 0 else 0
+        inst, args_dict, label, label_span = parse_instruction(
+            asm_line.idx, asm_line.body, args_offset, self.__build_err_ctx
+        )
+
+        # Handle pseudo-instructions with more than one form
+        idx = asm_line.idx
+        if inst == 'li':
+            rows = [
+                (Instruction(i, name, **args), None)
+                for i, name, args in expand_li(idx, args_dict['rd'], args_dict['rd_num'], args_dict['imm'])
+            ]
+        elif inst == 'la':
+            rows = [
+                (Instruction(idx, 'lui', **args_dict), 'hi'),
+                (Instruction(idx, 'addi', rs1=args_dict['rd'], rs1_num=args_dict['rd_num'], **args_dict), 'lo'),
+            ]
+        elif inst == 'call':
+            rows = [(Instruction(idx, 'jal', rd='ra', rd_num=1), None)]
+        else:
+            rows = [(Instruction(idx, inst, **args_dict), None)]
+
+        im_ptr = self.__im_ptr
+        self.__im_ptr += 4 * len(rows)
+
+        words = []
+        for j, (instruction, part) in enumerate(rows):
+            if label is not None:
+                if label not in self.__jump_targets:
+                    fixup = (im_ptr + 4 * j, instruction, asm_line, label_span, part)
+                    self.__fixups.setdefault(label, []).append(fixup)
+                    continue
+
+                self.__resolve(instruction, im_ptr + 4 * j, self.__jump_targets[label], part, asm_line, label_span)
+
+            words.append((im_ptr + 4 * j, assemble_instruction(instruction)))
+
+        return words
+
+    @staticmethod
+    def __resolve(instruction: Instruction, im_ptr: int, target: int, part: Optional[str], line: AsmLine,
+                  span: tuple) -> Instruction:
+        if part is not None:
+            instruction.imm = split_imm(target)[part == 'lo']
+            return instruction
+
+        instruction.imm = target - im_ptr
+
+        # ! Raise when the target is out of reach, there is no relaxing in a single pass
+        if not offset_fits(instruction.inst, instruction.imm):
+            raise AsmOutOfRangeError(*build_err_ctx(line, [line], span, 'Jump target out of range'))
+
+        return instruction
+
+    def close(self) -> None:
+        if not self.__fixups:
+            return
+
+        # ! Raise for the earliest reference to a label that never showed up
+        _, _, line, span, _ = min((f for fs in self.__fixups.values() for f in fs), key=lambda f: f[0])
+        raise AsmUndefinedLabelError(*build_err_ctx(line, [line], span, 'Undefined label'))
+
+    @property
+    def jump_table(self) -> Dict[str, int]:
+        return self.__jump_targets
+
+    @property
+    def pending(self) -> int:
+        return sum(len(fs) for fs in self.__fixups.values())
+
+    @property
+    def size(self) -> int:
+        return self.__im_ptr
+
+
+def iter_ordered(words: Iterable[Tuple[int, int]]) -> Iterator[int]:
+    # Hold back words only while an earlier address is still waiting on a fixup
+    pending: Dict[int, int] = {}
+    next_addr = 0
+
+    for addr, word in words:
+        pending[addr] = word
+
+        while next_addr in pending:
+            yield pending.pop(next_addr)
+            next_addr += 4
@@ -0,0 +1,126 @@
+import importlib.util
+import random
+
+import pytest
+
+from rv32ias.assembler import BATCH_THRESHOLD
+from rv32ias.assembler import assemble_columns
+from rv32ias.assembler import assemble_instruction
+from rv32ias.assembler import assemble_instructions
+from rv32ias.assembler import columnize_instructions
+from rv32ias.exceptions import AsmInvalidRegisterError
+from rv32ias.exceptions import AsmInvalidSyntaxError
+from rv32ias.isa import InstType
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.lexer import Token
+from rv32ias.lexer import shift_token
+from rv32ias.lexer import tokenize
+from rv32ias.lexer import tokenize_line
+from rv32ias.models import AsmLineType
+from rv32ias.models import Instruction
+from rv32ias.preprocessor import AsmParser
+
+needs_numpy = pytest.mark.skipif(importlib.util.find_spec('numpy') is None, reason='numpy is not installed')
+
+REGS = [f'x{i}' for i in range(32)]
+
+
+def random_instruction(inst: str, rng: random.Random) -> Instruction:
+    inst_type = rv32i_inst_dict[inst].inst_type
+    rd, rs1, rs2 = (rng.choice(REGS) for _ in range(3))
+
+    match inst_type:
+        case InstType.R_:
+            return Instruction(0, inst, rd=rd, rs1=rs1, rs2=rs2)
+        case InstType.I_:
+            # Shifts are given immediates wider than their shamt too, the encoders must agree on the mask
+            return Instruction(0, inst, rd=rd, rs1=rs1, imm=rng.randint(-2048, 4095))
+        case InstType.S_:
+            return Instruction(0, inst, rs1=rs1, rs2=rs2, imm=rng.randint(-2048, 2047))
+        case InstType.B_:
+            return Instruction(0, inst, rs1=rs1, rs2=rs2, imm=2 * rng.randint(-2048, 2047))
+        case InstType.U_:
+            return Instruction(0, inst, rd=rd, imm=rng.randint(0, 0xFFFFF))
+        case InstType.J_:
+            return Instruction(0, inst, rd=rd, imm=2 * rng.randint(-(1 << 19), (1 << 19) - 1))
+
+
+@needs_numpy
+@pytest.mark.parametrize('inst', list(rv32i_inst_dict))
+def test_batch_matches_scalar(inst):
+    rng = random.Random(inst)
+    instructions = [random_instruction(inst, rng) for _ in range(BATCH_THRESHOLD)]
+
+    scalar = [assemble_instruction(instruction) for instruction in instructions]
+    assert assemble_columns(*columnize_instructions(instructions)).tolist() == scalar
+    assert assemble_instructions(instructions) == scalar
+
+
+@needs_numpy
+@pytest.mark.parametrize('inst', ['slli', 'srli', 'srai'])
+def test_program_batch_matches_scalar(inst):
+    # Long enough for the columnar path over the parsed program, each line alone takes the scalar one
+    lines = [f'{inst} s1, sp, {shamt}' for shamt in range(0, 4096, 8)]
+    assert len(lines) >= BATCH_THRESHOLD
+
+    words = AsmParser('\n'.join(lines) + '\n').machine_codes.tolist()
+    assert words == [AsmParser(line + '\n').machine_codes[0] for line in lines]
+
+
+LEXER_SOURCE = 'start:\n\taddi  a0, a0, 1   # bump\r\n\n   # only a comment\n.data\n    .word 1, 2\nnop\n  ret  \n'
+
+
+def test_token_kinds_and_spans():
+    tokens = list(tokenize(LEXER_SOURCE))
+
+    # (type, body, arguments, comment) as text, one token per line including the empty one after the last break
+    assert [(
+        t.type,
+        LEXER_SOURCE[t.body:t.body_end],
+        LEXER_SOURCE[t.args:t.body_end] if t.args >= 0 else None,
+        LEXER_SOURCE[t.tc:t.tc_end] if t.tc >= 0 else None,
+    ) for t in tokens] == [
+        (AsmLineType.LABEL, 'start:', None, None),
+        (AsmLineType.INSTRUCTION, 'addi  a0, a0, 1', 'a0, a0, 1', '# bump'),
+        (AsmLineType.EMPTY, '', None, None),
+        (AsmLineType.COMMENT, '# only a comment', None, None),
+        (AsmLineType.DIRECTIVE, '.data', None, None),
+        (AsmLineType.DIRECTIVE, '.word 1, 2', '1, 2', None),
+        (AsmLineType.INSTRUCTION, 'nop', None, None),
+        (AsmLineType.INSTRUCTION, 'ret', None, None),
+        (AsmLineType.EMPTY, '', None, None),
+    ]
+    # Lines span up to their break, the \r of CRLF included
+    assert [LEXER_SOURCE[t.start:t.end] for t in tokens] == LEXER_SOURCE.split('\n')
+
+
+def test_tokenize_line_matches_tokenize():
+    tokens = list(tokenize(LEXER_SOURCE))
+    offsets = [t.start for t in tokens]
+
+    for line, offset, token in zip(LEXER_SOURCE.split('\n'), offsets, tokens):
+        assert shift_token(tokenize_line(line), offset) == token
+
+
+def test_shift_token_keeps_missing_spans():
+    token = shift_token(Token(AsmLineType.INSTRUCTION, 0, 3, 0, 3), 10)
+
+    assert token == Token(AsmLineType.INSTRUCTION, 10, 13, 10, 13, -1, -1, -1)
+
+
+@pytest.mark.parametrize('source, error, span, note', [
+    ('addi x1, x1\n', AsmInvalidSyntaxError, (5, 6), 'Invalid instruction arguments'),
+    ('add a0 a1 a2\n', AsmInvalidSyntaxError, (4, 8), 'Invalid instruction arguments'),
+    ('addi x1,x1,1 extra\n', AsmInvalidSyntaxError, (5, 13), 'Invalid instruction arguments'),
+    ('  sw a0, a1  # store\n', AsmInvalidSyntaxError, (3, 6), 'Invalid instruction arguments'),
+    ('addi x1, x1, 0xZZ\n', AsmInvalidSyntaxError, (13, 4), 'Invalid immediate value'),
+    ('\taddi x1, q9, 1\n', AsmInvalidRegisterError, (9, 2), 'Invalid register'),
+    ('lw a0, 4(q1)\n', AsmInvalidRegisterError, (9, 2), 'Invalid register'),
+    ('addi\n', AsmInvalidSyntaxError, None, 'Incomplete instruction'),
+])
+def test_malformed_operands(source, error, span, note):
+    # Spans are (offset, length) in the line without its indentation
+    with pytest.raises(error) as e:
+        AsmParser(source)
+
+    assert (e.value.span, e.value.note) == (span, note)
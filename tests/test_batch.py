@@ -0,0 +1,45 @@
+import pytest
+
+from rv32ias import batch
+from rv32ias.batch import assemble_batch
+from rv32ias.pipeline import assemble
+
+SOURCE = 'start:\n    addi  a0, a0, {}\n    j     start\n'
+
+
+def write_sources(tmp_path, names):
+    files = []
+    for i, name in enumerate(names):
+        path = tmp_path / name
+        path.write_text(SOURCE.format(i))
+        files.append(str(path))
+    return files
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_bad_file_among_good_ones(tmp_path, jobs):
+    files = write_sources(tmp_path, ['a.s', 'b.s', 'c.s', 'd.s'])
+    (tmp_path / 'b.s').write_bytes(b'\xff\xfe addi a0, a0, 1\n')
+    (tmp_path / 'd.s').write_text('    bogus a0\n')
+
+    results = assemble_batch(files, str(tmp_path / 'out'), jobs=jobs)
+
+    assert [r.asm_file for r in results] == files
+    assert [r.error is None for r in results] == [True, False, True, False]
+    assert (tmp_path / 'out' / 'c.hex').read_text().split() == ['00250513', 'FFDFF06F']
+
+
+def test_unexpected_error_stays_with_its_file(tmp_path, monkeypatch):
+    files = write_sources(tmp_path, ['a.s', 'b.s', 'c.s'])
+
+    def failing_assemble(asm_txt, *args, **kwargs):
+        if 'a0, 1' in asm_txt:
+            raise ValueError('unexpected')
+        return assemble(asm_txt, *args, **kwargs)
+
+    monkeypatch.setattr(batch, 'assemble', failing_assemble)
+    results = assemble_batch(files, str(tmp_path / 'out'))
+
+    assert results[1].error == 'Error occurred while assembling:\n -> ValueError: unexpected'
+    assert results[0].error is None and results[2].error is None
+    assert results[2].instructions == 2
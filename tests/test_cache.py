@@ -0,0 +1,126 @@
+import os
+from dataclasses import replace
+
+import pytest
+
+import rv32ias
+from rv32ias import cache as cache_module
+from rv32ias.cache import AsmCache
+from rv32ias.isa import rv32i_inst_dict
+from rv32ias.pipeline import assemble
+from rv32ias.stats import AsmStats
+
+SOURCE = 'start:\n    addi  a0, a0, 1\n    j     start\n'
+
+
+def entry_files(cache_dir) -> list:
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.bin'))
+
+
+def test_hit(tmp_path):
+    cold, warm = AsmStats(), AsmStats()
+
+    words = assemble(SOURCE, str(tmp_path), cold)
+    assert assemble(SOURCE, str(tmp_path), warm) == words
+
+    assert cold.counters.get('cache.misses') == 1 and 'cache.hits' not in cold.counters
+    assert warm.counters.get('cache.hits') == 1 and 'cache.misses' not in warm.counters
+
+
+def test_entry_round_trip(tmp_path):
+    cache = AsmCache(str(tmp_path))
+    cache.put('k', [1, 2, 0xFFFFFFFF], {'start': 0, 'end': 8})
+
+    words, jump_table = cache.get('k')
+
+    assert words.tolist() == [1, 2, 0xFFFFFFFF]
+    assert jump_table == {'start': 0, 'end': 8}
+    assert cache.get('missing') is None
+
+
+def test_key_covers_version(monkeypatch):
+    key = AsmCache.key(SOURCE)
+    monkeypatch.setattr(rv32ias, '__version__', rv32ias.__version__ + '.dev')
+
+    assert AsmCache.key(SOURCE) != key
+
+
+def test_key_covers_isa(monkeypatch):
+    key = AsmCache.key(SOURCE)
+    monkeypatch.setitem(rv32i_inst_dict, 'addi', replace(rv32i_inst_dict['addi'], funct3=0b111))
+    cache_module.isa_fingerprint.cache_clear()
+
+    try:
+        assert AsmCache.key(SOURCE) != key
+    finally:
+        monkeypatch.undo()
+        cache_module.isa_fingerprint.cache_clear()
+
+    assert AsmCache.key(SOURCE) == key
+
+
+@pytest.mark.parametrize('source, name', [
+    ('.include "inc.s"\n', 'inc.s'),
+    ('.data\nblob:\n.incbin "blob.bin"\n', 'blob.bin'),
+    ('.include "data.s"\n', 'blob.bin'),
+])
+def test_key_covers_dependencies(tmp_path, source, name):
+    (tmp_path / 'inc.s').write_text('nop\n')
+    (tmp_path / 'data.s').write_text('.data\nblob:\n.incbin "blob.bin"\n')
+    (tmp_path / 'blob.bin').write_bytes(b'\0' * 8)
+    key = AsmCache.key(source, str(tmp_path))
+
+    assert AsmCache.key(source, str(tmp_path)) == key
+
+    (tmp_path / name).write_bytes(b'nop\nnop\n\0\0\0\0')
+    assert AsmCache.key(source, str(tmp_path)) != key
+
+    (tmp_path / name).unlink()
+    assert AsmCache.key(source, str(tmp_path)) != key
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda data: b'',
+    lambda data: data[:10],
+    lambda data: data[:-1],
+    lambda data: data[:-6],
+    lambda data: data + b'\0',
+    lambda data: b'NOTCACHE' + data[8:],
+    lambda data: data[:-5] + b'\xff\xfe\xfd\xfc\xfb',
+])
+def test_corrupt_entry_is_a_miss(tmp_path, corrupt):
+    words = assemble(SOURCE, str(tmp_path))
+    path = tmp_path / entry_files(tmp_path)[0]
+    path.write_bytes(corrupt(path.read_bytes()))
+
+    stats = AsmStats()
+    assert assemble(SOURCE, str(tmp_path), stats) == words
+    assert stats.counters.get('cache.misses') == 1
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = AsmCache(str(tmp_path), max_size=750)
+    for i in range(4):
+        cache.put(f'k{i}', [i] * 40, {})
+        os.utime(tmp_path / f'k{i}.bin', (i, i))
+
+    # Entries take 180 bytes, reading one makes it the most recently used
+    assert cache.get('k0') is not None
+    cache.put('k4', [4] * 40, {})
+
+    assert entry_files(tmp_path) == ['k0.bin', 'k2.bin', 'k3.bin', 'k4.bin']
+    assert sum(os.path.getsize(tmp_path / name) for name in entry_files(tmp_path)) <= 750
+
+
+def test_put_scans_only_past_the_limit(tmp_path, monkeypatch):
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scans.append(path) or scandir(path))
+
+    cache = AsmCache(str(tmp_path), max_size=1 << 20)
+    for i in range(50):
+        cache.put(f'k{i}', [i] * 40, {})
+    AsmCache(str(tmp_path), max_size=1 << 20).put('again', [1], {})
+
+    assert len(scans) <= 1
+    assert len(entry_files(tmp_path)) == 51
@@ -0,0 +1,57 @@
+import sys
+
+import pytest
+
+from rv32ias.__main__ import main
+
+SOURCE = """start:
+    addi  a0, a0, 1
+    beq   a0, a1, done
+    jal   ra, start
+done:
+    sw    a0, 8(sp)
+"""
+
+
+def run_cli(monkeypatch, *argv: str) -> int:
+    monkeypatch.setattr(sys, 'argv', ['rv32ias', *argv])
+    return main()
+
+
+@pytest.mark.parametrize('options', [[], ['--binary'], ['--format', 'hex'], ['--format', 'binary']])
+def test_stream_matches_normal_output(monkeypatch, tmp_path, options):
+    asm_file = tmp_path / 'prog.s'
+    asm_file.write_text(SOURCE)
+
+    assert run_cli(monkeypatch, str(asm_file), '-o', str(tmp_path / 'normal.out'), *options) == 0
+    assert run_cli(monkeypatch, str(asm_file), '-o', str(tmp_path / 'stream.out'), '--stream', *options) == 0
+    assert (tmp_path / 'stream.out').read_bytes() == (tmp_path / 'normal.out').read_bytes()
+
+
+def test_stream_to_stdout_matches_normal_output(monkeypatch, tmp_path, capfd):
+    asm_file = tmp_path / 'prog.s'
+    asm_file.write_text(SOURCE)
+
+    assert run_cli(monkeypatch, str(asm_file), '--format', 'binary') == 0
+    normal = capfd.readouterr().out
+    assert run_cli(monkeypatch, str(asm_file), '--format', 'binary', '--stream') == 0
+    assert capfd.readouterr().out == normal
+    assert normal.splitlines()[0] == f'{0x00150513:032b}'
+
+
+@pytest.mark.parametrize('options', [[], ['--link']])
+def test_negative_jobs(monkeypatch, capfd, tmp_path, options):
+    asm_file = tmp_path / 'prog.s'
+    asm_file.write_text(SOURCE)
+
+    assert run_cli(monkeypatch, str(asm_file), str(asm_file), '-j', '-1', *options) == 1
+    assert capfd.readouterr().out == 'Error: --jobs must be at least 0\n'
+
+
+@pytest.mark.parametrize('options', [
+    ['--optimize'], ['--schedule'], ['--link'], ['--disassemble'], ['--simulate'], ['--max-errors', '3'],
+    ['--all-errors'], ['--jobs', '4'],
+])
+def test_serve_rejects_options_it_ignores(monkeypatch, capfd, options):
+    assert run_cli(monkeypatch, '--serve', *options) == 1
+    assert capfd.readouterr().out.startswith('Error: --serve cannot be used with')
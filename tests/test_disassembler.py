@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from rv32ias.disassembler import decode_word
+from rv32ias.disassembler import disassemble
+from rv32ias.disassembler import round_trip
+from rv32ias.pipeline import assemble
+
+SOURCE = """start:
+    addi  a0, zero, 10
+loop:
+    lw    t0, 0(sp)
+    slli  t1, t0, 3
+    srai  t2, t1, 31
+    sw    t2, -4(sp)
+    addi  a0, a0, -1
+    bne   a0, zero, loop
+    lui   s1, 0x12345
+    jal   ra, start
+    jalr  zero, 0(ra)
+"""
+
+
+def test_round_trip():
+    assert round_trip(SOURCE) == []
+
+
+def test_round_trip_with_data():
+    source = SOURCE + """    .word 0xFFFFFFFF, 0x12345678
+tail:
+    beq   a0, a1, tail
+.data
+table:
+    .word 1, 2, 3
+"""
+    assert round_trip(source) == []
+
+
+def test_undecodable_words_stay_in_place():
+    words = [0x00150513, 0xFFFFFFFF, 0x00000000, 0x00150513]
+    source = disassemble(words)
+
+    assert '.word 0xFFFFFFFF' in source
+    assert list(assemble(source)) == words
+
+
+@pytest.mark.parametrize('word', [
+    0x0020006F,  # jal zero, +2: off the word grid
+    0x7FFFF06F,  # jal zero, far past the image
+    0xFE000EE3,  # beq zero, zero, -4 from the first word: in front of the image
+])
+def test_unreachable_targets_get_no_label(word):
+    words = [word, 0x00150513]
+    source = disassemble(words)
+
+    assert 'L_' not in source
+    assert list(assemble(source)) == words
+
+
+def test_random_words_assemble_back():
+    rng = random.Random(0)
+    words = [rng.getrandbits(32) for _ in range(2000)]
+    # Most random words are no instruction, the decodable ones are kept as they were too
+    assert any(decode_word(word) is not None for word in words)
+
+    assert list(assemble(disassemble(words))) == words
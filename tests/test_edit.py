@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from rv32ias.exceptions import AsmParseError
+from rv32ias.preprocessor import AsmParser
+
+REGS = ('t0', 't1', 'a0', 'a1', 's1')
+
+
+def random_line(rng: random.Random, labels: list, pseudo: bool = True) -> str:
+    roll = rng.random()
+    if roll < 0.5:
+        return f'addi  {rng.choice(REGS)}, {rng.choice(REGS)}, {rng.randint(-50, 50)}'
+    if roll < 0.6:
+        return f'add   {rng.choice(REGS)}, {rng.choice(REGS)}, {rng.choice(REGS)}'
+    if roll < 0.8:
+        return f'bne   {rng.choice(REGS)}, {rng.choice(REGS)}, {rng.choice(labels)}'
+    if roll < 0.85 or not pseudo:
+        return f'jal   ra, {rng.choice(labels)}'
+    if roll < 0.9:
+        return f'li    {rng.choice(REGS)}, {rng.randint(-10 ** 9, 10 ** 9)}'
+    if roll < 0.95:
+        return f'la    {rng.choice(REGS)}, {rng.choice(labels)}'
+    return f'call  {rng.choice(labels)}'
+
+
+def random_source(rng: random.Random, labels: list, size: int) -> str:
+    lines = []
+    for label in labels:
+        lines.append(f'{label}:')
+        lines += [random_line(rng, labels) for _ in range(rng.randint(size // 2, size))]
+    return '\n'.join(lines)
+
+
+def assert_same_as_fresh(asm_parser: AsmParser, old_words: list, changed: tuple):
+    fresh = AsmParser(asm_parser.program.source)
+
+    assert list(asm_parser.instructions) == list(fresh.instructions)
+    assert asm_parser.jump_table == fresh.jump_table
+
+    words = list(fresh.machine_codes)
+    assert list(asm_parser.machine_codes) == words
+
+    # Every word that changed lies in the reported span
+    diffs = [4 * k for k in range(max(len(words), len(old_words)))
+             if (old_words[k] if k < len(old_words) else None) != (words[k] if k < len(words) else None)]
+    if diffs:
+        assert changed[0] <= diffs[0] and diffs[-1] + 4 <= max(changed)
+
+
+@pytest.mark.parametrize('seed, blocks, size, edits', [(0, 30, 8, 150), (1, 12, 200, 60)])
+def test_edits_match_fresh_parse(seed, blocks, size, edits):
+    # With blocks of up to 200 instructions branches reach past 4 KiB and the layout is relaxed
+    rng = random.Random(seed)
+    labels = [f'L{i}' for i in range(blocks)]
+    asm_parser = AsmParser(random_source(rng, labels, size))
+
+    for _ in range(edits):
+        n = len(asm_parser.program.line_starts)
+        a = rng.randint(0, n)
+        b = rng.randint(a, min(n, a + 3))
+        text = '\n'.join(random_line(rng, labels, rng.random() < 0.2) for _ in range(rng.randint(0, 4)))
+
+        old_words, old_source = list(asm_parser.machine_codes), asm_parser.program.source
+        try:
+            changed = asm_parser.apply_edit((a, b), text)
+        except AsmParseError:
+            # A failing edit leaves the parser as it was
+            assert asm_parser.program.source == old_source
+            assert list(asm_parser.machine_codes) == old_words
+            continue
+
+        assert_same_as_fresh(asm_parser, old_words, changed)
+
+
+def test_edit_after_pseudo_instruction_stays_incremental(monkeypatch):
+    source = 'li t0, 123456789\nstart:\n' + 'addi t1, t1, 1\n' * 1000 + 'bne t0, t1, start\n'
+    asm_parser = AsmParser(source)
+    old_words = list(asm_parser.machine_codes)
+
+    def reparse(*_):
+        raise AssertionError('edit was parsed again from scratch')
+
+    monkeypatch.setattr(AsmParser, '_AsmParser__reparse', reparse)
+    changed = asm_parser.apply_edit((500, 501), 'addi t2, t2, 2\nxori t2, t2, 3')
+
+    assert_same_as_fresh(asm_parser, old_words, changed)
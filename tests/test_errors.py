@@ -0,0 +1,42 @@
+import pytest
+
+from rv32ias.exceptions import AsmDuplicateLabelError
+from rv32ias.exceptions import AsmInvalidInstructionError
+from rv32ias.exceptions import AsmParseError
+from rv32ias.preprocessor import AsmParser
+
+# Parse errors on lines 1 to 4, a duplicate label found by the earlier jump table pass on line 6
+SOURCE = """bogus t0
+bogus t1
+bogus t2
+bogus t3
+loop:
+loop:
+    addi t0, t0, 1
+"""
+
+
+def test_first_error_raises():
+    with pytest.raises(AsmParseError):
+        AsmParser(SOURCE)
+
+
+def test_collect_every_error():
+    diagnostics = AsmParser(SOURCE, collect_errors=True).diagnostics
+
+    assert [d.line for d in diagnostics] == [1, 2, 3, 4, 6]
+    assert {d.error for d in diagnostics} == {AsmInvalidInstructionError, AsmDuplicateLabelError}
+
+
+@pytest.mark.parametrize('max_errors, lines', [(1, [1]), (2, [1, 2]), (5, [1, 2, 3, 4, 6]), (9, [1, 2, 3, 4, 6])])
+def test_max_errors_keeps_the_first_lines(max_errors, lines):
+    diagnostics = AsmParser(SOURCE, collect_errors=True, max_errors=max_errors).diagnostics
+
+    assert [d.line for d in diagnostics] == lines
+
+
+def test_diagnostic_renders_like_the_error():
+    diagnostic = AsmParser(SOURCE, collect_errors=True).diagnostics[0]
+
+    assert isinstance(diagnostic.to_error(), AsmParseError)
+    assert 'bogus' in str(diagnostic)
@@ -0,0 +1,74 @@
+import pytest
+
+from rv32ias.exceptions import AsmInvalidRegisterError
+from rv32ias.preprocessor import AsmParser
+
+MACROS = """.macro bump r, v
+    addi \\r, \\r, \\v
+.endm
+"""
+
+
+def parse(tmp_path, source: str, **kwargs) -> AsmParser:
+    return AsmParser(source, base_dir=str(tmp_path), **kwargs)
+
+
+def test_include_error_points_at_included_file(tmp_path):
+    (tmp_path / 'inc.s').write_text('nop\nnop\naddi x1, q9, 1\n')
+
+    with pytest.raises(AsmInvalidRegisterError) as e:
+        parse(tmp_path, 'nop\n.include "inc.s"\nnop\n')
+
+    assert e.value.source == str(tmp_path / 'inc.s')
+    assert e.value.line == 3
+    assert e.value.span == (9, 2)
+
+
+def test_nested_include_error(tmp_path):
+    (tmp_path / 'outer.s').write_text('nop\n.include "inner.s"\n')
+    (tmp_path / 'inner.s').write_text('addi x1, x1, 1\nadd x1, x2, bad\n')
+
+    with pytest.raises(AsmInvalidRegisterError) as e:
+        parse(tmp_path, '.include "outer.s"\nnop\n')
+
+    assert e.value.source == str(tmp_path / 'inner.s')
+    assert e.value.line == 2
+
+
+def test_macro_error_points_at_parameter_reference(tmp_path):
+    source = MACROS + '    bump a0, 1\n    bump a9, 5\n'
+
+    with pytest.raises(AsmInvalidRegisterError) as e:
+        parse(tmp_path, source)
+
+    # The body line of the macro, with the span on `\r`
+    assert e.value.source is None
+    assert e.value.line == 2
+    assert e.value.span == (5, 2)
+
+
+def test_macro_from_include_error(tmp_path):
+    (tmp_path / 'macros.s').write_text(MACROS)
+
+    with pytest.raises(AsmInvalidRegisterError) as e:
+        parse(tmp_path, '.include "macros.s"\n    bump a9, 5\n')
+
+    assert e.value.source == str(tmp_path / 'macros.s')
+    assert e.value.line == 2
+
+
+def test_collected_errors_keep_their_files(tmp_path):
+    (tmp_path / 'inc.s').write_text('nop\naddi x1, q9, 1\n')
+    source = 'add x1, x2, bad\n.include "inc.s"\n' + MACROS + '    bump a9, 5\n'
+
+    diagnostics = parse(tmp_path, source, collect_errors=True).diagnostics
+
+    assert [(d.source, d.line) for d in diagnostics] == [(None, 1), (None, 4), (str(tmp_path / 'inc.s'), 2)]
+
+
+def test_expanded_code_matches_plain_source(tmp_path):
+    (tmp_path / 'macros.s').write_text(MACROS)
+    expanded = parse(tmp_path, '.include "macros.s"\nstart:\n    bump a0, 1\n    bump t1, -7\n    j start\n')
+    plain = AsmParser('start:\n    addi a0, a0, 1\n    addi t1, t1, -7\n    j start\n')
+
+    assert expanded.machine_codes.tolist() == plain.machine_codes.tolist()
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from rv32ias.disassembler import load_image
+from rv32ias.formats import OUTPUT_FORMATS
+
+rng = random.Random(0)
+WORDS = [0x00000013, 0xFFFFFFFF, 0x80000000] + [rng.getrandbits(32) for _ in range(61)]
+
+
+@pytest.mark.parametrize('fmt', ['hex', 'binary', 'raw', 'readmemh', 'readmemb', 'elf'])
+@pytest.mark.parametrize('count', [1, len(WORDS)])
+def test_round_trip(fmt, count):
+    words, base = load_image(OUTPUT_FORMATS[fmt].encode(WORDS[:count]))
+
+    assert words.tolist() == WORDS[:count]
+    assert base == 0
+
+
+@pytest.mark.parametrize('fmt', ['readmemh', 'readmemb', 'elf'])
+def test_round_trip_keeps_base(fmt):
+    words, base = load_image(OUTPUT_FORMATS[fmt].encode(WORDS, 0x80001000))
+
+    assert words.tolist() == WORDS
+    assert base == 0x80001000
+
+
+def parse_ihex(data: bytes) -> dict:
+    memory = {}
+    segment = 0
+    lines = data.decode().splitlines()
+
+    for line in lines:
+        assert line.startswith(':')
+        record = bytes.fromhex(line[1:])
+        assert sum(record) & 0xFF == 0
+        assert record[0] == len(record) - 5
+
+        addr, record_type, payload = int.from_bytes(record[1:3], 'big'), record[3], record[4:-1]
+        if record_type == 0x04:
+            segment = int.from_bytes(payload, 'big') << 16
+        elif record_type == 0x00:
+            for i, byte in enumerate(payload):
+                memory[segment + addr + i] = byte
+
+    assert lines[-1] == ':00000001FF'
+    return memory
+
+
+@pytest.mark.parametrize('base', [0, 0xFFF0, 0x80000000])
+def test_ihex_records(base):
+    memory = parse_ihex(OUTPUT_FORMATS['ihex'].encode(WORDS, base))
+    data = b''.join(w.to_bytes(4, 'little') for w in WORDS)
+
+    assert memory == {base + i: byte for i, byte in enumerate(data)}
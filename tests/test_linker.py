@@ -0,0 +1,170 @@
+from dataclasses import replace
+
+import pytest
+
+from rv32ias.exceptions import AsmLinkError
+from rv32ias.linker import build_units
+from rv32ias.linker import link
+from rv32ias.linker import object_path
+from rv32ias.objfile import ObjectSection
+from rv32ias.objfile import Relocation
+from rv32ias.objfile import pack_unit
+from rv32ias.objfile import unpack_unit
+from rv32ias.preprocessor import AsmParser
+from rv32ias.simulator import HaltReason
+from rv32ias.simulator import Simulator
+
+MAIN = """main:
+    la    a0, table
+    lw    a1, 0(a0)
+    call  add_one
+    mv    a0, a1
+    la    a2, main
+end:
+    j     end
+"""
+
+UTIL = """.globl add_one, table
+add_one:
+    addi  a1, a1, 1
+    ret
+.data
+table:
+    .word 41
+"""
+
+
+def unit(source: str, name: str):
+    return AsmParser(source, unit=True).object_unit(name)
+
+
+def write_units(tmp_path, *sources: str):
+    files = []
+    for i, source in enumerate(sources):
+        path = tmp_path / f'unit{i}.s'
+        path.write_text(source)
+        files.append(str(path))
+    return files
+
+
+def test_link_matches_single_source():
+    linked = link([unit(MAIN, 'main.s'), unit(UTIL, 'util.s')])
+
+    single = Simulator(AsmParser(MAIN + UTIL).machine_codes)
+    sim = Simulator(linked.words)
+
+    # `la` of a local text label keeps both words in a unit, addresses differ but not the results
+    assert linked.symbols == {'add_one': 32, 'table': 40}
+    assert sim.run(1000) == single.run(1000) == HaltReason.SELF_LOOP
+    assert sim.reg('a0') == single.reg('a0') == 42
+    assert sim.reg('a2') == single.reg('a2') == 0
+
+
+def test_link_relocates_later_units():
+    # The same unit linked second has every local and relocated address moved past the first one
+    linked = link([unit(UTIL, 'util.s'), unit(MAIN, 'main.s')])
+
+    assert linked.symbols == {'add_one': 0, 'table': 40}
+
+    start = Simulator(linked.words)
+    start.pc = 8
+    assert start.run(1000) == HaltReason.SELF_LOOP
+    assert start.reg('a0') == 42
+    assert start.reg('a2') == 8
+
+
+def test_build_units_reuses_objects(tmp_path):
+    files = write_units(tmp_path, MAIN, UTIL)
+    obj_dir = str(tmp_path / 'obj')
+
+    first = build_units(files, obj_dir)
+    second = build_units(files, obj_dir, jobs=2)
+
+    assert [r.rebuilt for r in first] == [True, True]
+    assert [r.rebuilt for r in second] == [False, False]
+    assert link([r.unit for r in second]).words == link([r.unit for r in first]).words
+
+
+def test_object_round_trip():
+    for source, name in ((MAIN, 'main.s'), (UTIL, 'util.s')):
+        assert unpack_unit(pack_unit(unit(source, name))) == unit(source, name)
+
+
+@pytest.mark.parametrize('damage', [
+    lambda u: replace(u, symbols={**u.symbols, 'main': (1, 0)}),
+    lambda u: replace(u, symbols={**u.symbols, 'end': (0, 100)}),
+    lambda u: replace(u, relocations=u.relocations + [Relocation(2, 0, 0, 'add_one', 1)]),
+    lambda u: replace(u, relocations=u.relocations + [Relocation(0, 32, 0, 'add_one', 1)]),
+    lambda u: replace(u, relocations=u.relocations + [Relocation(0, 0, 9, 'add_one', 1)]),
+    lambda u: replace(u, sections=[ObjectSection('.text', 3, 32, u.sections[0].data)]),
+    lambda u: replace(u, sections=[ObjectSection('.text', 4, 32, b'\0' * 8)]),
+])
+def test_inconsistent_object_is_rejected(tmp_path, damage):
+    assert unpack_unit(pack_unit(damage(unit(MAIN, 'main.s')))) is None
+
+    # And rebuilt from its source rather than failing the link
+    files = write_units(tmp_path, MAIN, UTIL)
+    obj_dir = str(tmp_path / 'obj')
+    damaged = pack_unit(damage(build_units(files, obj_dir)[0].unit))
+    with open(object_path(files[0], obj_dir), 'wb') as f:
+        f.write(damaged)
+
+    results = build_units(files, obj_dir)
+    assert [r.rebuilt for r in results] == [True, False]
+    assert link([r.unit for r in results]).symbols == {'add_one': 32, 'table': 40}
+
+
+def test_build_units_reports_errors(tmp_path):
+    files = write_units(tmp_path, MAIN, 'bogus a0\n')
+
+    results = build_units(files)
+
+    assert results[0].error is None
+    assert results[1].unit is None and 'bogus' in results[1].error
+
+
+def test_unexpected_error_stays_with_its_unit(tmp_path, monkeypatch):
+    files = write_units(tmp_path, MAIN, UTIL)
+    object_unit = AsmParser.object_unit
+
+    def failing_object_unit(self, name, *args):
+        if name == files[0]:
+            raise ValueError('unexpected')
+        return object_unit(self, name, *args)
+
+    monkeypatch.setattr(AsmParser, 'object_unit', failing_object_unit)
+    results = build_units(files)
+
+    assert results[0].error == 'Error occurred while assembling:\n -> ValueError: unexpected'
+    assert results[1].error is None and results[1].unit.exports == ['add_one', 'table']
+
+
+def test_undefined_label():
+    with pytest.raises(AsmLinkError, match='Undefined label `table`') as e:
+        link([unit(MAIN, 'main.s')])
+
+    assert e.value.unit == 'main.s'
+    assert e.value.line == 2
+
+
+def test_label_not_exported():
+    with pytest.raises(AsmLinkError, match='Undefined label `add_one`'):
+        link([unit(MAIN, 'main.s'), unit(UTIL.replace('.globl add_one, table', '.globl table'), 'util.s')])
+
+
+def test_duplicate_export():
+    with pytest.raises(AsmLinkError, match='also exported by util.s') as e:
+        link([unit(MAIN, 'main.s'), unit(UTIL, 'util.s'), unit(UTIL, 'copy.s')])
+
+    assert e.value.unit == 'copy.s'
+
+
+def test_branch_out_of_range():
+    # Branches to another unit are not relaxed, 1100 words put the target past 4 KiB
+    far = '.globl far\n' + '    nop\n' * 1100 + 'far:\n    ret\n'
+
+    with pytest.raises(AsmLinkError, match='Label `far` out of range') as e:
+        link([unit('    beq a0, zero, far\n', 'main.s'), unit(far, 'far.s')])
+
+    assert e.value.line == 1
+    link([unit('    call far\n', 'main.s'), unit(far, 'far.s')])
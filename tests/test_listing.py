@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+from rv32ias import listing
+from rv32ias.listing import iter_listing
+from rv32ias.listing import write_listing
+from rv32ias.preprocessor import AsmParser
+
+SOURCE = """start:
+    li    a0, 0x12345678   # two words
+    la    a1, table
+    lw    a2, 0(a1)
+end:
+    j     end
+.data
+table:
+    .word 7, 9
+"""
+
+
+def rows(text: str) -> list:
+    # (address, label, hex, bin, assembly) of every row below the header
+    return [tuple(cell.strip() for cell in row.split('|')) for row in text.splitlines()[2:]]
+
+
+def test_plain_listing():
+    asm_parser = AsmParser(SOURCE)
+    words = asm_parser.machine_codes.tolist()
+
+    assert rows(''.join(iter_listing(asm_parser))) == [
+        ('+00000000', 'start', '12345537', f'{words[0]:032b}', 'li    a0, 0x12345678'),
+        ('+00000004', '', '67850513', f'{words[1]:032b}', ''),
+        ('+00000008', '', '000005B7', f'{words[2]:032b}', 'la    a1, table'),
+        ('+0000000C', '', '01858593', f'{words[3]:032b}', ''),
+        ('+00000010', '', '0005A603', f'{words[4]:032b}', 'lw    a2, 0(a1)'),
+        ('+00000014', 'end', '0000006F', f'{words[5]:032b}', 'j     end'),
+    ]
+    # Data words are in the image but not in the instruction listing
+    assert words[6:] == [7, 9]
+
+
+def test_full_listing_keeps_every_source_line():
+    asm_parser = AsmParser(SOURCE)
+    listed = rows(''.join(iter_listing(asm_parser, 'full')))
+
+    # Every source line once, in order, with the extra words of a line right after it
+    assert [row[4] for row in listed if row[4]] == [line.strip() for line in SOURCE.splitlines() if line]
+    assert [row[0] for row in listed] == [
+        '*', '+00000000', '+00000004', '+00000008', '+0000000C', '+00000010', '*', '+00000014', '*', '*', '*', '*',
+    ]
+    assert listed[10] == ('*', '', '*', '*', '.word 7, 9')
+
+
+@pytest.mark.parametrize('pretty', [None, 'full', 'rainbow'])
+def test_write_listing_matches_rows(monkeypatch, pretty):
+    # Chunks far smaller than the listing, so rows cross chunk boundaries
+    monkeypatch.setattr(listing, 'CHUNK_LINES', 3)
+    asm_parser = AsmParser(''.join(f'    addi t0, t0, {i}\n' for i in range(20)) + SOURCE)
+    out = io.StringIO()
+
+    written = write_listing(asm_parser, out, pretty)
+
+    assert out.getvalue() == ''.join(iter_listing(asm_parser, pretty))
+    assert written == len(out.getvalue())
@@ -0,0 +1,34 @@
+import pytest
+
+from rv32ias.preprocessor import AsmParser
+from tests.test_schedule import DATA
+from tests.test_schedule import random_source
+from tests.test_schedule import run
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_optimize_keeps_behavior(seed):
+    source = random_source(seed)
+    before = run(AsmParser(source).machine_codes)
+
+    asm_parser = AsmParser(source)
+    report = asm_parser.optimize()
+    after = run(asm_parser.machine_codes)
+
+    assert len(asm_parser.machine_codes) == report.instructions - report.removed
+    assert after.regs == before.regs
+    assert after.memory[DATA] == before.memory[DATA]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_optimize_then_schedule_keeps_behavior(seed):
+    source = random_source(seed)
+    before = run(AsmParser(source).machine_codes)
+
+    asm_parser = AsmParser(source)
+    asm_parser.optimize()
+    asm_parser.schedule()
+    after = run(asm_parser.machine_codes)
+
+    assert after.regs == before.regs
+    assert after.memory[DATA] == before.memory[DATA]
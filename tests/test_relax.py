@@ -0,0 +1,80 @@
+import random
+from typing import Tuple
+
+import pytest
+
+from rv32ias.exceptions import AsmOutOfRangeError
+from rv32ias.preprocessor import AsmParser
+from rv32ias.simulator import HaltReason
+from rv32ias.simulator import Simulator
+
+
+@pytest.mark.parametrize('value', [99999999999, 1 << 32, -(1 << 31) - 1])
+def test_li_out_of_range(value):
+    with pytest.raises(AsmOutOfRangeError):
+        AsmParser(f'li x1, {value}\n')
+
+
+@pytest.mark.parametrize('value, words', [
+    (-(1 << 31), [0x800000B7]),
+    (0xFFFFFFFF, [0x000000B7, 0xFFF08093]),
+    (2047, [0x7FF00093]),
+])
+def test_li_in_range(value, words):
+    assert AsmParser(f'li x1, {value}\n').machine_codes.tolist() == words
+
+
+def relaxed_chain(seed: int) -> Tuple[str, int]:
+    # Blocks visited in a random order through branches and jumps, some too far apart for the short forms
+    rng = random.Random(seed)
+    count = rng.randint(5, 30)
+    order = list(range(count))
+    rng.shuffle(order)
+    after = {block: f'L{next_block}' for block, next_block in zip(order, order[1:])}
+    after[order[-1]] = 'end'
+
+    lines = [f'    beq   zero, zero, L{order[0]}']
+    for block in range(count):
+        lines += [f'L{block}:', '    addi  a0, a0, 1']
+        if rng.random() < 0.3:
+            lines.append(f'    la    a2, L{rng.randrange(count)}')
+        lines += ['    nop'] * rng.choice([0, 3, 500, 1100])
+        lines.append(rng.choice([
+            f'    beq   zero, zero, {after[block]}',
+            f'    bge   a0, zero, {after[block]}',
+            f'    j     {after[block]}',
+            f'    call  {after[block]}',
+        ]))
+    lines += ['end:', '    j     end']
+    return '\n'.join(lines) + '\n', count
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_relaxed_branches_reach_their_targets(seed):
+    source, count = relaxed_chain(seed)
+    asm_parser = AsmParser(source)
+    sim = Simulator(asm_parser.machine_codes, memory_size=1 << 22)
+
+    assert sim.run(10 ** 6) == HaltReason.SELF_LOOP
+    assert sim.reg('a0') == count
+
+
+@pytest.mark.parametrize('nops, words', [(1000, 1), (1030, 2)])
+def test_far_branch_grows(nops, words):
+    # `beq` reaches 4 KiB ahead, past that it becomes `bne` over a `jal`
+    asm_parser = AsmParser('    beq   a0, a1, far\n' + '    nop\n' * nops + 'far:\n    j     far\n')
+
+    assert len(asm_parser.machine_codes) == words + nops + 1
+    sim = Simulator(asm_parser.machine_codes)
+    assert sim.run(10 ** 4) == HaltReason.SELF_LOOP
+    assert sim.pc == (words + nops) * 4
+
+
+def test_la_value():
+    asm_parser = AsmParser('    la    a0, here\n    nop\nhere:\n    la    a1, data\nend:\n    j     end\n.data\ndata:\n'
+                           '    .word 1\n')
+    sim = Simulator(asm_parser.machine_codes)
+
+    assert sim.run(100) == HaltReason.SELF_LOOP
+    assert sim.reg('a0') == asm_parser.jump_table['here']
+    assert sim.reg('a1') == asm_parser.jump_table['data']
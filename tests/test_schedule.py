@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from rv32ias.preprocessor import AsmParser
+from rv32ias.simulator import HaltReason
+from rv32ias.simulator import Simulator
+
+REGS = ('t0', 't1', 't2', 'a0', 'a1', 'a2', 'a3', 's1')
+# Stores and loads go through s0, at the start of this memory range
+DATA = slice(0x10000, 0x10040)
+
+
+def random_source(seed: int) -> str:
+    # Loops of straight-line blocks with the redundancies `optimize` removes and the loads `schedule` moves
+    rng = random.Random(seed)
+    lines = ['    lui   s0, 0x10', '    addi  s2, zero, 3']
+
+    for b in range(rng.randint(1, 5)):
+        lines.append(f'B{b}:')
+        for _ in range(rng.randint(2, 14)):
+            rd, rs1, rs2 = (rng.choice(REGS) for _ in range(3))
+            roll = rng.random()
+            if roll < 0.2:
+                lines.append(f'    lw    {rd}, {4 * rng.randrange(8)}(s0)')
+            elif roll < 0.3:
+                lines.append(f'    sw    {rs1}, {4 * rng.randrange(8)}(s0)')
+            elif roll < 0.35:
+                lines.append(f'    lbu   {rd}, {rng.randrange(32)}(s0)')
+            elif roll < 0.4:
+                lines.append(f'    li    {rd}, {rng.randint(-100000, 100000)}')
+            elif roll < 0.5:
+                lines.append(f'    add   {rd}, {rs1}, {rs2}')
+            elif roll < 0.55:
+                lines.append(f'    addi  {rd}, {rd}, 0')
+            elif roll < 0.6:
+                lines.append(f'    {rng.choice(["add", "or", "xor", "sll", "sra"])}   {rd}, {rd}, zero')
+            elif roll < 0.65:
+                lines += [f'    mv    {rd}, {rs1}', f'    mv    {rs1}, {rd}']
+            elif roll < 0.7:
+                lines += [f'    slli  {rd}, {rs1}, 3'] * 2 if rd != rs1 else ['    nop']
+            elif roll < 0.75:
+                lines.append(f'    add   zero, {rs1}, {rs2}')
+            elif roll < 0.8:
+                lines += [f'    j     S{len(lines)}', f'    addi  {rd}, {rd}, 7', f'S{len(lines)}:']
+            else:
+                lines.append(f'    addi  {rd}, {rs1}, {rng.randint(-50, 50)}')
+        if rng.random() < 0.5:
+            lines += ['    addi  s2, s2, -1', f'    blt   zero, s2, B{rng.randrange(b + 1)}']
+
+    lines += ['end:', '    j     end', '    addi  t0, t0, 1']
+    return '\n'.join(lines) + '\n'
+
+
+def run(words) -> Simulator:
+    sim = Simulator(words)
+    assert sim.run(100000) == HaltReason.SELF_LOOP
+    return sim
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_schedule_keeps_behavior(seed):
+    source = random_source(seed)
+    words = AsmParser(source).machine_codes.tolist()
+    before = run(words)
+
+    asm_parser = AsmParser(source)
+    report = asm_parser.schedule()
+    after = run(asm_parser.machine_codes)
+
+    # Only reordered within blocks
+    assert sorted(asm_parser.machine_codes.tolist()) == sorted(words)
+    assert report.stalls_after <= report.stalls_before
+    assert after.regs == before.regs
+    assert after.memory[DATA] == before.memory[DATA]
@@ -0,0 +1,58 @@
+import pytest
+
+from rv32ias.exceptions import AsmInvalidSyntaxError
+from rv32ias.preprocessor import AsmParser
+
+
+def test_data_follows_text():
+    asm_parser = AsmParser("""start:
+    la    a0, table
+    lw    a1, 0(a0)
+    j     start
+.data
+table:
+    .word 1, 2, start
+""")
+
+    # la of a data label always takes lui and addi
+    assert asm_parser.jump_table == {'start': 0, 'table': 16}
+    assert asm_parser.machine_codes.tolist()[4:] == [1, 2, 0]
+
+
+@pytest.mark.parametrize('source, line', [
+    ('.data\nv: .word 5\n', 2),
+    ('.data\n    v:  .byte 1, 2\n', 2),
+    ('start:\nx: addi a0, a0, 1\n', 2),
+])
+def test_label_sharing_a_line(source, line):
+    with pytest.raises(AsmInvalidSyntaxError) as e:
+        AsmParser(source)
+
+    assert e.value.line == line
+    assert e.value.note == 'Label must be on a line of its own'
+
+
+def test_label_sharing_a_line_is_reported_once():
+    diagnostics = AsmParser('.data\nv: .word 5\n    add a0, a0, a1\n', collect_errors=True).diagnostics
+
+    assert [(d.line, d.note) for d in diagnostics] == [
+        (2, 'Label must be on a line of its own'), (3, 'Instruction outside .text'),
+    ]
+
+
+@pytest.mark.parametrize('directive, size', [
+    ('.space 1024', 1024),
+    ('.zero 300', 300),
+    ('.align 10', 1020),
+    ('.incbin "blob.bin"', 3 << 20),
+])
+def test_large_text_directive(tmp_path, directive, size):
+    (tmp_path / 'blob.bin').write_bytes(bytes(range(256)) * (3 << 12))
+    source = f'    addi  x1, x0, 1\n{directive}\nafter:\n    addi  x1, x0, 2\n'
+
+    asm_parser = AsmParser(source, base_dir=str(tmp_path))
+    words = asm_parser.machine_codes.tolist()
+
+    assert asm_parser.jump_table['after'] == 4 + size
+    assert len(words) == (4 + size + 4 + 3) // 4
+    assert words[0] == 0x00100093 and words[-1] == 0x00200093
@@ -0,0 +1,107 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from rv32ias import server
+from rv32ias.client import AsmClient
+from rv32ias.server import encode_message
+from rv32ias.server import handle_request
+from rv32ias.server import read_message
+
+
+def request(**message) -> dict:
+    return handle_request(json.dumps(message).encode())
+
+
+def test_assembles_source():
+    assert request(id=1, source='addi a0, a0, 1\n') == {'id': 1, 'ok': True, 'words': [0x00150513]}
+
+
+def test_reports_errors_in_line_order():
+    response = request(id=2, source='bogus\nloop:\nloop:\nbogus\n', max_errors=2, context=True)
+
+    assert not response['ok']
+    assert [e['line'] for e in response['errors']] == [1, 3]
+    assert all('context' in e for e in response['errors'])
+
+
+@pytest.mark.parametrize('payload', [
+    b'not json', b'{"id": 3}', b'{"source": 5}', b'{"source": "", "max_errors": 0}', b'{"source": "", "base_dir": 1}',
+])
+def test_bad_requests(payload):
+    response = handle_request(payload)
+
+    assert not response['ok'] and response['error'].startswith('Bad request')
+
+
+def test_includes_resolve_against_base_dir(tmp_path, monkeypatch):
+    (tmp_path / 'inc.s').write_text('addi a0, a0, 1\n')
+    (tmp_path / 'blob.bin').write_bytes(b'\x2a\0\0\0')
+    source = '.include "inc.s"\n.data\nblob:\n.incbin "blob.bin"\n'
+
+    assert request(id=5, source=source, base_dir=str(tmp_path))['words'] == [0x00150513, 42]
+
+    # Without it, paths are relative to the directory the server runs in
+    assert not request(id=6, source=source)['ok']
+    monkeypatch.chdir(tmp_path)
+    assert request(id=7, source=source)['words'] == [0x00150513, 42]
+
+
+def test_include_errors_resolve_against_base_dir(tmp_path):
+    (tmp_path / 'inc.s').write_text('nop\nbogus a0\n')
+
+    response = request(id=8, source='.include "inc.s"\n', base_dir=str(tmp_path))
+
+    assert response['errors'][0]['source'] == str(tmp_path / 'inc.s')
+    assert response['errors'][0]['line'] == 2
+
+
+def test_failure_while_collecting_errors_is_answered(monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('collect mode broke')
+
+    monkeypatch.setattr(server, 'AsmParser', broken)
+    response = request(id=4, source='bogus\n')
+
+    assert response == {'id': 4, 'ok': False, 'error': "Internal error: RuntimeError('collect mode broke')"}
+
+
+def test_large_request_does_not_block_other_clients(tmp_path):
+    socket_path = str(tmp_path / 'rv32ias.sock')
+    process = subprocess.Popen([sys.executable, '-m', 'rv32ias', '--serve', '--socket', socket_path],
+                               stderr=subprocess.DEVNULL)
+    try:
+        # The socket file exists from bind(), connections are refused until the server listens on it
+        big = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                big.connect(socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                assert time.monotonic() < deadline and process.poll() is None
+                time.sleep(0.02)
+
+        # The large request goes out first and is still being assembled when the small one is answered
+        big.sendall(encode_message({'id': 'big', 'source': 'addi t0, t0, 1\n' * 150000}))
+
+        time.sleep(0.1)
+        with AsmClient(socket_path) as client:
+            assert client.assemble('addi a0, a0, 1\n')['words'] == [0x00150513]
+
+        big.settimeout(0.01)
+        with pytest.raises(TimeoutError):
+            big.recv(1)
+
+        big.settimeout(60)
+        with big.makefile('rb') as rfile:
+            response = json.loads(read_message(rfile))
+        assert response['ok'] and len(response['words']) == 150000
+        big.close()
+    finally:
+        process.terminate()
+        process.wait(10)
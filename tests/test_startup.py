@@ -0,0 +1,65 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+SNIPPET = 'main:\n    addi t0, zero, 1\n    beq  t0, zero, main\n'
+
+PROBE = '''
+import sys
+sys.argv = ['rv32ias', *sys.argv[1:]]
+from rv32ias.__main__ import main
+main()
+print(' '.join(sorted(sys.modules)), file=sys.stderr)
+'''
+
+# Import time on top of a bare interpreter start, in seconds. Several times the 30 to 40 ms the import takes so
+# loaded machines pass, the module checks below catch smaller regressions
+IMPORT_BUDGET = 0.25
+
+# Modules each costs more to import than assembling the snippet, or belongs to another mode
+HEAVY_MODULES = {
+    'numpy', 'concurrent.futures', 'multiprocessing', 'asyncio', 'json', 'hashlib', 'glob',
+    'rv32ias.batch', 'rv32ias.cache', 'rv32ias.disassembler', 'rv32ias.expand', 'rv32ias.image',
+    'rv32ias.linker', 'rv32ias.listing', 'rv32ias.optimize', 'rv32ias.schedule', 'rv32ias.server',
+    'rv32ias.simulator', 'rv32ias.stream',
+}
+
+
+def imported_modules(*argv: str) -> set:
+    probe = subprocess.run(
+        [sys.executable, '-c', PROBE, *argv], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True
+    )
+    return set(probe.stderr.split())
+
+
+@pytest.mark.parametrize('options, needed', [
+    ([], set()),
+    (['--format', 'binary'], set()),
+    (['--verbose'], {'rv32ias.listing'}),
+    (['--stream'], {'rv32ias.stream'}),
+])
+def test_small_run_imports_only_its_mode(tmp_path, options, needed):
+    asm_file = tmp_path / 'snippet.asm'
+    asm_file.write_text(SNIPPET)
+
+    modules = imported_modules(str(asm_file), *options)
+
+    assert needed <= modules
+    assert not (HEAVY_MODULES - needed) & modules
+
+
+def best_wall_time(code: str, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_import_within_budget():
+    overhead = best_wall_time('import rv32ias.__main__') - best_wall_time('pass')
+
+    assert overhead < IMPORT_BUDGET, f'importing rv32ias.__main__ took {overhead * 1000:.0f} ms'
@@ -0,0 +1,77 @@
+import json
+import sys
+
+from rv32ias.__main__ import main
+from rv32ias.preprocessor import AsmParser
+from rv32ias.stats import AsmStats
+
+SOURCE = """start:
+    addi a0, a0, 1
+    li   a1, 0x12345678
+    sw   a0, 0(sp)
+    beq  a0, a1, start
+end:
+    j    end
+.data
+table:
+    .word 1, 2
+# comment
+
+"""
+
+
+def test_parser_counters():
+    stats = AsmStats()
+    AsmParser(SOURCE, stats=stats).machine_codes
+
+    # Instructions are counted per encoded word, li takes lui and addi
+    assert stats.counters == {
+        'lines.label': 3, 'lines.instruction': 5, 'lines.directive': 2, 'lines.comment': 1, 'lines.empty': 2,
+        'instructions.I': 2, 'instructions.U': 1, 'instructions.S': 1, 'instructions.B': 1, 'instructions.J': 1,
+        'labels': 3, 'errors': 0,
+    }
+    assert {'analysis', 'jump_table', 'parse', 'encode'} <= set(stats.timings)
+    assert all(seconds >= 0 for seconds in stats.timings.values())
+
+
+def test_stage_callback_and_accumulation():
+    calls = []
+    stats = AsmStats(lambda name, seconds: calls.append(name))
+
+    for _ in range(3):
+        with stats.stage('parse'):
+            pass
+    stats.count('labels', 2)
+    stats.count('labels')
+
+    assert calls == ['parse'] * 3
+    assert list(stats.timings) == ['parse']
+    assert stats.counters == {'labels': 3}
+
+
+def test_cli_stats_json(monkeypatch, capfd, tmp_path):
+    asm_file = tmp_path / 'prog.s'
+    asm_file.write_text(SOURCE)
+    monkeypatch.setattr(sys, 'argv', ['rv32ias', str(asm_file), '-o', str(tmp_path / 'prog.hex'), '--stats', 'json'])
+
+    assert main() == 0
+    report = json.loads(capfd.readouterr().err)
+
+    assert {'load', 'analysis', 'jump_table', 'parse', 'encode', 'output'} <= set(report['timings'])
+    assert report['counters']['bytes_read'] == len(SOURCE)
+    assert report['counters']['bytes_written'] == (tmp_path / 'prog.hex').stat().st_size
+    assert report['counters']['labels'] == 3
+    assert report['counters']['instructions.I'] == 2
+
+
+def test_cli_stats_table(monkeypatch, capfd, tmp_path):
+    asm_file = tmp_path / 'prog.s'
+    asm_file.write_text(SOURCE)
+    monkeypatch.setattr(sys, 'argv', ['rv32ias', str(asm_file), '--stats'])
+
+    assert main() == 0
+    err = capfd.readouterr().err.splitlines()
+
+    assert err[0].split() == ['Stage', 'ms', 'share']
+    assert {row.split()[0] for row in err[1:err.index('')]} >= {'load', 'parse', 'encode', 'output', 'total'}
+    assert 'labels 3' in [' '.join(row.split()) for row in err]